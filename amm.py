@@ -0,0 +1,101 @@
+from fractions import Fraction
+from math import isqrt
+
+# exact integer versions of the pair math in clsp/swap.clsp, clsp/add_liquidity.clsp and
+# clsp/remove_liquidity.clsp - floor division everywhere, just like the puzzle's divmod
+# all amounts are in mojos
+
+# 1000 - FEE, where FEE = 7 (0.7% kept as LP fee); curried into the swap puzzle
+INVERSE_FEE = 993
+
+# https://github.com/Uniswap/v1-contracts/blob/master/contracts/uniswap_exchange.vy#L106
+# output amount received for input_amount (what the swap puzzle computes)
+def get_input_price(input_amount, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    input_amount_with_fee = input_amount * inverse_fee
+    numerator = input_amount_with_fee * output_reserve
+    denominator = (input_reserve * 1000) + input_amount_with_fee
+    return numerator // denominator
+
+
+# https://github.com/Uniswap/v1-contracts/blob/master/contracts/uniswap_exchange.vy#L119
+# input amount that gets (at least) output_amount out
+def get_output_price(output_amount, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    if output_amount >= output_reserve:
+        raise ValueError("output amount must be lower than the output reserve")
+
+    numerator = input_reserve * output_amount * 1000
+    denominator = (output_reserve - output_amount) * inverse_fee
+    return numerator // denominator + 1
+
+
+# https://docs.mimo.finance/the-formulas#price-impact
+def get_price_impact(output_amount, output_reserve):
+    return 1 - (output_reserve - output_amount) ** 2 / output_reserve ** 2
+
+
+# largest output amount whose price impact is at most price_impact (closed form of get_price_impact)
+#   (output_reserve - output_amount) ** 2 >= (1 - price_impact) * output_reserve ** 2
+def get_max_output_for_price_impact(price_impact, output_reserve):
+    target = output_reserve ** 2 * (1 - Fraction(price_impact))
+    min_remaining = isqrt(target.numerator // target.denominator)
+    if min_remaining ** 2 < target:
+        min_remaining += 1
+    return max(output_reserve - min_remaining, 0)
+
+
+# liquidity tokens minted for depositing token_amount (and get_deposit_xch_amount XCH)
+def get_liquidity_to_mint(token_amount, liquidity, token_reserve):
+    if liquidity == 0:
+        return token_amount
+    return token_amount * liquidity // token_reserve
+
+
+# XCH that has to be deposited alongside token_amount; None for the first deposit (any amount)
+def get_deposit_xch_amount(token_amount, xch_reserve, token_reserve):
+    if token_reserve == 0:
+        return None
+    return xch_reserve * token_amount // token_reserve
+
+
+# returns (xch amount, token amount) received for burning liquidity_amount liquidity tokens
+def get_removed_amounts(liquidity_amount, liquidity, xch_reserve, token_reserve):
+    return (
+        xch_reserve * liquidity_amount // liquidity,
+        token_reserve * liquidity_amount // liquidity
+    )
+
+
+# batch variants - the same reserves for many amounts (e.g., depth curves)
+def get_input_prices(input_amounts, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    reserve_term = input_reserve * 1000
+    prices = []
+    for input_amount in input_amounts:
+        input_amount_with_fee = input_amount * inverse_fee
+        prices.append(input_amount_with_fee * output_reserve // (reserve_term + input_amount_with_fee))
+    return prices
+
+
+def get_output_prices(output_amounts, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    return [get_output_price(output_amount, input_reserve, output_reserve, inverse_fee) for output_amount in output_amounts]
+
+
+# returns [(input amount, output amount, price impact)] for every input amount
+def get_depth_curve(input_amounts, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    output_amounts = get_input_prices(input_amounts, input_reserve, output_reserve, inverse_fee)
+    return [
+        (input_amount, output_amount, get_price_impact(output_amount, output_reserve))
+        for input_amount, output_amount in zip(input_amounts, output_amounts)
+    ]
+
+
+# returns [(price impact, input amount, output amount)]: for every price impact breakpoint, the biggest
+# trade that stays within it (input amount is what has to be offered to get output amount)
+def get_depth_table(price_impacts, input_reserve, output_reserve, inverse_fee=INVERSE_FEE):
+    table = []
+    for price_impact in price_impacts:
+        output_amount = get_max_output_for_price_impact(price_impact, output_reserve)
+        input_amount = 0
+        if output_amount > 0:
+            input_amount = get_output_price(output_amount, input_reserve, output_reserve, inverse_fee)
+        table.append((price_impact, input_amount, output_amount))
+    return table
@@ -1,30 +1,36 @@
 # main.py
 # special thanks to GPT-4
-from fastapi import FastAPI, Depends, HTTPException, Body
+from fastapi import FastAPI, Depends, HTTPException, Body, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from fastapi import Query
 from typing import List
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
 from typing import Optional
-from cachetools import cached, TTLCache
 
 from sentry_sdk import capture_exception, capture_message
 import sentry_sdk
 
+import aiohttp
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import models, schemas
 import os
 import sys
 import time
 import json
 import traceback
-import requests
 
 from tibet_lib import *
+from amm import get_depth_table, get_input_price, get_output_price, get_price_impact
+from batch_rpc import get_coin_records_by_names
+from response_cache import ResponseCache, RESPONSE_CACHE_SIZE
+from pair_index import PairIndex, PAIR_INDEX_SORT_KEYS
+from fee_estimator import FeeEstimator
 
 DATABASE_URL = "sqlite:///./database.db"
 
@@ -47,7 +53,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-cache = TTLCache(maxsize=100, ttl=3)
+# read endpoints are served from memory until the pairs / tokens / router they show change
+response_cache = ResponseCache(int(os.environ.get("RESPONSE_CACHE_SIZE", RESPONSE_CACHE_SIZE)))
+# sorted in-memory copy of all pairs backing /pairs and /quotes
+pair_index = PairIndex()
+QUOTE_BATCH_MAX_SIZE = int(os.environ.get("QUOTE_BATCH_MAX_SIZE", "1000"))
+DEFAULT_DEPTH_PRICE_IMPACTS = [0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25]
+DEPTH_MAX_PRICE_IMPACTS = 50
 
 leaflet_url = None
 taildatabase_tail_info_url = None
@@ -60,64 +72,200 @@ except KeyError as e:
     sys.exit(1)
 
 full_node_client = None
+mempool_index = MempoolIndex()
+MEMPOOL_REFRESH_INTERVAL = float(os.environ.get("MEMPOOL_REFRESH_INTERVAL", "2"))
+mempool_indexer_task = None
+# fed by mempool_indexer; answers fee estimates without asking the node
+fee_estimator = FeeEstimator()
+
+# new tokens are stored with placeholder metadata that token_metadata_filler replaces in the background
+PLACEHOLDER_TOKEN_SHORT_NAME = "???"
+PLACEHOLDER_TOKEN_IMAGE_URL = "https://bafybeigzcazxeu7epmm4vtkuadrvysv74lbzzbl2evphtae6k57yhgynp4.ipfs.dweb.link/9098.gif"
+TOKEN_METADATA_CONCURRENCY = int(os.environ.get("TOKEN_METADATA_CONCURRENCY", "8"))
+TOKEN_METADATA_REFRESH_INTERVAL = float(os.environ.get("TOKEN_METADATA_REFRESH_INTERVAL", "300"))
+token_metadata_needed = asyncio.Event()
+token_metadata_filler_task = None
+
+# shared pooled client for third-party HTTP APIs (tail database, dexie)
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "50"))
+HTTP_POOL_SIZE_PER_HOST = int(os.environ.get("HTTP_POOL_SIZE_PER_HOST", "10"))
+http_session = None
+
+# successful offers are submitted to dexie in the background
+DEXIE_QUEUE_SIZE = int(os.environ.get("DEXIE_QUEUE_SIZE", "1000"))
+DEXIE_MAX_RETRIES = int(os.environ.get("DEXIE_MAX_RETRIES", "5"))
+DEXIE_RETRY_BACKOFF = float(os.environ.get("DEXIE_RETRY_BACKOFF", "1")) # seconds; doubled after each retry
+dexie_queue = asyncio.Queue(maxsize=DEXIE_QUEUE_SIZE)
+dexie_submitter_task = None
+
+# optionally run every offer's final spend bundle locally before pushing it (see dry_run_spend_bundle)
+OFFER_DRY_RUN = os.environ.get("OFFER_DRY_RUN", "false").lower() in ["1", "true", "yes"]
+dry_run_stats = {
+    "runs": 0,
+    "rejected": 0,
+    "total_time": 0.0, # seconds
+    "max_time": 0.0,
+    "last_cost": None,
+    "max_cost": 0,
+}
 
 # Add these two global variables
 last_check_router_update_call = datetime.now() - timedelta(minutes=1)
 router_instance = None
 last_pair_update = {}
+pairs_with_mempool_state = set() # pairs whose stored state includes unconfirmed spends
+pair_mempool_tx_ids = {} # launcher id -> id of the mempool tx spending the pair's coin when it was last synced
+
+# background pair refresher - keeps pair states fresh so read endpoints never sync
+PAIR_REFRESH_CONCURRENCY = int(os.environ.get("PAIR_REFRESH_CONCURRENCY", "8"))
+PAIR_REFRESH_INTERVAL = float(os.environ.get("PAIR_REFRESH_INTERVAL", "5"))
+# pairs are advanced from new blocks; a full per-pair sync only runs every PAIR_FULL_REFRESH_INTERVAL
+# seconds (or when the follower falls too far behind / sees a reorg) to reconcile the snapshot
+PAIR_FULL_REFRESH_INTERVAL = float(os.environ.get("PAIR_FULL_REFRESH_INTERVAL", "300"))
+CHAIN_FOLLOWER_MAX_GAP = int(os.environ.get("CHAIN_FOLLOWER_MAX_GAP", "64"))
+pair_refresher_task = None
+pair_refresher_started_at = None
+last_full_pair_refresh = None
+followed_height = None
+followed_header_hash = None # header hash of the block at followed_height (reorg detection)
+
+full_node_client_lock = asyncio.Lock()
+
+def get_http_session():
+    global http_session
+
+    if http_session is None:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, limit_per_host=HTTP_POOL_SIZE_PER_HOST),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return http_session
+
 
 async def get_client():
     global full_node_client
     
-    if full_node_client is None:
-        full_node_client = await get_full_node_client("~/.chia/mainnet", leaflet_url)
+    # background tasks and requests can ask for the client concurrently - only create one
+    async with full_node_client_lock:
+        if full_node_client is None:
+            full_node_client = await get_full_node_client("~/.chia/mainnet", leaflet_url)
     return full_node_client
 
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: readers don't block the writer (the pair refresher) and vice versa
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 models.Base.metadata.create_all(bind=engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# objects stay readable after their session is closed - handlers only get detached copies
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# all database work runs on this pool so it never blocks the event loop
+DB_THREADS = int(os.environ.get("DB_THREADS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+lineage_store = LineageStore(os.environ.get("LINEAGE_DB_PATH", LINEAGE_DB_PATH), db_executor)
+
+async def run_db(fn, *args):
+    def run():
+        with SessionLocal() as db:
+            return fn(db, *args)
+
+    return await asyncio.get_running_loop().run_in_executor(db_executor, run)
+
+# params: the query parameters the endpoint declares (after parsing) - anything else the client sends
+# is ignored, so made-up parameters can't create new cache entries
+async def cached_response(request: Request, tags: List[str], compute, params: dict = {}) -> Response:
+    key = request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+    entry = response_cache.get(key)
+    if entry is None:
+        # compute can add response headers (e.g., pagination cursors) to the dict it's given
+        generation = response_cache.generation
+        headers = {}
+        body = json.dumps(jsonable_encoder(await compute(headers))).encode()
+        entry = response_cache.put(key, body, tags, generation, headers)
+
+    body, etag, headers = entry
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return Response(content=body, media_type="application/json", headers={**headers, "ETag": etag})
 
-def get_db():
-    db = SessionLocal()
-    init_router(db)
-    try:
-        yield db
-    finally:
-        db.close()
 
-@cached(cache)
 @app.get("/tokens", response_model=List[schemas.Token])
-def get_tokens(db: Session = Depends(get_db)):
-    return db.query(models.Token).all()
+async def get_tokens(request: Request):
+    async def compute(headers):
+        tokens = await run_db(lambda db: db.query(models.Token).all())
+        return [schemas.Token.from_orm(token) for token in tokens]
+
+    return await cached_response(request, ["tokens"], compute)
 
 
-@cached(cache)
+# pass the X-Next-Cursor response header as cursor to get the next page
 @app.get("/pairs", response_model=List[schemas.Pair])
-async def read_pairs(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    pairs = await get_all_pairs(db)
-    return pairs[skip : skip + limit]
+async def read_pairs(
+    request: Request,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    sort_by: str = "xch_reserve",
+    asset_id_prefix: Optional[str] = None
+):
+    if sort_by not in PAIR_INDEX_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {PAIR_INDEX_SORT_KEYS}")
+
+    async def compute(headers):
+        try:
+            pairs, next_cursor = pair_index.page(sort_by, limit, cursor, asset_id_prefix, skip)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+        return pairs
+
+    if sort_by == "volume":
+        # volume also changes as trades leave the window, which invalidates nothing - never cached
+        headers = {}
+        body = json.dumps(jsonable_encoder(await compute(headers))).encode()
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    return await cached_response(request, ["pairs"], compute, {
+        "skip": skip, "limit": limit, "cursor": cursor, "sort_by": sort_by, "asset_id_prefix": asset_id_prefix
+    })
 
 
-@cached(cache)
 @app.get("/token/{asset_id}", response_model=schemas.Token)
-def get_token(asset_id: str, db: Session = Depends(get_db)):
-    token = db.query(models.Token).get(asset_id)
-    if token is None:
-        raise HTTPException(status_code=404, detail="Token not found")
-    return token
+async def get_token(request: Request, asset_id: str):
+    async def compute(headers):
+        token = await run_db(lambda db: db.query(models.Token).get(asset_id))
+        if token is None:
+            raise HTTPException(status_code=404, detail="Token not found")
+        return schemas.Token.from_orm(token)
+
+    return await cached_response(request, ["tokens"], compute)
 
-@cached(cache)
 @app.get("/pair/{launcher_id}", response_model=schemas.Pair)
-async def read_pair(launcher_id: str, db: Session = Depends(get_db)):
-    pair = await get_pair(db, launcher_id)
-    if pair is None:
-        raise HTTPException(status_code=404, detail="Pair not found")
-    return pair
+async def read_pair(request: Request, launcher_id: str):
+    async def compute(headers):
+        pair = await get_pair(launcher_id)
+        if pair is None:
+            raise HTTPException(status_code=404, detail="Pair not found")
+        return schemas.Pair.from_orm(pair)
+
+    return await cached_response(request, [f"pair:{launcher_id}"], compute)
 
-@cached(cache)
 @app.get("/router", response_model=schemas.Router, summary="Get Router", description="Fetch the current Router object.")
-async def get_router(db: Session = Depends(get_db)):
-    return await get_router()
+async def get_router_endpoint(request: Request):
+    async def compute(headers):
+        return schemas.Router.from_orm(await get_router())
+
+    return await cached_response(request, ["router"], compute)
 
 
 def init_router(db: Session):
@@ -139,8 +287,7 @@ def init_router(db: Session):
     return router
 
 
-async def check_router_update(db):
-    router = db.query(models.Router).first()
+async def check_router_update(router):
     if router is None:
         return None
     
@@ -158,6 +305,56 @@ async def check_router_update(db):
         return None
 
 
+# pairs: array of (tail_hash.hex(), pair_launcher_id.hex(), liquidity_asset_id.hex())
+# (puzzles are computed before getting here - chia_rs programs can't be used from the db threads)
+# new pairs get a placeholder token; token_metadata_filler fetches the real metadata later
+def save_router_update(db: Session, router_new_current_id: str, pairs) -> models.Router:
+    router = db.query(models.Router).first()
+    router.current_id = router_new_current_id
+
+    launcher_ids = [pair_launcher_id for _, pair_launcher_id, _ in pairs]
+    asset_ids = [pair_tail_hash for pair_tail_hash, _, _ in pairs]
+    existing_pairs = set(
+        launcher_id for (launcher_id,) in db.query(models.Pair.launcher_id).filter(models.Pair.launcher_id.in_(launcher_ids))
+    )
+    existing_tokens = set(
+        asset_id for (asset_id,) in db.query(models.Token.asset_id).filter(models.Token.asset_id.in_(asset_ids))
+    )
+
+    for pair_tail_hash, pair_launcher_id, liquidity_asset_id in pairs:
+        if pair_launcher_id in existing_pairs:
+            continue
+        existing_pairs.add(pair_launcher_id)
+
+        db.add(models.Pair(
+            launcher_id=pair_launcher_id,
+            asset_id=pair_tail_hash,
+            liquidity_asset_id=liquidity_asset_id,
+            xch_reserve=0,
+            token_reserve=0,
+            liquidity=0,
+            last_coin_id_on_chain=pair_launcher_id,
+        ))
+
+        if pair_tail_hash in existing_tokens:
+            continue
+        existing_tokens.add(pair_tail_hash)
+
+        db.add(models.Token(
+            asset_id=pair_tail_hash,
+            pair_id=pair_launcher_id,
+            name=f"CAT 0x{pair_tail_hash[:8]}",
+            short_name=PLACEHOLDER_TOKEN_SHORT_NAME,
+            image_url=PLACEHOLDER_TOKEN_IMAGE_URL,
+            verified=False,
+        ))
+
+    # one transaction for the router and every new pair & token
+    db.commit()
+
+    return router
+
+
 async def get_router():
     global last_check_router_update_call
     global router_instance
@@ -165,141 +362,417 @@ async def get_router():
     now = datetime.now()
 
     if router_instance is None:
-        with SessionLocal() as db:
-            router_instance = init_router(db)
+        router_instance = await run_db(init_router)
 
     # Check if check_router_update was called in the last minute
     if now - last_check_router_update_call >= timedelta(minutes=1):
         last_check_router_update_call = now
-        update = None
-        with SessionLocal() as db:
-            update = await check_router_update(db)
+        update = await check_router_update(router_instance)
         if update is not None:
-            router_instance.current_id = update[0]
-            db.commit()
-
-            pairs = update[1]
-            for pair_tail_hash, pair_launcher_id in pairs:
-                pair = db.query(models.Pair).filter(models.Pair.launcher_id == pair_launcher_id).first()
-                if pair is not None:
-                    continue
-
-                # Create a new Pair object
-                pair = models.Pair(
-                    launcher_id=pair_launcher_id,
-                    asset_id=pair_tail_hash,
-                    liquidity_asset_id=pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex(),
-                    xch_reserve=0,
-                    token_reserve=0,
-                    liquidity=0,
-                    last_coin_id_on_chain=pair_launcher_id,
-                )
-                db.add(pair)
-                db.commit()
-
-                # Create a new Token object
-                token = None
-                try:
-                    r = requests.get(taildatabase_tail_info_url + pair_tail_hash)
-                    resp = r.json()
-                    token = models.Token(
-                        asset_id=pair_tail_hash,
-                        pair_id=pair_launcher_id,
-                        name=resp["name"],
-                        short_name=resp["code"],
-                        image_url=resp["nft_uri"],
-                        verified=False,
-                    )
-                except:
-                    token = models.Token(
-                        asset_id=pair_tail_hash,
-                        pair_id=pair_launcher_id,
-                        name=f"CAT 0x{pair_tail_hash[:8]}",
-                        short_name=f"???",
-                        image_url="https://bafybeigzcazxeu7epmm4vtkuadrvysv74lbzzbl2evphtae6k57yhgynp4.ipfs.dweb.link/9098.gif",
-                        verified=False,
-                    )
-                db.add(token)
-                db.commit()
+            pairs = [
+                (pair_tail_hash, pair_launcher_id, pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex())
+                for pair_tail_hash, pair_launcher_id in update[1]
+            ]
+            router_changed = update[0] != router_instance.current_id or len(pairs) > 0
+            router_instance = await run_db(save_router_update, update[0], pairs)
+            if router_changed:
+                response_cache.invalidate("router", "pairs", "tokens")
+                await pairs_changed([pair_launcher_id for _, pair_launcher_id, _ in pairs])
+            if len(pairs) > 0:
+                token_metadata_needed.set()
 
     return router_instance
 
-async def get_pair(db: Session, pair_id: str, force_refresh: bool = False) -> models.Pair:
-    global last_pair_update
-    
-    pair = db.query(models.Pair).filter(models.Pair.launcher_id == pair_id).first()
+async def fetch_token_metadata(semaphore: asyncio.Semaphore, asset_id: str):
+    async with semaphore:
+        try:
+            async with get_http_session().get(taildatabase_tail_info_url + asset_id) as r:
+                resp = await r.json(content_type=None)
+            return asset_id, {"name": resp["name"], "short_name": resp["code"], "image_url": resp["nft_uri"]}
+        except Exception as e:
+            print(f"could not fetch metadata for token {asset_id}: {e}")
+            return asset_id, None
+
+
+def save_token_metadata(db: Session, metadata: dict):
+    for token in db.query(models.Token).filter(models.Token.asset_id.in_(list(metadata.keys()))):
+        token.name = metadata[token.asset_id]["name"]
+        token.short_name = metadata[token.asset_id]["short_name"]
+        token.image_url = metadata[token.asset_id]["image_url"]
+    db.commit()
+
+
+async def fill_token_metadata():
+    placeholder_tokens = await run_db(
+        lambda db: db.query(models.Token).filter(models.Token.short_name == PLACEHOLDER_TOKEN_SHORT_NAME).all()
+    )
+    if len(placeholder_tokens) == 0:
+        return
+
+    semaphore = asyncio.Semaphore(TOKEN_METADATA_CONCURRENCY)
+    results = await asyncio.gather(*[fetch_token_metadata(semaphore, token.asset_id) for token in placeholder_tokens])
+    metadata = {asset_id: m for asset_id, m in results if m is not None}
+    if len(metadata) > 0:
+        await run_db(save_token_metadata, metadata)
+        response_cache.invalidate("tokens")
+
+
+async def token_metadata_filler():
+    while True:
+        try:
+            await fill_token_metadata()
+        except Exception as e:
+            print(f"exception in token_metadata_filler: {e}")
+            capture_exception(e)
+
+        # retry tokens the tail database didn't know about yet every TOKEN_METADATA_REFRESH_INTERVAL seconds,
+        # or right away when the router discovers new pairs
+        try:
+            await asyncio.wait_for(token_metadata_needed.wait(), TOKEN_METADATA_REFRESH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        token_metadata_needed.clear()
+
+
+async def get_pair(pair_id: str) -> models.Pair:
+    # the background refresher keeps the snapshot up to date
+    return await run_db(lambda db: db.query(models.Pair).filter(models.Pair.launcher_id == pair_id).first())
+
+
+async def get_all_pairs() -> List[models.Pair]:
+    return await run_db(lambda db: db.query(models.Pair).order_by(models.Pair.xch_reserve.desc()).all())
+
+
+async def refresh_pair(semaphore: asyncio.Semaphore, pair_id: str):
+    async with semaphore:
+        try:
+            pair = await get_pair(pair_id)
+            if pair is None:
+                return
+
+            await check_pair_update(pair)
+            last_pair_update[pair_id] = datetime.now()
+        except Exception as e:
+            print(f"exception while refreshing pair {pair_id}: {e}")
+
+
+def pair_needs_refresh(pair_id: str, coin_id: bytes, coin_records: dict) -> bool:
+    coin_record = coin_records.get(coin_id)
+    if coin_record is None or coin_record.spent: # reorg or spent on-chain
+        return True
+
+    # unconfirmed spends (new or dropped) also change the state we serve
+    if pair_id in pairs_with_mempool_state or not mempool_index.is_fresh():
+        return True
+    return mempool_index.get_spend_bundle_by_coin_id(coin_id) is not None
+
+
+async def refresh_all_pairs():
+    global last_full_pair_refresh
+    global followed_height
+    global followed_header_hash
+
+    client = await get_client()
+    peak = (await client.get_blockchain_state())["peak"]
+
+    last_coin_ids = {pair.launcher_id: bytes.fromhex(pair.last_coin_id_on_chain) for pair in await get_all_pairs()}
+
+    # one batched lookup tells us which pairs haven't moved since their last sync
+    coin_records = await get_coin_records_by_names(client, list(last_coin_ids.values()))
+    pair_ids = [
+        pair_id for pair_id, coin_id in last_coin_ids.items() if pair_needs_refresh(pair_id, coin_id, coin_records)
+    ]
+
+    semaphore = asyncio.Semaphore(PAIR_REFRESH_CONCURRENCY)
+    await asyncio.gather(*[refresh_pair(semaphore, pair_id) for pair_id in pair_ids])
+
     now = datetime.now()
-    
-    if pair is not None:
-        last_update = last_pair_update.get(pair_id)
-        if force_refresh or last_update is None or now - last_update >= timedelta(seconds=5):
+    for pair_id in last_coin_ids.keys():
+        if pair_id not in pair_ids:
             last_pair_update[pair_id] = now
-            pair, _ = await check_pair_update(db, pair)
-    
-    return pair
 
+    last_full_pair_refresh = datetime.now()
+    followed_height = peak.height
+    followed_header_hash = peak.header_hash
+
+
+# pair_updates: launcher id -> (pair state, last coin id on chain)
+# returns the launcher ids of the pairs that actually changed
+def save_pair_states(db: Session, pair_updates: dict) -> List[str]:
+    changed_pair_ids = []
+    for pair_id, (pair_state, last_coin_id_on_chain) in pair_updates.items():
+        pair = db.query(models.Pair).filter(models.Pair.launcher_id == pair_id).first()
+        if pair is None:
+            continue
+
+        new_values = (pair_state['xch_reserve'], pair_state['token_reserve'], pair_state['liquidity'], last_coin_id_on_chain)
+        if (pair.xch_reserve, pair.token_reserve, pair.liquidity, pair.last_coin_id_on_chain) == new_values:
+            continue
+
+        pair.xch_reserve, pair.token_reserve, pair.liquidity, pair.last_coin_id_on_chain = new_values
+        changed_pair_ids.append(pair_id)
+    db.commit()
+
+    return changed_pair_ids
 
-async def get_all_pairs(db: Session, force_refresh: bool = False) -> List[models.Pair]:
-    pairs = db.query(models.Pair).order_by(models.Pair.xch_reserve.desc()).all()
 
+async def pairs_changed(pair_ids: List[str]):
+    if len(pair_ids) == 0:
+        return
+
+    pairs = await run_db(lambda db: db.query(models.Pair).filter(models.Pair.launcher_id.in_(pair_ids)).all())
     for pair in pairs:
-        pair_id = pair.launcher_id
-        last_update = last_pair_update.get(pair_id)
+        pair_index.update(schemas.Pair.from_orm(pair).dict())
+    response_cache.invalidate("pairs", *[f"pair:{pair_id}" for pair_id in pair_ids])
+
+
+# True if the pair's coin is now spent by a different mempool tx (or none) than when the pair was last synced
+def pair_mempool_state_changed(pair_id: str, coin_id: bytes) -> bool:
+    return mempool_index.tx_id_by_coin_id.get(coin_id) != pair_mempool_tx_ids.get(pair_id)
+
+
+async def follow_new_blocks():
+    global followed_height
+    global followed_header_hash
+    global last_check_router_update_call
+
+    client = await get_client()
+    peak = (await client.get_blockchain_state())["peak"]
+    peak_height = peak.height
+
+    # the block we followed last has to still be part of the chain, whatever the peak height is
+    reorg = peak_height < followed_height
+    if not reorg:
+        followed_block = peak if peak_height == followed_height else await client.get_block_record_by_height(followed_height)
+        reorg = followed_block is None or followed_block.header_hash != followed_header_hash
+
+    if reorg or peak_height - followed_height > CHAIN_FOLLOWER_MAX_GAP:
+        # reorg or too far behind - reconcile everything
+        await refresh_all_pairs()
+        return
+
+    pairs = await get_all_pairs()
+    router = await run_db(lambda db: db.query(models.Router).first())
+
+    coin_index = {}
+    new_pair_ids = []
+    for pair in pairs:
+        if pair.last_coin_id_on_chain == pair.launcher_id:
+            new_pair_ids.append(pair.launcher_id)
+        coin_index[bytes.fromhex(pair.last_coin_id_on_chain)] = pair.launcher_id
+    if router is not None:
+        coin_index[bytes.fromhex(router.current_id)] = None
+    coin_id_for_key = {key: coin_id for coin_id, key in coin_index.items()}
+
+    updates = {}
+    for height in range(followed_height + 1, peak_height + 1):
+        block_updates = await follow_block(client, height, coin_index, lineage_store)
+        for key, (new_coin, creation_spend) in block_updates.items():
+            del coin_index[coin_id_for_key[key]]
+            coin_id_for_key[key] = new_coin.name()
+            coin_index[new_coin.name()] = key
+            updates[key] = (new_coin, creation_spend)
+
+    if None in updates:
+        # router spent - let get_router pick up the new pairs
+        last_check_router_update_call = datetime.now() - timedelta(minutes=1)
+        del updates[None]
+
+    pair_updates = {}
+    for pair_id, (new_coin, creation_spend) in updates.items():
+        pair_updates[pair_id] = (get_pair_state_from_creation_spend(creation_spend), new_coin.name().hex())
+    await pairs_changed(await run_db(save_pair_states, pair_updates))
+
+    now = datetime.now()
+    for pair in pairs:
+        last_pair_update[pair.launcher_id] = now
+    followed_height = peak_height
+    followed_header_hash = peak.header_hash
+
+    # launchers are spent in the same block they're created in, so freshly
+    # discovered pairs need one regular sync to find their first coin
+    # unconfirmed spends (new, replaced or dropped) don't show up in blocks, so pairs whose coin's
+    # mempool spend changed are synced too
+    sync_pair_ids = set(new_pair_ids)
+    if mempool_index.is_fresh():
+        for coin_id, pair_id in coin_index.items():
+            if pair_id is not None and pair_mempool_state_changed(pair_id, coin_id):
+                sync_pair_ids.add(pair_id)
+
+    semaphore = asyncio.Semaphore(PAIR_REFRESH_CONCURRENCY)
+    await asyncio.gather(*[refresh_pair(semaphore, pair_id) for pair_id in sync_pair_ids])
+
+
+async def pair_refresher():
+    while True:
+        try:
+            await get_router()
+
+            if followed_height is None or datetime.now() - last_full_pair_refresh >= timedelta(seconds=PAIR_FULL_REFRESH_INTERVAL):
+                await refresh_all_pairs()
+            else:
+                await follow_new_blocks()
+        except Exception as e:
+            print(f"exception in pair_refresher: {e}")
+            capture_exception(e)
+        await asyncio.sleep(PAIR_REFRESH_INTERVAL)
 
-        now = datetime.now()
-        if force_refresh or last_update is None or now - last_update >= timedelta(seconds=5):
-            last_pair_update[pair_id] = now
-            pair, _ = await check_pair_update(db, pair)
 
-    return pairs
+async def get_pair_refresh_lag() -> dict:
+    now = datetime.now()
+
+    lag = {}
+    for pair in await get_all_pairs():
+        last_update = last_pair_update.get(pair.launcher_id, pair_refresher_started_at)
+        lag[pair.launcher_id] = (now - last_update).total_seconds() if last_update is not None else None
+
+    return lag
+
+
+async def mempool_indexer():
+    while True:
+        try:
+            await mempool_index.refresh(await get_client())
+            fee_estimator.sample(mempool_index.costs)
+        except Exception as e:
+            print(f"exception in mempool_indexer: {e}")
+        await asyncio.sleep(MEMPOOL_REFRESH_INTERVAL)
 
 
-async def check_pair_update(db: Session, pair: models.Pair) -> models.Pair:
+@app.on_event("startup")
+async def start_pair_refresher():
+    global pair_refresher_task
+    global pair_refresher_started_at
+    global mempool_indexer_task
+    global router_instance
+    global token_metadata_filler_task
+    global dexie_submitter_task
+
+    # the router row only needs to be created once - not on every request
+    router_instance = await run_db(init_router)
+    for pair in await get_all_pairs():
+        pair_index.update(schemas.Pair.from_orm(pair).dict())
+
+    pair_refresher_started_at = datetime.now()
+    pair_refresher_task = asyncio.create_task(pair_refresher())
+    mempool_indexer_task = asyncio.create_task(mempool_indexer())
+    token_metadata_filler_task = asyncio.create_task(token_metadata_filler())
+    dexie_submitter_task = asyncio.create_task(dexie_submitter())
+
+
+@app.on_event("shutdown")
+async def stop_pair_refresher():
+    if pair_refresher_task is not None:
+        pair_refresher_task.cancel()
+    if mempool_indexer_task is not None:
+        mempool_indexer_task.cancel()
+    if token_metadata_filler_task is not None:
+        token_metadata_filler_task.cancel()
+    if dexie_submitter_task is not None:
+        dexie_submitter_task.cancel()
+    if http_session is not None:
+        await http_session.close()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "pair_refresh_lag": await get_pair_refresh_lag(),
+        "pair_refresh_concurrency": PAIR_REFRESH_CONCURRENCY,
+        "pair_refresh_interval": PAIR_REFRESH_INTERVAL,
+        "followed_height": followed_height,
+        "coin_spend_cache": COIN_SPEND_CACHE.stats(),
+        "spend_bundle_cost_cache": SPEND_BUNDLE_COST_CACHE.stats(),
+        "operation_costs": OPERATION_COSTS.stats(),
+        "offer_analysis_cache": OFFER_ANALYSIS_CACHE.stats(),
+        "offer_dry_run": {**dry_run_stats, "enabled": OFFER_DRY_RUN},
+        "mempool_index": mempool_index.stats(),
+        "fee_estimator": fee_estimator.stats(),
+        "response_cache": response_cache.stats(),
+        "pair_index": pair_index.stats(),
+        "dexie_queue": dexie_queue.qsize(),
+        "full_node_client": full_node_client.stats() if isinstance(full_node_client, LeafletFullNodeRpcClient) else None,
+    }
+
+
+async def check_pair_update(pair: models.Pair) -> models.Pair:
     client = await get_client()
 
     _, _, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        client, bytes.fromhex(pair.last_coin_id_on_chain)
+        client, bytes.fromhex(pair.last_coin_id_on_chain), lineage_store, mempool_index, bytes.fromhex(pair.launcher_id)
     )
 
     pair.xch_reserve = pair_state['xch_reserve'] 
     pair.token_reserve = pair_state['token_reserve']
     pair.liquidity = pair_state['liquidity']
     pair.last_coin_id_on_chain = last_synced_pair_id_on_blockchain.hex()
+    if sb_to_aggregate is not None:
+        pairs_with_mempool_state.add(pair.launcher_id)
+    else:
+        pairs_with_mempool_state.discard(pair.launcher_id)
+    pair_mempool_tx_ids[pair.launcher_id] = mempool_index.tx_id_by_coin_id.get(last_synced_pair_id_on_blockchain)
     
     # Commit the update to the database
-    db.add(pair)
-    db.commit()
-    db.refresh(pair)
+    await pairs_changed(await run_db(save_pair_states, {pair.launcher_id: (pair_state, pair.last_coin_id_on_chain)}))
     
     return pair, sb_to_aggregate
 
-def get_input_price(input_amount, input_reserve, output_reserve):
-    input_amount_with_fee = input_amount * 993
-    numerator = input_amount_with_fee * output_reserve
-    denominator = (input_reserve * 1000) + input_amount_with_fee
-    return numerator / denominator
-
-def get_output_price(output_amount, input_reserve, output_reserve):
-    numerator: uint256 = input_reserve * output_amount * 1000
-    denominator: uint256 = (output_reserve - output_amount) * 993
-    return numerator / denominator + 1
-
-async def get_quote(db: Session, pair_id: str, amount_in: Optional[int], amount_out: Optional[int], xch_is_input: bool, estimate_fee: bool = False) -> schemas.Quote:
+async def get_quote(pair_id: str, amount_in: Optional[int], amount_out: Optional[int], xch_is_input: bool, estimate_fee: bool = False, fee_target_time: int = 0) -> schemas.Quote:
     # Fetch the pair with the given launcher_id
-    pair = await get_pair(db, pair_id)
+    pair = await get_pair(pair_id)
     if pair is None:
         raise HTTPException(status_code=400, detail="Unknown pair id (launcher id)")
 
-    mempool_sb = None
+    # before the fee estimate - invalid requests don't pay for it
+    error = get_quote_error(pair.xch_reserve, pair.token_reserve, amount_in, amount_out, xch_is_input)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
+
+    recommended_fee = None
     if estimate_fee:
-        pair, mempool_sb = await check_pair_update(db, pair)
+        # cost & fee of the mempool item come from the index, the cost of the swap from the operation cost table
+        last_coin_id = bytes.fromhex(pair.last_coin_id_on_chain)
+        recommended_fee = await get_fee_estimate(
+            mempool_index.get_spend_bundle_by_coin_id(last_coin_id),
+            await get_client(),
+            "xch_to_token" if xch_is_input else "token_to_xch",
+            mempool_index.get_cost_and_fee_by_coin_id(last_coin_id),
+            fee_estimator,
+            fee_target_time
+        )
+
+    return quote_from_reserves(
+        pair.asset_id, pair.xch_reserve, pair.token_reserve, amount_in, amount_out, xch_is_input, recommended_fee
+    )
 
-    xch_reserve = pair.xch_reserve
-    token_reserve = pair.token_reserve
 
-    input_reserve, output_reserve = pair.token_reserve, pair.xch_reserve
+# returns why a quote can't be computed from the given reserves, or None if it can
+# the only validation of quote requests - callers check it before quote_from_reserves
+def get_quote_error(xch_reserve: int, token_reserve: int, amount_in: Optional[int], amount_out: Optional[int], xch_is_input: bool) -> Optional[str]:
+    if (amount_in is not None) == (amount_out is not None):
+        return "provide either amount_in or amount_out, but not both"
+    if (amount_in if amount_in is not None else amount_out) <= 0:
+        return "amount must be positive"
+    if xch_reserve <= 0 or token_reserve <= 0:
+        return "pair has no liquidity"
+
+    output_reserve = token_reserve if xch_is_input else xch_reserve
+    if amount_out is not None and amount_out >= output_reserve:
+        return "amount_out exceeds the output reserve"
+    return None
+
+def quote_from_reserves(
+    asset_id: str,
+    xch_reserve: int,
+    token_reserve: int,
+    amount_in: Optional[int],
+    amount_out: Optional[int],
+    xch_is_input: bool,
+    recommended_fee: Optional[int] = None
+) -> schemas.Quote:
+    input_reserve, output_reserve = token_reserve, xch_reserve
     if xch_is_input:
-        input_reserve, output_reserve = pair.xch_reserve, pair.token_reserve
+        input_reserve, output_reserve = xch_reserve, token_reserve
 
     if amount_in is None: 
         # amount_out given
@@ -308,23 +781,18 @@ async def get_quote(db: Session, pair_id: str, amount_in: Optional[int], amount_
         # amount_in given
         amount_out = get_input_price(amount_in, input_reserve, output_reserve)
 
-    # https://docs.mimo.finance/the-formulas#price-impact
-    price_impact = 1 - (output_reserve - amount_out) ** 2 / output_reserve ** 2
+    price_impact = get_price_impact(amount_out, output_reserve)
 
     # warn price change when price impact > 5%
     price_warning = price_impact > 0.05
 
-    recommended_fee = None
-    if estimate_fee:
-        recommended_fee = await get_fee_estimate(mempool_sb, await get_client())
-
     quote = schemas.Quote(
         amount_in=amount_in,
         amount_out=amount_out,
         price_warning=price_warning,
         price_impact=price_impact,
         fee=recommended_fee,
-        asset_id=pair.asset_id,
+        asset_id=asset_id,
         input_reserve=input_reserve,
         output_reserve=output_reserve
     )
@@ -332,17 +800,110 @@ async def get_quote(db: Session, pair_id: str, amount_in: Optional[int], amount_
     return quote
 
 @app.get("/quote/{pair_id}", response_model=schemas.Quote)
-async def read_quote(pair_id: str, amount_in: Optional[int] = Query(None), amount_out: Optional[int] = Query(None), xch_is_input: bool = True, estimate_fee: bool = False, db: Session = Depends(get_db)):
-    # Ensure that either amount_in or amount_out is provided, but not both
-    if (amount_in is not None) == (amount_out is not None):
-        raise HTTPException(status_code=400, detail="Provide either amount_in or amount_out, but not both")
-
-    quote = await get_quote(db, pair_id, amount_in, amount_out, xch_is_input, estimate_fee)
+async def read_quote(pair_id: str, amount_in: Optional[int] = Query(None), amount_out: Optional[int] = Query(None), xch_is_input: bool = True, estimate_fee: bool = False, fee_target_time: int = 0):
+    quote = await get_quote(pair_id, amount_in, amount_out, xch_is_input, estimate_fee, fee_target_time)
     return quote
 
 
+# recommended fee for every target time the fee estimator tracks
+@app.get("/fees", response_model=List[schemas.FeeEstimate])
+async def read_fees(operation: schemas.OperationType = schemas.OperationType.XCH_TO_TOKEN):
+    if not fee_estimator.is_fresh():
+        raise HTTPException(status_code=503, detail="Fee estimates are not available yet")
+
+    cost = OPERATION_COSTS.get(operation.value)
+    return [
+        schemas.FeeEstimate(
+            target_time=target,
+            fee_per_cost=fee_estimator.get_fee_per_cost(target),
+            fee=fee_estimator.get_fee(cost, target)
+        ) for target in fee_estimator.targets
+    ]
+
+
+# biggest trades (both directions) that stay within each price impact breakpoint
+# cached with the pair, so it's only recomputed after the pair's state changes
+@app.get("/depth/{pair_id}", response_model=schemas.Depth)
+async def read_depth(request: Request, pair_id: str, price_impacts: List[float] = Query(DEFAULT_DEPTH_PRICE_IMPACTS)):
+    if len(price_impacts) > DEPTH_MAX_PRICE_IMPACTS:
+        raise HTTPException(status_code=400, detail=f"At most {DEPTH_MAX_PRICE_IMPACTS} price impacts per request")
+    if any(not 0 < price_impact < 1 for price_impact in price_impacts):
+        raise HTTPException(status_code=400, detail="Price impacts must be between 0 and 1")
+
+    async def compute(headers):
+        pair = pair_index.pairs.get(pair_id)
+        if pair is None:
+            raise HTTPException(status_code=404, detail="Pair not found")
+
+        xch_reserve, token_reserve = pair["xch_reserve"], pair["token_reserve"]
+        levels = {"xch_to_token": [], "token_to_xch": []}
+        if xch_reserve > 0 and token_reserve > 0:
+            levels["xch_to_token"] = get_depth_table(price_impacts, xch_reserve, token_reserve)
+            levels["token_to_xch"] = get_depth_table(price_impacts, token_reserve, xch_reserve)
+
+        return schemas.Depth(
+            pair_id=pair_id,
+            xch_reserve=xch_reserve,
+            token_reserve=token_reserve,
+            **{
+                direction: [
+                    schemas.DepthLevel(price_impact=price_impact, amount_in=amount_in, amount_out=amount_out)
+                    for price_impact, amount_in, amount_out in table
+                ] for direction, table in levels.items()
+            }
+        )
+
+    return await cached_response(request, [f"pair:{pair_id}"], compute, {"price_impacts": price_impacts})
+
+
+# all quotes are computed from the same pair index snapshot (nothing is awaited in between)
+@app.post("/quotes", response_model=List[schemas.Quote])
+async def read_quotes(quote_requests: List[schemas.QuoteRequest] = Body(...)):
+    if len(quote_requests) > QUOTE_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {QUOTE_BATCH_MAX_SIZE} quotes per request")
+
+    # every item is validated before any quote is computed
+    pairs = []
+    for i, quote_request in enumerate(quote_requests):
+        pair = pair_index.pairs.get(quote_request.pair_id)
+        if pair is None:
+            raise HTTPException(status_code=400, detail=f"Quote {i}: unknown pair id (launcher id)")
+
+        error = get_quote_error(
+            pair["xch_reserve"], pair["token_reserve"], quote_request.amount_in, quote_request.amount_out, quote_request.xch_is_input
+        )
+        if error is not None:
+            raise HTTPException(status_code=400, detail=f"Quote {i}: {error}")
+        pairs.append(pair)
+
+    quotes = []
+    for quote_request, pair in zip(quote_requests, pairs):
+        quotes.append(quote_from_reserves(
+            pair["asset_id"],
+            pair["xch_reserve"],
+            pair["token_reserve"],
+            quote_request.amount_in,
+            quote_request.amount_out,
+            quote_request.xch_is_input
+        ))
+
+    return quotes
+
+
+# key of the operation cost table (fee_costs.DEFAULT_OPERATION_COSTS) for an offer
+def get_offer_operation(action: schemas.ActionType, offer: str) -> str:
+    if action == schemas.ActionType.ADD_LIQUIDITY:
+        return "add_liquidity"
+    if action == schemas.ActionType.REMOVE_LIQUIDITY:
+        return "remove_liquidity"
+
+    # XCH (asset id None) requested -> token offered
+    if None in analyze_offer(offer).requested_amounts.keys():
+        return "token_to_xch"
+    return "xch_to_token"
+
+
 async def create_offer(
-    db: Session,
     pair_id: str,
     offer: str,
     action: schemas.ActionType,
@@ -353,20 +914,43 @@ async def create_offer(
     if total_donation_amount < 0:
         raise HTTPException(status_code=400, detail="total_donation_amount negative")
 
-    pair = await get_pair(db, pair_id)
+    pair = await get_pair(pair_id)
     if pair is None:
         raise HTTPException(status_code=400, detail="Unknown pair id (launcher id)")
     
     sb = None
-    offerId = "" # will be set outside function
+    offerId = "" # name of the pushed spend bundle, set once it's in the mempool
     try:
         client = await get_client()
 
         current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-            client, bytes.fromhex(pair.last_coin_id_on_chain)
+            client, bytes.fromhex(pair.last_coin_id_on_chain), lineage_store, mempool_index, bytes.fromhex(pair.launcher_id)
         )
         current_pair_coin_id = current_pair_coin.name().hex()
 
+        # reject bad offers before building anything (and without writing debug files)
+        validation_error = validate_offer(
+            {
+                schemas.ActionType.SWAP: "swap",
+                schemas.ActionType.ADD_LIQUIDITY: "add_liquidity",
+                schemas.ActionType.REMOVE_LIQUIDITY: "remove_liquidity",
+            }[action],
+            offer,
+            bytes.fromhex(pair.launcher_id),
+            bytes.fromhex(pair.asset_id),
+            pair_state["liquidity"],
+            pair_state["xch_reserve"],
+            pair_state["token_reserve"],
+            total_donation_amount,
+            donation_addresses
+        )
+        if validation_error is not None:
+            return schemas.OfferResponse(
+                success=False,
+                message=json.dumps({**validation_error, "pair_id": pair_id, "action": str(action)}),
+                offer_id=offerId
+            )
+
         xch_reserve_coin, token_reserve_coin, token_reserve_lineage_proof = await get_pair_reserve_info(
             client,
             bytes.fromhex(pair.launcher_id),
@@ -422,9 +1006,40 @@ async def create_offer(
                 token_reserve_lineage_proof
             )
 
+        own_sb = sb
         if sb_to_aggregate is not None:
             sb = SpendBundle.aggregate([sb, sb_to_aggregate])
 
+        own_sb_cost = None
+        if OFFER_DRY_RUN:
+            start = time.perf_counter()
+            # runs CLVM - off the event loop
+            dry_run_error, cost = await asyncio.get_running_loop().run_in_executor(None, lambda: dry_run_spend_bundle(
+                sb, mempool_index, synced_coins=[current_pair_coin, xch_reserve_coin, token_reserve_coin], own_sb=own_sb
+            ))
+            elapsed = time.perf_counter() - start
+
+            dry_run_stats["runs"] += 1
+            dry_run_stats["total_time"] += elapsed
+            dry_run_stats["max_time"] = max(dry_run_stats["max_time"], elapsed)
+            dry_run_stats["last_cost"] = cost
+            dry_run_stats["max_cost"] = max(dry_run_stats["max_cost"], cost)
+            if sb_to_aggregate is None:
+                own_sb_cost = cost
+            if dry_run_error is not None:
+                dry_run_stats["rejected"] += 1
+                return schemas.OfferResponse(
+                    success=False,
+                    message=json.dumps({
+                        "error": "dry_run_failed",
+                        "message": dry_run_error,
+                        "cost": cost,
+                        "pair_id": pair_id,
+                        "action": str(action)
+                    }),
+                    offer_id=offerId
+                )
+
         try:
             resp = await client.push_tx(sb)
         except Exception as e:
@@ -441,6 +1056,15 @@ async def create_offer(
             capture_message(f"{t} - Failed to push spend bundle; data written in files spend_bundle.{t}.json and offer.{t}.json")
         
         success = resp['status'] == 'SUCCESS'
+        if success:
+            offerId = sb.name().hex()
+            # measured without the aggregated mempool bundle; feeds future fee estimates
+            # the dry run already has it unless a mempool bundle was aggregated - otherwise CLVM
+            # runs off the event loop
+            if own_sb_cost is None:
+                own_sb_cost = await asyncio.get_running_loop().run_in_executor(None, get_spend_bundle_cost, own_sb)
+            OPERATION_COSTS.record(get_offer_operation(action, offer), own_sb_cost)
+
         response = schemas.OfferResponse(
             success=success,
             message=json.dumps(resp),
@@ -475,10 +1099,8 @@ async def create_offer_endpoint(pair_id: str,
                                 action: schemas.ActionType = Body(...),
                                 total_donation_amount: int = Body(0),
                                 donation_addresses: List[str] = Body([]),
-                                donation_weights: List[int] = Body([]),
-                                db: Session = Depends(get_db)):
+                                donation_weights: List[int] = Body([])):
     response = await create_offer(
-        db,
         pair_id,
         offer,
         action,
@@ -487,24 +1109,51 @@ async def create_offer_endpoint(pair_id: str,
         donation_weights
     )
 
-    try:
-        if response.success:
-            dexie_url = "https://api.dexie.space/v1/offers"
-            if os.environ["TIBETSWAP_NETWORK"] != "mainnet":
-                dexie_url = "https://api-testnet.dexie.space/v1/offers"
+    if response.success:
+        try:
+            dexie_queue.put_nowait(offer)
+        except asyncio.QueueFull:
+            print("dexie queue full - offer not submitted to dexie")
+    return response
+
+
+async def submit_offer_to_dexie(offer: str):
+    dexie_url = "https://api.dexie.space/v1/offers"
+    if os.environ["TIBETSWAP_NETWORK"] != "mainnet":
+        dexie_url = "https://api-testnet.dexie.space/v1/offers"
+
+    attempt = 0
+    while True:
+        try:
+            async with get_http_session().post(dexie_url, json={"offer": offer, "drop_only": True}, headers={"User-Agent": "TibetSwap v1 fren"}) as r:
+                text = await r.text()
             # this is a very important print statement
             # do not remove under any circumstance 
-            r = requests.post(dexie_url, json={"offer": offer, "drop_only": True}, headers={"User-Agent": "TibetSwap v1 fren"})
+            print(text)
             # edit: I had to separate the original print statement in two parts
             # but I did not remove it!
-            print(r.text)
 
-            resp = r.json()
-            if resp["success"]:
-                response.offer_id = resp["id"]
-    except:
-        pass
-    return response
+            if r.status < 500 and r.status != 429:
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"could not submit offer to dexie: {e}")
+
+        if attempt >= DEXIE_MAX_RETRIES:
+            return
+        await asyncio.sleep(DEXIE_RETRY_BACKOFF * 2 ** attempt)
+        attempt += 1
+
+
+async def dexie_submitter():
+    while True:
+        offer = await dexie_queue.get()
+        try:
+            await submit_offer_to_dexie(offer)
+        except Exception as e:
+            print(f"exception in dexie_submitter: {e}")
+            capture_exception(e)
+        finally:
+            dexie_queue.task_done()
 
 
 @app.get("/")
@@ -0,0 +1,126 @@
+import asyncio
+
+# batched full node lookups - one round trip for many coins instead of one per coin
+BATCH_RPC_SIZE = 100 # coin ids per request
+BATCH_RPC_CONCURRENCY = 16 # parallel get_puzzle_and_solution requests
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# returns coin id -> coin record (missing coins are left out)
+async def get_coin_records_by_names(full_node_client, coin_ids, batch_size=BATCH_RPC_SIZE):
+    coin_ids = list(set(coin_ids))
+    results = await asyncio.gather(*[
+        full_node_client.get_coin_records_by_names(chunk, include_spent_coins=True)
+        for chunk in chunks(coin_ids, batch_size)
+    ])
+
+    coin_records = {}
+    for result in results:
+        for coin_record in result:
+            coin_records[coin_record.coin.name()] = coin_record
+    return coin_records
+
+
+# spent_coin_records: coin records of spent coins
+# returns coin id -> CoinSpend
+async def get_puzzles_and_solutions(full_node_client, spent_coin_records, concurrency=BATCH_RPC_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(coin_record):
+        async with semaphore:
+            return await full_node_client.get_puzzle_and_solution(coin_record.coin.name(), coin_record.spent_block_index)
+
+    coin_spends = await asyncio.gather(*[fetch(coin_record) for coin_record in spent_coin_records])
+    return {coin_spend.coin.name(): coin_spend for coin_spend in coin_spends}
+
+
+# returns height -> header hash for the given heights; heights close to each other share a
+# get_block_records request (BATCH_RPC_SIZE blocks per request)
+async def get_header_hashes_by_heights(full_node_client, heights, batch_size=BATCH_RPC_SIZE):
+    heights = set(heights)
+    ranges = []
+    for height in sorted(heights):
+        if len(ranges) > 0 and height - ranges[-1][0] < batch_size:
+            ranges[-1][1] = height
+        else:
+            ranges.append([height, height])
+
+    results = await asyncio.gather(*[
+        full_node_client.get_block_records(start, end + 1) for start, end in ranges
+    ])
+
+    header_hashes = {}
+    for block_records in results:
+        for block_record in block_records:
+            if block_record["height"] not in heights: # in the range, but not asked for
+                continue
+            header_hashes[block_record["height"]] = bytes.fromhex(block_record["header_hash"].replace("0x", ""))
+    return header_hashes
+
+
+# returns the coin records of every coin created in the blocks at the given heights
+# the full node has no batched additions lookup, so that's still one request per block (in parallel)
+async def get_additions_by_heights(full_node_client, heights, concurrency=BATCH_RPC_CONCURRENCY):
+    header_hashes = await get_header_hashes_by_heights(full_node_client, heights)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(header_hash):
+        async with semaphore:
+            additions, _ = await full_node_client.get_additions_and_removals(header_hash)
+            return additions
+
+    results = await asyncio.gather(*[fetch(header_hash) for header_hash in header_hashes.values()])
+    return [coin_record for additions in results for coin_record in additions]
+
+
+# follows a singleton from the given coin record to its current (unspent) coin using only coin records
+# (the child with amount 1 is the singleton) - no puzzles or solutions are downloaded
+# hops are looked up in bulk instead of one request per hop:
+#   - puzzle_hash: puzzle hash shared by every coin in the lineage (e.g., the router) - a single
+#     request returns all of them
+#   - marker_puzzle_hash: puzzle hash of a coin recreated by every singleton spend (e.g., a pair's
+#     XCH reserve) - its coin records give the heights of all hops, and the additions of those
+#     blocks contain the singleton coins; block headers are fetched in ranges, but additions still
+#     take one (parallel) request per hop, so n hops cost about n requests in n / BATCH_RPC_CONCURRENCY
+#     round trips
+# hops not found that way fall back to one get_coin_records_by_parent_ids request each
+# returns the coin records of every hop, starting with the given one; the last one is unspent
+# (or the singleton was melted)
+async def walk_singleton_lineage(full_node_client, coin_record, puzzle_hash=None, marker_puzzle_hash=None):
+    children = {} # parent coin id -> singleton child coin record
+    if coin_record.spent and (puzzle_hash is not None or marker_puzzle_hash is not None):
+        candidates = []
+        if puzzle_hash is not None:
+            candidates += await full_node_client.get_coin_records_by_puzzle_hash(
+                puzzle_hash, include_spent_coins=True, start_height=coin_record.spent_block_index
+            )
+        if marker_puzzle_hash is not None:
+            marker_records = await full_node_client.get_coin_records_by_puzzle_hash(
+                marker_puzzle_hash, include_spent_coins=True, start_height=coin_record.spent_block_index
+            )
+            candidates += await get_additions_by_heights(
+                full_node_client, [c.confirmed_block_index for c in marker_records]
+            )
+
+        for c in candidates:
+            if c.coin.amount == 1:
+                children.setdefault(c.coin.parent_coin_info, c)
+
+    lineage = [coin_record]
+    while coin_record.spent:
+        child = children.get(coin_record.coin.name())
+        if child is None:
+            records = await full_node_client.get_coin_records_by_parent_ids([coin_record.coin.name()], include_spent_coins=True)
+            singleton_children = [c for c in records if c.coin.amount == 1]
+            if len(singleton_children) == 0: # melted
+                break
+            child = singleton_children[0]
+
+        coin_record = child
+        lineage.append(coin_record)
+
+    return lineage
@@ -0,0 +1,67 @@
+import hashlib
+
+from clvm.casts import int_to_bytes
+
+# python port of include/curry_and_treehash.clib
+# computes tree hashes of curried puzzles from the module hash and
+# the (tree) hashes of the arguments, without building any Program
+
+ONE = bytes([1])
+TWO = bytes([2])
+Q_KW = bytes([1])
+A_KW = bytes([2])
+C_KW = bytes([4])
+
+
+def sha256(*args: bytes) -> bytes:
+    return hashlib.sha256(b"".join(args)).digest()
+
+
+def shatree_atom(atom: bytes) -> bytes:
+    return sha256(ONE, atom)
+
+
+def shatree_pair(left_hash: bytes, right_hash: bytes) -> bytes:
+    return sha256(TWO, left_hash, right_hash)
+
+
+def shatree_int(value: int) -> bytes:
+    return shatree_atom(int_to_bytes(value))
+
+
+Q_KW_TREEHASH = shatree_atom(Q_KW)
+A_KW_TREEHASH = shatree_atom(A_KW)
+C_KW_TREEHASH = shatree_atom(C_KW)
+ONE_TREEHASH = shatree_atom(ONE)
+NULL_TREEHASH = shatree_atom(b"")
+
+
+# tree hash of `(c (q . P) E)` given the hashes of P and E
+def update_hash_for_parameter_hash(parameter_hash: bytes, environment_hash: bytes) -> bytes:
+    return shatree_pair(
+        C_KW_TREEHASH,
+        shatree_pair(
+            shatree_pair(Q_KW_TREEHASH, parameter_hash),
+            shatree_pair(environment_hash, NULL_TREEHASH)
+        )
+    )
+
+
+# tree hash of `(a (q . F) E)` given the hashes of F and E
+def tree_hash_of_apply(function_hash: bytes, environment_hash: bytes) -> bytes:
+    return shatree_pair(
+        A_KW_TREEHASH,
+        shatree_pair(
+            shatree_pair(Q_KW_TREEHASH, function_hash),
+            shatree_pair(environment_hash, NULL_TREEHASH)
+        )
+    )
+
+
+# hashed_arguments are the tree hashes of the curried arguments, in normal (not reversed) order
+def curry_and_treehash(mod_hash: bytes, *hashed_arguments: bytes) -> bytes:
+    environment_hash = ONE_TREEHASH
+    for parameter_hash in reversed(hashed_arguments):
+        environment_hash = update_hash_for_parameter_hash(parameter_hash, environment_hash)
+
+    return tree_hash_of_apply(mod_hash, environment_hash)
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from collections import deque
+
+SPEND_BUNDLE_COST_CACHE_SIZE = 1024
+OPERATION_COST_SAMPLES = 100 # measured costs kept per operation
+OPERATION_COST_PERCENTILE = 0.9 # of the measured costs - one unusually heavy offer doesn't count
+OPERATION_COST_MAX_FACTOR = 2 # measured costs never raise an operation above this multiple of its benchmark
+OPERATION_COST_MARGIN = 1.25 # safety margin on top of the measured cost
+
+# from benchmarks; used until (and as a floor for) costs measured on our own spend bundles
+DEFAULT_OPERATION_COSTS = {
+    "add_liquidity": 250000000,
+    "remove_liquidity": 250000000,
+    "xch_to_token": 150000000,
+    "token_to_xch": 200000000,
+}
+
+
+# (cost, fee) of spend bundles, keyed by spend bundle name - computing them runs every puzzle
+# in the bundle, so each bundle is only simulated once
+class SpendBundleCostCache:
+    def __init__(self, max_size=SPEND_BUNDLE_COST_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(name)
+        return entry
+
+    def put(self, name, cost, fee):
+        self.entries[name] = (cost, fee)
+        self.entries.move_to_end(name)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+        }
+
+
+# cost of the spend bundles we build for each operation: a high percentile of the last
+# OPERATION_COST_SAMPLES measured costs, kept between the benchmark and OPERATION_COST_MAX_FACTOR
+# times the benchmark (measured bundles include the user's offer), plus a margin
+class OperationCostTable:
+    def __init__(
+        self,
+        default_costs=DEFAULT_OPERATION_COSTS,
+        samples=OPERATION_COST_SAMPLES,
+        margin=OPERATION_COST_MARGIN,
+        percentile=OPERATION_COST_PERCENTILE,
+        max_factor=OPERATION_COST_MAX_FACTOR
+    ):
+        self.default_costs = default_costs
+        self.margin = margin
+        self.percentile = percentile
+        self.max_factor = max_factor
+        self.measured = {operation: deque(maxlen=samples) for operation in default_costs.keys()}
+        self.costs = {}
+        for operation in default_costs.keys():
+            self._update(operation)
+
+    def _update(self, operation):
+        default_cost = self.default_costs[operation]
+        cost = default_cost
+        if len(self.measured[operation]) > 0:
+            measured = sorted(self.measured[operation])
+            cost = min(max(cost, measured[int(self.percentile * (len(measured) - 1))]), default_cost * self.max_factor)
+        self.costs[operation] = int(cost * self.margin)
+
+    def record(self, operation, cost):
+        self.measured[operation].append(cost)
+        self._update(operation)
+
+    # operation=None: the most expensive operation
+    def get(self, operation=None):
+        if operation is None:
+            return max(self.costs.values())
+        return self.costs[operation]
+
+    def stats(self):
+        return {
+            operation: {"cost": self.costs[operation], "samples": len(self.measured[operation])}
+            for operation in self.costs.keys()
+        }
@@ -0,0 +1,144 @@
+import math
+import time
+from bisect import bisect_right
+from collections import deque
+
+from chia.consensus.default_constants import DEFAULT_CONSTANTS
+
+FEE_ESTIMATOR_TARGETS = [60, 120, 300, 600] # seconds
+FEE_ESTIMATOR_WINDOW = 60 * 60 # seconds of confirmation history used
+FEE_ESTIMATOR_SUCCESS_RATE = 0.9 # share of past transactions that have to make the target
+FEE_ESTIMATOR_MIN_SAMPLES = 10 # fewer confirmations in a bucket range are ignored
+FEE_ESTIMATOR_MAX_AGE = 30 # seconds; older estimates are not trusted
+TRANSACTION_BLOCK_TIME = 52 # seconds; average time between transaction blocks
+# lower bounds of the fee per cost (mojo / cost) histogram buckets
+FEE_PER_COST_BUCKETS = [0, 1, 2, 3, 5, 7, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000]
+
+
+# fee per cost needed to get confirmed within each target time, kept up to date from mempool samples
+#   - confirmation-time stats: every transaction that leaves the mempool is assumed to have been
+#     confirmed; the time it spent there is recorded in its fee per cost bucket
+#   - mempool histogram: total cost waiting in each bucket - if more cost than fits in the blocks
+#     made before the target is waiting above a bucket, that bucket won't make it (congestion)
+# estimates are recomputed on every sample, so answering a fee request is a dict lookup
+class FeeEstimator:
+    def __init__(
+        self,
+        targets=FEE_ESTIMATOR_TARGETS,
+        window=FEE_ESTIMATOR_WINDOW,
+        success_rate=FEE_ESTIMATOR_SUCCESS_RATE,
+        min_samples=FEE_ESTIMATOR_MIN_SAMPLES,
+        block_cost=DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM // 2, # farmers fill blocks up to half the max cost
+        block_time=TRANSACTION_BLOCK_TIME
+    ):
+        self.targets = sorted(targets)
+        self.window = window
+        self.success_rate = success_rate
+        self.min_samples = min_samples
+        self.block_cost = block_cost
+        self.block_time = block_time
+        # tx id -> (first seen, fee per cost); first seen is None for transactions that were already
+        # in the mempool when sampling started (their wait time is unknown)
+        self.tracked = {}
+        self.confirmations = deque() # (time left the mempool, bucket, seconds spent in the mempool)
+        self.mempool_histogram = [0] * len(FEE_PER_COST_BUCKETS) # bucket -> total cost waiting
+        self.fee_rates = {target: 0 for target in self.targets} # target -> fee per cost
+        self.last_sample = None
+
+    # costs: tx id -> (cost, fee) of every transaction currently in the mempool (MempoolIndex.costs)
+    def sample(self, costs, now=None):
+        now = now or time.time()
+        first_seen = None if self.last_sample is None else now
+
+        for tx_id, (cost, fee) in costs.items():
+            if tx_id not in self.tracked and cost > 0:
+                self.tracked[tx_id] = (first_seen, fee / cost)
+
+        for tx_id in [tx_id for tx_id in self.tracked.keys() if tx_id not in costs]:
+            seen, fee_per_cost = self.tracked.pop(tx_id)
+            if seen is not None:
+                self.confirmations.append((now, get_bucket(fee_per_cost), now - seen))
+
+        while len(self.confirmations) > 0 and self.confirmations[0][0] < now - self.window:
+            self.confirmations.popleft()
+
+        self.mempool_histogram = [0] * len(FEE_PER_COST_BUCKETS)
+        for tx_id, (cost, fee) in costs.items():
+            if cost > 0:
+                self.mempool_histogram[get_bucket(fee / cost)] += cost
+
+        self.fee_rates = self._estimate()
+        self.last_sample = now
+
+    def _estimate(self):
+        # confirmations per bucket (in total and within each target), then summed from the top bucket down
+        # so index i covers every transaction paying at least FEE_PER_COST_BUCKETS[i]
+        total = [0] * len(FEE_PER_COST_BUCKETS)
+        within = {target: [0] * len(FEE_PER_COST_BUCKETS) for target in self.targets}
+        for _, bucket, wait in self.confirmations:
+            total[bucket] += 1
+            for target in self.targets:
+                if wait <= target:
+                    within[target][bucket] += 1
+
+        for i in range(len(FEE_PER_COST_BUCKETS) - 2, -1, -1):
+            total[i] += total[i + 1]
+            for target in self.targets:
+                within[target][i] += within[target][i + 1]
+
+        fee_rates = {}
+        for target in self.targets:
+            fee_rates[target] = max(
+                self._history_fee_rate(total, within[target]),
+                self._congestion_fee_rate(target)
+            )
+        return fee_rates
+
+    # lowest bucket whose transactions (and the ones paying more) made the target often enough
+    def _history_fee_rate(self, total, within):
+        if total[0] < self.min_samples:
+            return 0
+
+        for i in range(len(FEE_PER_COST_BUCKETS)):
+            if total[i] < self.min_samples:
+                break
+            if within[i] / total[i] >= self.success_rate:
+                return FEE_PER_COST_BUCKETS[i]
+        return FEE_PER_COST_BUCKETS[-1]
+
+    # fee per cost needed to outbid everything that won't fit in the blocks made before the target
+    def _congestion_fee_rate(self, target):
+        capacity = max(1, target // self.block_time) * self.block_cost
+        waiting = 0
+        for i in range(len(FEE_PER_COST_BUCKETS) - 1, -1, -1):
+            waiting += self.mempool_histogram[i]
+            if waiting >= capacity:
+                return FEE_PER_COST_BUCKETS[min(i + 1, len(FEE_PER_COST_BUCKETS) - 1)]
+        return 0
+
+    def is_fresh(self, max_age=FEE_ESTIMATOR_MAX_AGE):
+        return self.last_sample is not None and time.time() - self.last_sample <= max_age
+
+    # target_time: seconds; the estimate for the smallest configured target that is >= target_time
+    # (the biggest target if none is)
+    def get_fee_per_cost(self, target_time=0):
+        for target in self.targets:
+            if target >= target_time:
+                return self.fee_rates[target]
+        return self.fee_rates[self.targets[-1]]
+
+    def get_fee(self, cost, target_time=0):
+        return math.ceil(self.get_fee_per_cost(target_time) * cost)
+
+    def stats(self):
+        return {
+            "last_sample": self.last_sample,
+            "tracked": len(self.tracked),
+            "confirmations": len(self.confirmations),
+            "fee_per_cost": self.fee_rates,
+            "mempool_histogram": dict(zip(FEE_PER_COST_BUCKETS, self.mempool_histogram)),
+        }
+
+
+def get_bucket(fee_per_cost):
+    return bisect_right(FEE_PER_COST_BUCKETS, fee_per_cost) - 1
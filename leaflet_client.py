@@ -1,17 +1,56 @@
 # special thanks to the Goby team for this!
+import asyncio
+import json
+import os
+
 import aiohttp
 from chia.rpc.full_node_rpc_client import FullNodeRpcClient
 import time
 
+LEAFLET_POOL_SIZE = int(os.environ.get("LEAFLET_POOL_SIZE", "100"))
+LEAFLET_POOL_SIZE_PER_HOST = int(os.environ.get("LEAFLET_POOL_SIZE_PER_HOST", "32"))
+LEAFLET_KEEPALIVE_TIMEOUT = float(os.environ.get("LEAFLET_KEEPALIVE_TIMEOUT", "30"))
+LEAFLET_CONNECT_TIMEOUT = float(os.environ.get("LEAFLET_CONNECT_TIMEOUT", "10"))
+LEAFLET_REQUEST_TIMEOUT = float(os.environ.get("LEAFLET_REQUEST_TIMEOUT", "30"))
+LEAFLET_MAX_RETRIES = int(os.environ.get("LEAFLET_MAX_RETRIES", "3"))
+LEAFLET_RETRY_BACKOFF = float(os.environ.get("LEAFLET_RETRY_BACKOFF", "0.25")) # seconds; doubled after each retry
+
+# requests that change state - never retried or coalesced
+NON_IDEMPOTENT_PATHS = ["push_tx"]
+
 class LeafletFullNodeRpcClient(FullNodeRpcClient):
-    def __init__(self, leaflet_url):
+    def __init__(
+        self,
+        leaflet_url,
+        pool_size=LEAFLET_POOL_SIZE,
+        pool_size_per_host=LEAFLET_POOL_SIZE_PER_HOST,
+        keepalive_timeout=LEAFLET_KEEPALIVE_TIMEOUT,
+        connect_timeout=LEAFLET_CONNECT_TIMEOUT,
+        request_timeout=LEAFLET_REQUEST_TIMEOUT,
+        max_retries=LEAFLET_MAX_RETRIES,
+        retry_backoff=LEAFLET_RETRY_BACKOFF
+    ):
         self.leaflet_url = leaflet_url
         super().__init__()
-        self.session = aiohttp.ClientSession()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=pool_size,
+                limit_per_host=pool_size_per_host,
+                keepalive_timeout=keepalive_timeout
+            ),
+            timeout=aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        )
         self.closing_task = None
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.in_flight = {} # (path, request json) -> task; identical concurrent reads share one request
+        self.requests_sent = 0
+        self.requests_coalesced = 0
+        self.retries = 0
 
 
-    async def fetch(self, path, request_json):
+    async def _post(self, path, request_json):
+        self.requests_sent += 1
         async with self.session.post(self.leaflet_url + path, json=request_json) as response:
             response.raise_for_status()
 
@@ -20,3 +59,46 @@ class LeafletFullNodeRpcClient(FullNodeRpcClient):
                 raise ValueError(res_json)
             return res_json
 
+
+    async def _post_with_retry(self, path, request_json):
+        attempt = 0
+        while True:
+            try:
+                return await self._post(path, request_json)
+            except aiohttp.ClientResponseError as e:
+                # client errors (other than rate limiting) won't go away by retrying
+                if (e.status < 500 and e.status != 429) or attempt >= self.max_retries:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+            self.retries += 1
+
+
+    async def fetch(self, path, request_json):
+        if path in NON_IDEMPOTENT_PATHS:
+            return await self._post(path, request_json)
+
+        key = (path, json.dumps(request_json, sort_keys=True))
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._post_with_retry(path, request_json))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.requests_coalesced += 1
+
+        # a cancelled caller must not cancel the request other callers are waiting on
+        return await asyncio.shield(task)
+
+
+    def stats(self):
+        return {
+            "requests_sent": self.requests_sent,
+            "requests_coalesced": self.requests_coalesced,
+            "retries": self.retries,
+            "in_flight": len(self.in_flight),
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import sqlite3
+import threading
+
+from chia.types.coin_spend import CoinSpend
+
+# local record of singleton (pair) lineages, shared by the API and the CLI
+# every row is one singleton coin: who created it, when it was spent,
+# the pair state it holds and the spend that created it
+# history is sparse: state and creation_spend are only recorded for coins whose creation spend was
+# decoded (every hop the block follower sees, the latest coin of each sync_pair catch-up); hops
+# skipped by a catch-up (walked or fast-forwarded over) have them set to None or are missing entirely
+# executor: if given, reads and writes run there (one transaction per write) instead of blocking
+# the event loop
+LINEAGE_DB_PATH = os.path.join(os.path.expanduser(os.environ.get("TIBET_DATA_DIR", "~/.tibet")), "lineage.db")
+
+
+class LineageStore:
+    def __init__(self, path=LINEAGE_DB_PATH, executor=None):
+        self.executor = executor
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS singleton_coins (
+                coin_id TEXT PRIMARY KEY,
+                launcher_id TEXT NOT NULL,
+                parent_id TEXT NOT NULL,
+                confirmed_height INTEGER,
+                spent_height INTEGER,
+                liquidity INTEGER,
+                xch_reserve INTEGER,
+                token_reserve INTEGER,
+                creation_spend BLOB
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS singleton_coins_launcher ON singleton_coins (launcher_id, confirmed_height)")
+        self.db.commit()
+
+    # coins: list of (launcher_id, coin, creation_spend, state, confirmed_height), oldest first
+    async def add_coins(self, coins):
+        if len(coins) == 0:
+            return
+
+        rows = [
+            (
+                coin.name().hex(),
+                launcher_id.hex(),
+                coin.parent_coin_info.hex(),
+                confirmed_height,
+                state["liquidity"] if state is not None else None,
+                state["xch_reserve"] if state is not None else None,
+                state["token_reserve"] if state is not None else None,
+                bytes(creation_spend) if creation_spend is not None else None,
+            )
+            for launcher_id, coin, creation_spend, state, confirmed_height in coins
+        ]
+        await self._run(self._write, rows)
+
+    async def _run(self, f, *args):
+        if self.executor is None:
+            return f(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, f, *args)
+
+    def _write(self, rows):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO singleton_coins VALUES (?, ?, ?, ?, NULL, ?, ?, ?, ?)", rows)
+            # the parents were spent to create these coins
+            self.db.executemany(
+                "UPDATE singleton_coins SET spent_height = ? WHERE coin_id = ?",
+                [(row[3], row[2]) for row in rows]
+            )
+            self.db.commit()
+
+    # forgets the coins of launcher_id confirmed at or after height (reorged out); their parents
+    # become unspent again
+    async def truncate(self, launcher_id, height):
+        await self._run(self._truncate, launcher_id, height)
+
+    def _truncate(self, launcher_id, height):
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM singleton_coins WHERE launcher_id = ? AND confirmed_height >= ?",
+                (launcher_id.hex(), height)
+            )
+            self.db.execute(
+                "UPDATE singleton_coins SET spent_height = NULL WHERE launcher_id = ? AND spent_height >= ?",
+                (launcher_id.hex(), height)
+            )
+            self.db.commit()
+
+    async def get_launcher_id(self, coin_id):
+        return await self._run(self._get_launcher_id_locked, coin_id)
+
+    def _get_launcher_id_locked(self, coin_id):
+        with self.lock:
+            return self._get_launcher_id(coin_id)
+
+    def _get_launcher_id(self, coin_id):
+        if self.db.execute("SELECT 1 FROM singleton_coins WHERE launcher_id = ? LIMIT 1", (coin_id.hex(),)).fetchone() is not None:
+            return coin_id
+
+        row = self.db.execute("SELECT launcher_id FROM singleton_coins WHERE coin_id = ?", (coin_id.hex(),)).fetchone()
+        if row is None:
+            return None
+        return bytes.fromhex(row["launcher_id"])
+
+    def _row_to_dict(self, row):
+        return {
+            "coin_id": bytes.fromhex(row["coin_id"]),
+            "launcher_id": bytes.fromhex(row["launcher_id"]),
+            "parent_id": bytes.fromhex(row["parent_id"]),
+            "confirmed_height": row["confirmed_height"],
+            "spent_height": row["spent_height"],
+            "state": None if row["liquidity"] is None else {
+                "liquidity": row["liquidity"],
+                "xch_reserve": row["xch_reserve"],
+                "token_reserve": row["token_reserve"]
+            },
+            "creation_spend": None if row["creation_spend"] is None else CoinSpend.from_bytes(row["creation_spend"]),
+        }
+
+    # coin_id can be the launcher id or the id of any recorded coin in the lineage
+    async def get_latest(self, coin_id):
+        return await self._run(self._get_latest, coin_id)
+
+    def _get_latest(self, coin_id):
+        with self.lock:
+            launcher_id = self._get_launcher_id(coin_id)
+            if launcher_id is None:
+                return None
+
+            row = self.db.execute(
+                "SELECT * FROM singleton_coins WHERE launcher_id = ? ORDER BY confirmed_height DESC, rowid DESC LIMIT 1",
+                (launcher_id.hex(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_dict(row)
+
+    # recorded coins of launcher_id, oldest first - see above for why it may have gaps
+    async def get_history(self, launcher_id, min_height=0):
+        return await self._run(self._get_history, launcher_id, min_height)
+
+    def _get_history(self, launcher_id, min_height):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM singleton_coins WHERE launcher_id = ? AND confirmed_height >= ? ORDER BY confirmed_height ASC, rowid ASC",
+                (launcher_id.hex(), min_height)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
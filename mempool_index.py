@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from chia.types.spend_bundle import SpendBundle
+
+MEMPOOL_INDEX_FETCH_CONCURRENCY = 8
+MEMPOOL_INDEX_MAX_AGE = 30 # seconds; older indexes are not trusted
+
+
+# incrementally-maintained view of the mempool
+# each refresh only downloads & deserializes items that weren't seen before
+class MempoolIndex:
+    def __init__(self, fetch_concurrency=MEMPOOL_INDEX_FETCH_CONCURRENCY):
+        self.fetch_concurrency = fetch_concurrency
+        self.items = {} # tx id -> SpendBundle
+        self.costs = {} # tx id -> (cost, fee), as reported by the node
+        self.tx_id_by_coin_id = {} # spent coin id -> tx id
+        self.tx_id_by_parent_coin_id = {} # parent coin id of a spent coin -> tx id
+        self.last_refresh = None
+
+    def _add(self, tx_id, sb, cost=None, fee=None):
+        self.items[tx_id] = sb
+        if cost is not None and fee is not None:
+            self.costs[tx_id] = (cost, fee)
+        for cs in sb.coin_spends:
+            self.tx_id_by_coin_id[cs.coin.name()] = tx_id
+            self.tx_id_by_parent_coin_id[cs.coin.parent_coin_info] = tx_id
+
+    def _remove(self, tx_id):
+        sb = self.items.pop(tx_id)
+        self.costs.pop(tx_id, None)
+        for cs in sb.coin_spends:
+            coin_id = cs.coin.name()
+            if self.tx_id_by_coin_id.get(coin_id) == tx_id:
+                del self.tx_id_by_coin_id[coin_id]
+            if self.tx_id_by_parent_coin_id.get(cs.coin.parent_coin_info) == tx_id:
+                del self.tx_id_by_parent_coin_id[cs.coin.parent_coin_info]
+
+    async def _fetch_item(self, full_node_client, semaphore, tx_id):
+        async with semaphore:
+            item = await full_node_client.get_mempool_item_by_tx_id(tx_id)
+        if item is None: # left the mempool in the meantime
+            return tx_id, None, None, None
+        return tx_id, SpendBundle.from_json_dict(item["spend_bundle"]), item.get("cost"), item.get("fee")
+
+    async def refresh(self, full_node_client):
+        tx_ids = set(await full_node_client.get_all_mempool_tx_ids())
+
+        for tx_id in [tx_id for tx_id in self.items.keys() if tx_id not in tx_ids]:
+            self._remove(tx_id)
+
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        new_items = await asyncio.gather(*[
+            self._fetch_item(full_node_client, semaphore, tx_id) for tx_id in tx_ids if tx_id not in self.items
+        ])
+        for tx_id, sb, cost, fee in new_items:
+            if sb is not None:
+                self._add(tx_id, sb, cost, fee)
+
+        self.last_refresh = time.time()
+
+    def is_fresh(self, max_age=MEMPOOL_INDEX_MAX_AGE):
+        return self.last_refresh is not None and time.time() - self.last_refresh <= max_age
+
+    def get_spend_bundle_by_coin_id(self, coin_id):
+        tx_id = self.tx_id_by_coin_id.get(coin_id)
+        return None if tx_id is None else self.items[tx_id]
+
+    # returns (cost, fee) of the mempool item spending coin_id, or None if unknown
+    def get_cost_and_fee_by_coin_id(self, coin_id):
+        tx_id = self.tx_id_by_coin_id.get(coin_id)
+        return None if tx_id is None else self.costs.get(tx_id)
+
+    def get_spend_bundle_by_parent_coin_id(self, parent_coin_id):
+        tx_id = self.tx_id_by_parent_coin_id.get(parent_coin_id)
+        return None if tx_id is None else self.items[tx_id]
+
+    def stats(self):
+        return {
+            "items": len(self.items),
+            "indexed_coins": len(self.tx_id_by_coin_id),
+            "last_refresh": self.last_refresh,
+        }
@@ -0,0 +1,99 @@
+import hashlib
+from collections import OrderedDict
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import INFINITE_COST
+from chia.types.condition_opcodes import ConditionOpcode
+from chia.util.condition_tools import conditions_dict_for_solution
+from chia.util.hash import std_hash
+from chia.wallet.trading.offer import Offer
+from clvm import SExp
+
+OFFER_ANALYSIS_CACHE_SIZE = 256
+
+
+# everything the offer responders need from an offer, extracted with a single decode & CLVM pass
+#   coin_spends: offered coin spends (without the 'hints' for requested coins)
+#   created_coins: (coin, creation coin spend) for every coin created by the offered spends
+#   announcement_asserts: asserts for every coin announcement made by the offered spends
+# treat as read-only - instances are shared through the cache
+class OfferAnalysis:
+    def __init__(self, offer_str):
+        self.offer = Offer.from_bech32(offer_str)
+        self.spend_bundle = self.offer.to_spend_bundle()
+        self.requested_amounts = self.offer.get_requested_amounts()
+        self.requested_payments = self.offer.get_requested_payments()
+
+        self.coin_spends = []
+        self.created_coins = []
+        self.announcement_asserts = []
+        for coin_spend in self.spend_bundle.coin_spends:
+            if coin_spend.coin.parent_coin_info == b"\x00" * 32: # 'hint' for offer requested coin
+                continue
+
+            self.coin_spends.append(coin_spend)
+            conditions_dict = conditions_dict_for_solution(
+                coin_spend.puzzle_reveal,
+                coin_spend.solution,
+                INFINITE_COST
+            )
+
+            for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []): #cwa = condition with args
+                self.created_coins.append((
+                    Coin(coin_spend.coin.name(), cwa.vars[0], SExp.to(cwa.vars[1]).as_int()),
+                    coin_spend
+                ))
+
+            for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN_ANNOUNCEMENT, []):
+                self.announcement_asserts.append([
+                    ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT,
+                    std_hash(coin_spend.coin.name() + cwa.vars[0])
+                ])
+
+    # returns (coin, creation coin spend) of the last created coin with one of the given puzzle
+    # hashes (ephemeral coins), or (None, None)
+    def get_created_coin(self, *puzzle_hashes):
+        for coin, coin_spend in reversed(self.created_coins):
+            if coin.puzzle_hash in puzzle_hashes:
+                return coin, coin_spend
+        return None, None
+
+    # amount of the (single) requested asset; 0 if nothing is requested
+    def get_requested_amount(self):
+        requested_amount = 0
+        for v in self.requested_amounts.values():
+            requested_amount = v
+        return requested_amount
+
+
+# bounded LRU cache keyed by the hash of the bech32 offer string, so retries & re-submissions
+# of the same offer skip decompression and CLVM
+class OfferAnalysisCache:
+    def __init__(self, max_size=OFFER_ANALYSIS_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, offer_str):
+        key = hashlib.sha256(offer_str.encode()).digest()
+        analysis = self.entries.get(key)
+        if analysis is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return analysis
+
+        self.misses += 1
+        analysis = OfferAnalysis(offer_str)
+        self.entries[key] = analysis
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return analysis
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,104 @@
+import time
+from bisect import bisect_right, insort
+from collections import deque
+
+PAIR_INDEX_SORT_KEYS = ["xch_reserve", "token_reserve", "liquidity", "volume"]
+PAIR_VOLUME_WINDOW = 24 * 60 * 60 # seconds
+
+
+# in-memory copy of all pairs, kept sorted (descending) by every key in PAIR_INDEX_SORT_KEYS
+# so a page costs O(log n + limit) instead of loading and sorting every pair
+#   volume: XCH moved by swaps (state changes that keep liquidity constant) observed
+#           during the last PAIR_VOLUME_WINDOW seconds; starts at 0 when the process starts
+class PairIndex:
+    def __init__(self, volume_window=PAIR_VOLUME_WINDOW):
+        self.volume_window = volume_window
+        self.pairs = {} # launcher id -> pair dict (schemas.Pair fields)
+        self.volume = {} # launcher id -> current volume
+        self.trades = {} # launcher id -> deque of (time, xch amount)
+        self.sorted = {key: [] for key in PAIR_INDEX_SORT_KEYS} # key -> sorted list of (-value, launcher id)
+
+    def _sort_value(self, launcher_id, key):
+        if key == "volume":
+            return self.volume.get(launcher_id, 0)
+        return self.pairs[launcher_id][key]
+
+    def _unlink(self, launcher_id):
+        for key, entries in self.sorted.items():
+            entry = (-self._sort_value(launcher_id, key), launcher_id)
+            i = bisect_right(entries, entry) - 1
+            if i >= 0 and entries[i] == entry:
+                del entries[i]
+
+    def _link(self, launcher_id):
+        for key, entries in self.sorted.items():
+            insort(entries, (-self._sort_value(launcher_id, key), launcher_id))
+
+    def _set_volume(self, launcher_id, volume):
+        if self.volume.get(launcher_id, 0) == volume:
+            return
+
+        entries = self.sorted["volume"]
+        old_entry = (-self.volume.get(launcher_id, 0), launcher_id)
+        del entries[bisect_right(entries, old_entry) - 1]
+        self.volume[launcher_id] = volume
+        insort(entries, (-volume, launcher_id))
+
+    def expire_volume(self, now=None):
+        now = now or time.time()
+        for launcher_id, trades in self.trades.items():
+            volume = self.volume.get(launcher_id, 0)
+            while len(trades) > 0 and trades[0][0] < now - self.volume_window:
+                volume -= trades.popleft()[1]
+            self._set_volume(launcher_id, volume)
+
+    def update(self, pair, now=None):
+        launcher_id = pair["launcher_id"]
+        old_pair = self.pairs.get(launcher_id)
+        if old_pair is not None:
+            self._unlink(launcher_id)
+
+        self.pairs[launcher_id] = pair
+        self._link(launcher_id)
+
+        if old_pair is not None and old_pair["liquidity"] == pair["liquidity"]:
+            amount = abs(pair["xch_reserve"] - old_pair["xch_reserve"])
+            if amount > 0:
+                self.trades.setdefault(launcher_id, deque()).append((now or time.time(), amount))
+                self._set_volume(launcher_id, self.volume.get(launcher_id, 0) + amount)
+
+    # cursor: value returned as next_cursor by the previous page (None for the first page)
+    # returns (pairs, next_cursor); next_cursor is None on the last page
+    def page(self, sort_by="xch_reserve", limit=10, cursor=None, asset_id_prefix=None, skip=0):
+        if sort_by == "volume":
+            self.expire_volume()
+
+        entries = self.sorted[sort_by]
+        i = 0
+        if cursor is not None:
+            value, launcher_id = cursor.split(":")
+            i = bisect_right(entries, (-int(value), launcher_id))
+
+        # note: with an asset id prefix, pairs that don't match are scanned and skipped
+        result = []
+        while i < len(entries) and len(result) < limit:
+            pair = self.pairs[entries[i][1]]
+            i += 1
+            if asset_id_prefix is not None and not pair["asset_id"].startswith(asset_id_prefix):
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            result.append(pair)
+
+        next_cursor = None
+        if i < len(entries) and len(result) == limit:
+            value, launcher_id = entries[i - 1]
+            next_cursor = f"{-value}:{launcher_id}"
+        return result, next_cursor
+
+    def stats(self):
+        return {
+            "pairs": len(self.pairs),
+            "pairs_with_volume": len([v for v in self.volume.values() if v > 0]),
+        }
@@ -1,10 +1,12 @@
 import asyncio
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List
 
-from blspy import AugSchemeMPL, PrivateKey
+from blspy import AugSchemeMPL, G1Element, PrivateKey
 from cdv.cmds.rpc import get_client
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 from chia.rpc.full_node_rpc_client import FullNodeRpcClient
@@ -58,53 +60,137 @@ async def get_private_key_DO_NOT_CALL_OUTSIDE_THIS_FILE(wallet_client):
     sk_hex = sk_resp['sk']
     return PrivateKey.from_bytes(bytes.fromhex(sk_hex))
 
-async def get_standard_coin_puzzle(wallet_client, std_coin):
-    master_sk = await get_private_key_DO_NOT_CALL_OUTSIDE_THIS_FILE(wallet_client)
+# puzzle hash -> (derivation index, synthetic public key) for the first DERIVATION_INDEX_MAX
+# unhardened wallet keys, built lazily in batches and saved to derivation_index.[fingerprint].json
+# in DERIVATION_INDEX_DIR (public information only - secret keys are re-derived from the index when
+# needed - but it links every wallet address to the fingerprint, so keep it out of the working tree)
+DERIVATION_INDEX_DIR = os.path.expanduser(os.environ.get("TIBET_DATA_DIR", "~/.tibet"))
+DERIVATION_INDEX_MAX = 10000
+DERIVATION_INDEX_BATCH_SIZE = 500
+# number of processes used to derive a batch; 0 = derive in this process
+DERIVATION_INDEX_PROCESSES = int(os.environ.get("TIBET_DERIVATION_PROCESSES", "0"))
+
+def derive_standard_puzzle_hashes(master_sk_bytes, start, end):
+    master_sk = PrivateKey.from_bytes(master_sk_bytes)
 
-    i = 0
-    while i < 10000:
+    derived = []
+    for i in range(start, end):
         wallet_sk = master_sk_to_wallet_sk_unhardened(master_sk, i)
         synth_secret_key = calculate_synthetic_secret_key(wallet_sk, DEFAULT_HIDDEN_PUZZLE_HASH)
         synth_key = synth_secret_key.get_g1()
-        puzzle = puzzle_for_synthetic_public_key(synth_key)
-        puzzle_hash = puzzle.get_tree_hash()            
-        if puzzle_hash == std_coin.puzzle_hash:
-            return puzzle
-        i += 1
+        puzzle_hash = puzzle_for_synthetic_public_key(synth_key).get_tree_hash()
+        derived.append((i, puzzle_hash.hex(), bytes(synth_key).hex()))
+
+    return derived
+
+class DerivationIndex:
+    def __init__(self, fingerprint):
+        self.path = os.path.join(DERIVATION_INDEX_DIR, f"derivation_index.{fingerprint}.json")
+        self.entries = {} # puzzle hash -> (index, synthetic public key)
+        self.next_index = 0
+
+        if os.path.isfile(self.path):
+            data = json.loads(open(self.path, "r").read())
+            self.next_index = data["next_index"]
+            for ph, (index, synth_key) in data["entries"].items():
+                self.entries[bytes32.from_hexstr(ph)] = (index, G1Element.from_bytes(bytes.fromhex(synth_key)))
+
+    def save(self):
+        entries = {}
+        for ph, (index, synth_key) in self.entries.items():
+            entries[ph.hex()] = (index, bytes(synth_key).hex())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        open(self.path, "w").write(json.dumps({"next_index": self.next_index, "entries": entries}))
+
+    def extend(self, master_sk, count=DERIVATION_INDEX_BATCH_SIZE):
+        start = self.next_index
+        end = min(start + count, DERIVATION_INDEX_MAX)
+        if start >= end:
+            return False
+
+        if DERIVATION_INDEX_PROCESSES > 0:
+            step = (end - start + DERIVATION_INDEX_PROCESSES - 1) // DERIVATION_INDEX_PROCESSES
+            ranges = [(i, min(i + step, end)) for i in range(start, end, step)]
+            with ProcessPoolExecutor(DERIVATION_INDEX_PROCESSES) as executor:
+                results = executor.map(
+                    derive_standard_puzzle_hashes,
+                    [bytes(master_sk)] * len(ranges),
+                    [r[0] for r in ranges],
+                    [r[1] for r in ranges]
+                )
+                derived = [d for result in results for d in result]
+        else:
+            derived = derive_standard_puzzle_hashes(bytes(master_sk), start, end)
 
-    return None
+        for i, ph, synth_key in derived:
+            self.entries[bytes32.from_hexstr(ph)] = (i, G1Element.from_bytes(bytes.fromhex(synth_key)))
+        self.next_index = end
+        self.save()
+        return True
+
+    # returns puzzle hash -> (index, synthetic public key) for the given puzzle hashes that belong to the wallet
+    # the index is only extended until at least min_matches matches are found
+    def find(self, master_sk, puzzle_hashes, min_matches=1):
+        puzzle_hashes = set(puzzle_hashes)
+        while True:
+            matches = {ph: self.entries[ph] for ph in puzzle_hashes if ph in self.entries}
+            if len(matches) >= min_matches or len(matches) == len(puzzle_hashes):
+                return matches
+            if not self.extend(master_sk):
+                return matches
+
+derivation_indexes = {}
+
+def get_derivation_index(master_sk):
+    fingerprint = master_sk.get_g1().get_fingerprint()
+    if derivation_indexes.get(fingerprint) is None:
+        derivation_indexes[fingerprint] = DerivationIndex(fingerprint)
+
+    return derivation_indexes[fingerprint]
+
+def get_synthetic_secret_key(master_sk, index):
+    wallet_sk = master_sk_to_wallet_sk_unhardened(master_sk, index)
+    return calculate_synthetic_secret_key(wallet_sk, DEFAULT_HIDDEN_PUZZLE_HASH)
+
+async def get_standard_coin_puzzle(wallet_client, std_coin):
+    master_sk = await get_private_key_DO_NOT_CALL_OUTSIDE_THIS_FILE(wallet_client)
+
+    matches = get_derivation_index(master_sk).find(master_sk, [std_coin.puzzle_hash])
+    if std_coin.puzzle_hash not in matches:
+        return None
+
+    _, synth_key = matches[std_coin.puzzle_hash]
+    return puzzle_for_synthetic_public_key(synth_key)
 
 async def sign_spend_bundle(wallet_client, sb, additional_data=DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA, no_max_keys = 1):
     master_sk = await get_private_key_DO_NOT_CALL_OUTSIDE_THIS_FILE(wallet_client)
 
     puzzle_hashes = [c.coin.puzzle_hash for c in sb.coin_spends]
-    keys_used = 0
-    i = 0
-    while i < 10000:
-        wallet_sk = master_sk_to_wallet_sk_unhardened(master_sk, i)
-        synth_secret_key = calculate_synthetic_secret_key(wallet_sk, DEFAULT_HIDDEN_PUZZLE_HASH)
-        synth_key = synth_secret_key.get_g1()
-        puzzle = puzzle_for_synthetic_public_key(synth_key)
-        puzzle_hash = puzzle.get_tree_hash()            
-        if puzzle_hash in puzzle_hashes:
-            keys_used += 1
-            async def pk_to_sk(pk):
-                return synth_secret_key
-
-            sig_old = sb.aggregated_signature
-            sb = await sign_coin_spends(
-                sb.coin_spends,
-                pk_to_sk,
-                additional_data,
-                DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
-            )
-
-            new_agg_sig = AugSchemeMPL.aggregate([sig_old, sb.aggregated_signature])
-            sb = SpendBundle(sb.coin_spends, new_agg_sig)
-
-        if keys_used >= no_max_keys:
-            return sb
-        i += 1
+    matches = get_derivation_index(master_sk).find(master_sk, puzzle_hashes, min_matches=no_max_keys)
+
+    # collect the synthetic secret keys of the first no_max_keys matching keys (in derivation order)
+    # and sign every AGG_SIG condition of the bundle in a single pass
+    indexes = sorted(index for index, _ in matches.values())[:no_max_keys]
+    secret_keys = {}
+    for index in indexes:
+        synth_secret_key = get_synthetic_secret_key(master_sk, index)
+        secret_keys[bytes(synth_secret_key.get_g1())] = synth_secret_key
+
+    if len(secret_keys) == 0:
+        return sb
+
+    async def pk_to_sk(pk):
+        return secret_keys.get(bytes(pk))
+
+    signed_sb = await sign_coin_spends(
+        sb.coin_spends,
+        pk_to_sk,
+        additional_data,
+        DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+    )
+
+    new_agg_sig = AugSchemeMPL.aggregate([sb.aggregated_signature, signed_sb.aggregated_signature])
+    sb = SpendBundle(sb.coin_spends, new_agg_sig)
 
     return sb
 
@@ -0,0 +1,70 @@
+import hashlib
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = 4096
+
+
+# serialized JSON responses of the read endpoints, kept until the data behind them changes
+# every entry is tagged with what it depends on (e.g., "pairs", "pair:<launcher id>");
+# invalidating a tag drops every entry that carries it
+# bounded: the least recently used entry is dropped once max_size is exceeded
+class ResponseCache:
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict() # key -> (body, etag, tags, headers)
+        self.keys_by_tag = {} # tag -> set of keys
+        self.generation = 0 # bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0], entry[1], entry[3]
+
+    # generation: value of self.generation before the body was computed - if anything was
+    # invalidated in the meantime, the (possibly stale) body is returned but not cached
+    def put(self, key, body, tags, generation, headers={}):
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if generation != self.generation:
+            return body, etag, headers
+
+        self._remove(key)
+        self.entries[key] = (body, etag, tags, headers)
+        for tag in tags:
+            self.keys_by_tag.setdefault(tag, set()).add(key)
+
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+        return body, etag, headers
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        for tag in entry[2]:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self.keys_by_tag[tag]
+
+    def invalidate(self, *tags):
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.keys_by_tag.get(tag, set())):
+                self._remove(key)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
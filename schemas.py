@@ -1,6 +1,6 @@
 # schemas.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
 class TokenBase(BaseModel):
@@ -47,12 +47,41 @@ class Quote(BaseModel):
     input_reserve: int
     output_reserve: int
 
+class QuoteRequest(BaseModel):
+    pair_id: str
+    amount_in: Optional[int] = None
+    amount_out: Optional[int] = None
+    xch_is_input: bool = True
+
+class DepthLevel(BaseModel):
+    price_impact: float
+    amount_in: int
+    amount_out: int
+
+class Depth(BaseModel):
+    pair_id: str
+    xch_reserve: int
+    token_reserve: int
+    xch_to_token: List[DepthLevel]
+    token_to_xch: List[DepthLevel]
+
+class FeeEstimate(BaseModel):
+    target_time: int
+    fee_per_cost: float
+    fee: int
+
 class OfferResponse(BaseModel):
     success: bool
     message: str
-    offer_id: str
+    offer_id: str # name of the pushed spend bundle (empty if it wasn't pushed) - offers are submitted to dexie in the background
 
 class ActionType(Enum):
     SWAP = "SWAP"
     ADD_LIQUIDITY = "ADD_LIQUIDITY"
     REMOVE_LIQUIDITY = "REMOVE_LIQUIDITY"
+
+class OperationType(Enum):
+    ADD_LIQUIDITY = "add_liquidity"
+    REMOVE_LIQUIDITY = "remove_liquidity"
+    XCH_TO_TOKEN = "xch_to_token"
+    TOKEN_TO_XCH = "token_to_xch"
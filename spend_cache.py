@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+from chia.types.blockchain_format.program import INFINITE_COST
+from chia.util.condition_tools import conditions_dict_for_solution
+
+COIN_SPEND_CACHE_SIZE = 4096
+
+
+# bounded LRU cache of everything we derive from a coin spend, keyed by the spent coin's id
+# entries: coin_spend, conditions_dict and (for pair singleton spends) state and reserve_info
+class CoinSpendCache:
+    def __init__(self, max_size=COIN_SPEND_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, coin_spend):
+        coin_id = coin_spend.coin.name()
+        entry = self.entries.get(coin_id)
+
+        # the same coin can be spent differently (e.g., mempool replacement)
+        if entry is not None and entry["coin_spend"] == coin_spend:
+            self.entries.move_to_end(coin_id)
+            return entry
+
+        entry = {"coin_spend": coin_spend}
+        self.entries[coin_id] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    # returns None on a miss
+    def lookup(self, coin_spend, key):
+        entry = self.get_entry(coin_spend)
+        if key in entry:
+            self.hits += 1
+            return entry[key]
+
+        self.misses += 1
+        return None
+
+    def store(self, coin_spend, key, value):
+        self.get_entry(coin_spend)[key] = value
+
+    def get(self, coin_spend, key, compute):
+        value = self.lookup(coin_spend, key)
+        if value is None:
+            value = compute()
+            self.store(coin_spend, key, value)
+        return value
+
+    def conditions_dict(self, coin_spend):
+        return self.get(
+            coin_spend,
+            "conditions_dict",
+            lambda: conditions_dict_for_solution(coin_spend.puzzle_reveal, coin_spend.solution, INFINITE_COST)
+        )
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fee_costs import OperationCostTable
+
+
+class TestOperationCostTable:
+    def test_measured_costs(self):
+        table = OperationCostTable(default_costs={"swap": 100, "deposit": 200}, samples=10, margin=1.5)
+        assert table.get("swap") == 150
+        assert table.get() == 300
+
+        # cheaper than the benchmark - the benchmark is a floor
+        table.record("swap", 50)
+        assert table.get("swap") == 150
+
+        for cost in [110, 120, 130, 140, 150, 160, 170, 180, 190]:
+            table.record("swap", cost)
+        assert table.get("swap") == 270 # 90th percentile (180) plus the margin
+        assert table.stats()["swap"] == {"cost": 270, "samples": 10}
+
+    def test_heavy_offer(self):
+        table = OperationCostTable(default_costs={"swap": 100}, samples=10, margin=1)
+        for _ in range(9):
+            table.record("swap", 120)
+
+        # one unusually heavy offer doesn't move the estimate
+        table.record("swap", 10 ** 9)
+        assert table.get("swap") == 120
+
+        # many of them never go above the cap
+        for _ in range(10):
+            table.record("swap", 10 ** 9)
+        assert table.get("swap") == 200
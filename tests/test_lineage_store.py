@@ -0,0 +1,177 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.types.coin_spend import CoinSpend
+
+from lineage_store import LineageStore
+from mempool_index import MempoolIndex
+from tibet_lib import COIN_SPEND_CACHE
+from tibet_lib import sync_pair
+
+
+# returns [(launcher_id, coin, creation_spend, state, confirmed_height)] for count singleton coins,
+# created at heights 10, 11, ...; only the last one comes with its creation spend (like sync_pair)
+def make_lineage(launcher_id, count):
+    coins = []
+    parent_id = launcher_id
+    for i in range(count):
+        coin = Coin(parent_id, bytes32(b"\x01" * 32), 1)
+        creation_spend = None
+        state = None
+        if i == count - 1:
+            creation_spend = CoinSpend(Coin(b"\x00" * 32, coin.puzzle_hash, 1), Program.to(1), Program.to([i]))
+            state = {"liquidity": i, "xch_reserve": 100 * i, "token_reserve": 10 * i}
+        coins.append((launcher_id, coin, creation_spend, state, 10 + i))
+        parent_id = coin.name()
+    return coins
+
+
+# answers the RPCs sync_pair uses for an unspent coin from a list of unspent coin records and
+# a dict of coin id -> spend
+class FakeFullNodeClient:
+    def __init__(self, coin_records, coin_spends):
+        self.coin_records = {coin_record.coin.name(): coin_record for coin_record in coin_records}
+        self.coin_spends = coin_spends
+        self.fetched_spends = []
+
+    async def get_coin_record_by_name(self, coin_id):
+        return self.coin_records.get(coin_id)
+
+    async def get_puzzle_and_solution(self, coin_id, height):
+        self.fetched_spends.append((coin_id, height))
+        return self.coin_spends[coin_id]
+
+    async def get_all_mempool_tx_ids(self):
+        return []
+
+
+class TestLineageStore:
+    @pytest.mark.asyncio
+    async def test_resume(self, tmp_path):
+        launcher_id = bytes32(b"\x05" * 32)
+        other_launcher_id = bytes32(b"\x06" * 32)
+        lineage = make_lineage(launcher_id, 5)
+
+        store = LineageStore(str(tmp_path / "lineage.db"))
+        assert (await store.get_latest(launcher_id)) is None
+        await store.add_coins(lineage)
+        await store.add_coins(make_lineage(other_launcher_id, 2))
+
+        # the latest coin is found from the launcher id or any coin in the lineage
+        for coin_id in [launcher_id] + [coin.name() for _, coin, _, _, _ in lineage]:
+            latest = await store.get_latest(coin_id)
+            assert latest["coin_id"] == lineage[-1][1].name()
+            assert latest["launcher_id"] == launcher_id
+            assert latest["confirmed_height"] == 14
+            assert latest["spent_height"] is None
+            assert latest["state"] == {"liquidity": 4, "xch_reserve": 400, "token_reserve": 40}
+            assert latest["creation_spend"] == lineage[-1][2]
+        assert (await store.get_latest(bytes32(b"\x07" * 32))) is None
+
+        history = await store.get_history(launcher_id)
+        assert [row["coin_id"] for row in history] == [coin.name() for _, coin, _, _, _ in lineage]
+        assert [row["spent_height"] for row in history] == [11, 12, 13, 14, None]
+        assert history[0]["state"] is None and history[0]["creation_spend"] is None
+        assert len(await store.get_history(launcher_id, min_height=13)) == 2
+        store.close()
+
+        # and after a restart
+        store = LineageStore(str(tmp_path / "lineage.db"))
+        assert (await store.get_latest(launcher_id))["coin_id"] == lineage[-1][1].name()
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_executor(self, tmp_path):
+        launcher_id = bytes32(b"\x05" * 32)
+        lineage = make_lineage(launcher_id, 50)
+
+        store = LineageStore(str(tmp_path / "lineage.db"), ThreadPoolExecutor(max_workers=2))
+        await store.add_coins(lineage[:25])
+        await store.add_coins(lineage[25:])
+        await store.add_coins([])
+
+        assert (await store.get_latest(launcher_id))["confirmed_height"] == 59
+        assert len(await store.get_history(launcher_id)) == 50
+        # the parent of the second batch's first coin was spent by it
+        assert (await store.get_history(launcher_id, min_height=34))[0]["spent_height"] == 35
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_truncate(self, tmp_path):
+        launcher_id = bytes32(b"\x05" * 32)
+        other_launcher_id = bytes32(b"\x06" * 32)
+        lineage = make_lineage(launcher_id, 5)
+
+        store = LineageStore(str(tmp_path / "lineage.db"))
+        await store.add_coins(lineage)
+        await store.add_coins(make_lineage(other_launcher_id, 5))
+
+        # heights 12+ were reorged out
+        await store.truncate(launcher_id, 12)
+        latest = await store.get_latest(lineage[-1][1].name()) # forgotten coins can't be looked up
+        assert latest is None
+
+        latest = await store.get_latest(launcher_id)
+        assert latest["coin_id"] == lineage[1][1].name()
+        assert latest["spent_height"] is None
+        assert [row["spent_height"] for row in await store.get_history(launcher_id)] == [11, None]
+
+        # other pairs are not affected
+        assert len(await store.get_history(other_launcher_id)) == 5
+
+        # the new fork is recorded on top
+        fork = []
+        parent_id = lineage[1][1].name()
+        for height in [12, 13]:
+            coin = Coin(parent_id, bytes32(b"\x02" * 32), 1)
+            fork.append((launcher_id, coin, None, None, height))
+            parent_id = coin.name()
+        await store.add_coins(fork)
+        assert (await store.get_latest(launcher_id))["coin_id"] == fork[-1][1].name()
+        assert [row["spent_height"] for row in await store.get_history(launcher_id)] == [11, 12, 13, None]
+
+        # everything reorged out
+        await store.truncate(launcher_id, 0)
+        assert (await store.get_latest(launcher_id)) is None
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_sync_pair_after_truncate(self, tmp_path):
+        launcher_id = bytes32(b"\x05" * 32)
+        lineage = make_lineage(launcher_id, 5)
+
+        store = LineageStore(str(tmp_path / "lineage.db"))
+        await store.add_coins(lineage)
+        await store.truncate(launcher_id, 12)
+        # the latest row is a catch-up hop, recorded without its creation spend
+        _, coin, _, _, height = lineage[1]
+        assert (await store.get_latest(launcher_id))["creation_spend"] is None
+
+        parent_coin = lineage[0][1]
+        creation_spend = CoinSpend(parent_coin, Program.to(1), Program.to([1]))
+        state = {"liquidity": 1, "xch_reserve": 100, "token_reserve": 10}
+        COIN_SPEND_CACHE.store(creation_spend, "state", state) # not a real pair spend
+        client = FakeFullNodeClient([CoinRecord(coin, height, 0, False, 0)], {parent_coin.name(): creation_spend})
+        mempool_index = MempoolIndex()
+        await mempool_index.refresh(client)
+
+        result = await sync_pair(client, launcher_id, store, mempool_index)
+        assert result == (coin, creation_spend, state, None, coin.name())
+        assert client.fetched_spends == [(parent_coin.name(), height)]
+
+        # the spend is recorded - the next sync doesn't fetch it again
+        latest = await store.get_latest(launcher_id)
+        assert latest["creation_spend"] == creation_spend
+        assert latest["state"] == state
+        assert await sync_pair(client, launcher_id, store, mempool_index) == result
+        assert len(client.fetched_spends) == 1
+        store.close()
@@ -0,0 +1,120 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blspy import AugSchemeMPL
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_spend import CoinSpend
+from chia.types.spend_bundle import SpendBundle
+
+from mempool_index import MempoolIndex
+
+
+def make_spend_bundle(*parent_ids):
+    coin_spends = []
+    for parent_id in parent_ids:
+        puzzle = Program.to(1)
+        coin_spends.append(CoinSpend(Coin(parent_id, puzzle.get_tree_hash(), 1), puzzle, Program.to([])))
+    return SpendBundle(coin_spends, AugSchemeMPL.aggregate([]))
+
+
+# answers the two RPCs MempoolIndex uses from a dict of tx id -> (spend bundle, cost, fee)
+class FakeFullNodeClient:
+    def __init__(self):
+        self.mempool = {}
+        self.fetched = []
+
+    async def get_all_mempool_tx_ids(self):
+        return list(self.mempool.keys())
+
+    async def get_mempool_item_by_tx_id(self, tx_id):
+        self.fetched.append(tx_id)
+        if tx_id not in self.mempool:
+            return None
+
+        sb, cost, fee = self.mempool[tx_id]
+        return {"spend_bundle": sb.to_json_dict(), "cost": cost, "fee": fee}
+
+
+class TestMempoolIndex:
+    @pytest.mark.asyncio
+    async def test_refresh(self):
+        client = FakeFullNodeClient()
+        index = MempoolIndex()
+        assert not index.is_fresh()
+
+        tx_a, tx_b, tx_c = bytes32(b"\xaa" * 32), bytes32(b"\xbb" * 32), bytes32(b"\xcc" * 32)
+        sb_a = make_spend_bundle(b"\x01" * 32, b"\x02" * 32)
+        sb_b = make_spend_bundle(b"\x03" * 32)
+        client.mempool = {tx_a: (sb_a, 100, 10), tx_b: (sb_b, 200, 0)}
+
+        await index.refresh(client)
+        assert index.is_fresh()
+        assert sorted(client.fetched) == [tx_a, tx_b]
+        for cs in sb_a.coin_spends:
+            assert index.get_spend_bundle_by_coin_id(cs.coin.name()) == sb_a
+            assert index.get_spend_bundle_by_parent_coin_id(cs.coin.parent_coin_info) == sb_a
+            assert index.get_cost_and_fee_by_coin_id(cs.coin.name()) == (100, 10)
+        assert index.stats()["items"] == 2
+        assert index.stats()["indexed_coins"] == 3
+
+        # b leaves the mempool, c arrives - only c is downloaded
+        client.fetched = []
+        sb_c = make_spend_bundle(b"\x04" * 32)
+        client.mempool = {tx_a: (sb_a, 100, 10), tx_c: (sb_c, 300, 30)}
+        await index.refresh(client)
+
+        assert client.fetched == [tx_c]
+        assert set(index.items.keys()) == {tx_a, tx_c}
+        assert set(index.costs.keys()) == {tx_a, tx_c}
+        assert index.get_spend_bundle_by_coin_id(sb_b.coin_spends[0].coin.name()) is None
+        assert index.get_spend_bundle_by_parent_coin_id(b"\x03" * 32) is None
+        assert index.get_cost_and_fee_by_coin_id(sb_b.coin_spends[0].coin.name()) is None
+        assert index.get_spend_bundle_by_coin_id(sb_c.coin_spends[0].coin.name()) == sb_c
+
+        # nothing changed - nothing is downloaded
+        client.fetched = []
+        await index.refresh(client)
+        assert client.fetched == []
+        assert set(index.items.keys()) == {tx_a, tx_c}
+
+    @pytest.mark.asyncio
+    async def test_item_leaves_during_refresh(self):
+        client = FakeFullNodeClient()
+        index = MempoolIndex()
+        tx_a = bytes32(b"\xaa" * 32)
+
+        # listed, but gone by the time it's fetched
+        async def get_all_mempool_tx_ids():
+            return [tx_a]
+        client.get_all_mempool_tx_ids = get_all_mempool_tx_ids
+
+        await index.refresh(client)
+        assert client.fetched == [tx_a]
+        assert index.items == {}
+        assert index.is_fresh()
+
+    def test_replacement(self):
+        index = MempoolIndex()
+        tx_a, tx_b = bytes32(b"\xaa" * 32), bytes32(b"\xbb" * 32)
+        sb_a = make_spend_bundle(b"\x01" * 32)
+        sb_b = make_spend_bundle(b"\x01" * 32, b"\x02" * 32) # spends the same coin (replacement)
+        coin_id = sb_a.coin_spends[0].coin.name()
+
+        index._add(tx_a, sb_a, 100, 1)
+        index._add(tx_b, sb_b, 200, 5)
+        assert index.get_spend_bundle_by_coin_id(coin_id) == sb_b
+
+        # removing the replaced item keeps the coin pointing to the replacement
+        index._remove(tx_a)
+        assert index.get_spend_bundle_by_coin_id(coin_id) == sb_b
+        assert index.get_cost_and_fee_by_coin_id(coin_id) == (200, 5)
+
+        index._remove(tx_b)
+        assert index.tx_id_by_coin_id == {}
+        assert index.tx_id_by_parent_coin_id == {}
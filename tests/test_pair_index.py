@@ -0,0 +1,112 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pair_index import PairIndex
+
+
+def make_pair(launcher_id, xch_reserve, token_reserve=1000, liquidity=1000, asset_id=None):
+    return {
+        "launcher_id": launcher_id,
+        "asset_id": asset_id or "ff" + launcher_id,
+        "xch_reserve": xch_reserve,
+        "token_reserve": token_reserve,
+        "liquidity": liquidity,
+    }
+
+
+class TestPairIndex:
+    def get_all_pages(self, index, limit, **kwargs):
+        pages = []
+        cursor = None
+        while True:
+            pairs, cursor = index.page(limit=limit, cursor=cursor, **kwargs)
+            pages.append([p["launcher_id"] for p in pairs])
+            if cursor is None:
+                return pages
+
+    def test_sorting(self):
+        index = PairIndex()
+        index.update(make_pair("aa", 5, token_reserve=1))
+        index.update(make_pair("bb", 7, token_reserve=3))
+        index.update(make_pair("cc", 6, token_reserve=2))
+
+        assert [p["launcher_id"] for p in index.page()[0]] == ["bb", "cc", "aa"]
+        assert [p["launcher_id"] for p in index.page(sort_by="token_reserve")[0]] == ["bb", "cc", "aa"]
+
+        # updates move the pair
+        index.update(make_pair("aa", 8, token_reserve=1))
+        assert [p["launcher_id"] for p in index.page()[0]] == ["aa", "bb", "cc"]
+        assert [p["launcher_id"] for p in index.page(sort_by="token_reserve")[0]] == ["bb", "cc", "aa"]
+        assert index.stats()["pairs"] == 3
+
+    def test_cursor_pagination(self):
+        index = PairIndex()
+        # lots of ties - pairs with the same value are ordered by launcher id
+        for i in range(25):
+            index.update(make_pair(f"{i:02x}", i % 4))
+
+        pages = self.get_all_pages(index, 4)
+        assert [len(page) for page in pages] == [4, 4, 4, 4, 4, 4, 1]
+
+        all_ids = [launcher_id for page in pages for launcher_id in page]
+        expected = sorted([f"{i:02x}" for i in range(25)], key=lambda launcher_id: (-(int(launcher_id, 16) % 4), launcher_id))
+        assert all_ids == expected
+
+        # same order every time
+        assert self.get_all_pages(index, 4) == pages
+
+        # the last page is exactly full
+        assert self.get_all_pages(index, 5)[-1] == expected[20:]
+
+    def test_cursor_after_update(self):
+        index = PairIndex()
+        for i in range(6):
+            index.update(make_pair(f"{i:02x}", 100 - i))
+
+        first_page, cursor = index.page(limit=3)
+        assert [p["launcher_id"] for p in first_page] == ["00", "01", "02"]
+
+        # a pair from the first page moves behind the cursor - nothing is skipped or repeated
+        index.update(make_pair("00", 1))
+        second_page, cursor = index.page(limit=3, cursor=cursor)
+        assert [p["launcher_id"] for p in second_page] == ["03", "04", "05"]
+        third_page, cursor = index.page(limit=3, cursor=cursor)
+        assert [p["launcher_id"] for p in third_page] == ["00"]
+        assert cursor is None
+
+    def test_prefix_and_skip(self):
+        index = PairIndex()
+        for i in range(10):
+            index.update(make_pair(f"{i:02x}", 100 - i, asset_id=("ab" if i % 2 == 0 else "cd") + f"{i:02x}"))
+
+        pairs, _ = index.page(limit=10, asset_id_prefix="ab")
+        assert [p["launcher_id"] for p in pairs] == ["00", "02", "04", "06", "08"]
+
+        pairs, _ = index.page(limit=2, asset_id_prefix="ab", skip=1)
+        assert [p["launcher_id"] for p in pairs] == ["02", "04"]
+
+        assert self.get_all_pages(index, 2, asset_id_prefix="cd") == [["01", "03"], ["05", "07"], ["09"]]
+
+    def test_volume(self):
+        index = PairIndex(volume_window=100)
+        index.update(make_pair("aa", 1000), now=1000)
+        index.update(make_pair("bb", 1000), now=1000)
+
+        index.update(make_pair("aa", 1100), now=1010) # swap: +100
+        index.update(make_pair("aa", 1050), now=1050) # swap: +50
+        index.update(make_pair("bb", 2000, liquidity=2000), now=1050) # deposit - not volume
+        assert index.volume == {"aa": 150}
+        assert index.stats()["pairs_with_volume"] == 1
+
+        index.update(make_pair("bb", 1800, liquidity=2000), now=1060) # swap: +200
+        # (page(sort_by="volume") expires trades against the current time)
+        assert index.sorted["volume"] == [(-200, "bb"), (-150, "aa")]
+
+        index.expire_volume(now=1115) # the first aa trade is out of the window
+        assert index.volume == {"aa": 50, "bb": 200}
+
+        index.expire_volume(now=1200)
+        assert index.volume == {"aa": 0, "bb": 0}
+        assert index.sorted["volume"] == [(0, "aa"), (0, "bb")]
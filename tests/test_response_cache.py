@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache
+
+
+class TestResponseCache:
+    def test_get_and_put(self):
+        cache = ResponseCache()
+        assert cache.get("/pairs?") is None
+
+        body, etag, headers = cache.put("/pairs?", b"[]", ["pairs"], cache.generation, {"X-Next-Cursor": "1:aa"})
+        assert body == b"[]"
+        assert headers == {"X-Next-Cursor": "1:aa"}
+        assert cache.get("/pairs?") == (b"[]", etag, headers)
+
+        # same body, same etag
+        assert cache.put("/other?", b"[]", ["pairs"], cache.generation)[1] == etag
+        assert cache.put("/other?", b"{}", ["pairs"], cache.generation)[1] != etag
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_invalidate(self):
+        cache = ResponseCache()
+        cache.put("/pairs?", b"1", ["pairs"], cache.generation)
+        cache.put("/pair/aa?", b"2", ["pair:aa"], cache.generation)
+        cache.put("/pair/bb?", b"3", ["pair:bb"], cache.generation)
+        cache.put("/router?", b"4", ["router", "pairs"], cache.generation)
+
+        cache.invalidate("pairs", "pair:aa")
+        assert cache.get("/pairs?") is None
+        assert cache.get("/router?") is None
+        assert cache.get("/pair/aa?") is None
+        assert cache.get("/pair/bb?")[0] == b"3"
+        assert cache.keys_by_tag == {"pair:bb": {"/pair/bb?"}}
+
+        # unknown tags are fine
+        cache.invalidate("token:cc")
+        assert cache.get("/pair/bb?")[0] == b"3"
+
+    def test_generation(self):
+        cache = ResponseCache()
+        generation = cache.generation
+        cache.invalidate("pairs") # data changed while the body was being computed
+
+        # the (possibly stale) body is still returned, but not cached
+        body, etag, _ = cache.put("/pairs?", b"stale", ["pairs"], generation)
+        assert body == b"stale"
+        assert etag is not None
+        assert cache.get("/pairs?") is None
+
+        cache.put("/pairs?", b"fresh", ["pairs"], cache.generation)
+        assert cache.get("/pairs?")[0] == b"fresh"
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=2)
+        cache.put("a", b"1", ["t1"], cache.generation)
+        cache.put("b", b"2", ["t2"], cache.generation)
+        cache.get("a") # b is now the least recently used
+        cache.put("c", b"3", ["t1"], cache.generation)
+
+        assert cache.get("b") is None
+        assert cache.get("a")[0] == b"1"
+        assert cache.get("c")[0] == b"3"
+        assert cache.keys_by_tag == {"t1": {"a", "c"}}
+        assert cache.stats()["size"] == 2
+
+        for i in range(100):
+            cache.put(f"nonce{i}", b"x", ["t3"], cache.generation)
+        assert len(cache.entries) == 2
+        assert cache.keys_by_tag == {"t3": {"nonce98", "nonce99"}}
+
+    def test_put_replaces_tags(self):
+        cache = ResponseCache()
+        cache.put("a", b"1", ["t1"], cache.generation)
+        cache.put("a", b"2", ["t2"], cache.generation)
+
+        assert cache.keys_by_tag == {"t2": {"a"}}
+        cache.invalidate("t1")
+        assert cache.get("a")[0] == b"2"
@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
+from chia.types.coin_spend import CoinSpend
+
+from spend_cache import CoinSpendCache
+
+
+def make_coin_spend(parent_id, solution=[]):
+    puzzle = Program.to(1) # returns the solution as conditions
+    return CoinSpend(Coin(parent_id, puzzle.get_tree_hash(), 1), puzzle, Program.to(solution))
+
+
+class TestCoinSpendCache:
+    def test_get(self):
+        cache = CoinSpendCache()
+        cs = make_coin_spend(b"\x01" * 32)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"liquidity": 1}
+
+        assert cache.get(cs, "state", compute) == {"liquidity": 1}
+        assert cache.get(cs, "state", compute) == {"liquidity": 1}
+        assert len(calls) == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+        # an equal coin spend (e.g., deserialized again) hits the same entry
+        assert cache.lookup(make_coin_spend(b"\x01" * 32), "state") == {"liquidity": 1}
+        assert cache.lookup(cs, "reserve_info") is None
+
+    def test_conditions_dict(self):
+        cache = CoinSpendCache()
+        cs = make_coin_spend(b"\x01" * 32, [[51, b"\x02" * 32, 1]])
+
+        conditions_dict = cache.conditions_dict(cs)
+        assert cache.conditions_dict(cs) is conditions_dict
+        assert cache.stats()["misses"] == 1
+
+    def test_replaced_spend(self):
+        cache = CoinSpendCache()
+        cs = make_coin_spend(b"\x01" * 32, [[51, b"\x02" * 32, 1]])
+        replacement = make_coin_spend(b"\x01" * 32, [[51, b"\x03" * 32, 1]])
+        assert cs.coin.name() == replacement.coin.name()
+
+        cache.store(cs, "state", "old")
+        assert cache.lookup(replacement, "state") is None # same coin, different spend
+        cache.store(replacement, "state", "new")
+        assert cache.lookup(replacement, "state") == "new"
+        assert cache.stats()["size"] == 1
+
+    def test_lru_eviction(self):
+        cache = CoinSpendCache(max_size=2)
+        a, b, c = [make_coin_spend(bytes([i]) * 32) for i in range(1, 4)]
+
+        cache.store(a, "state", "a")
+        cache.store(b, "state", "b")
+        assert cache.lookup(a, "state") == "a" # b is now the least recently used
+        cache.store(c, "state", "c")
+
+        assert list(cache.entries.keys()) == [a.coin.name(), c.coin.name()]
+        assert cache.lookup(b, "state") is None
+        assert cache.stats()["size"] == 2
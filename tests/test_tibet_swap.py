@@ -7,6 +7,7 @@ import pytest_asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import asyncio
+import dataclasses
 from pathlib import Path
 from typing import List
 
@@ -83,6 +84,8 @@ from chia.rpc.rpc_server import start_rpc_server
 from clvm import SExp
 from private_key_things import *
 from tibet_lib import *
+from amm import *
+from fee_estimator import *
 from secrets import token_bytes
 
 
@@ -211,6 +214,84 @@ class TestTibetSwap:
         assert wallet_resp['success']
 
 
+    def test_pair_inner_puzzle_hash(self):
+        launcher_id = b"\x01" * 32
+        tail_hash = b"\x02" * 32
+
+        for liquidity, xch_reserve, token_reserve in [(0, 0, 0), (1000, 10 ** 12, 1000), (2 ** 64, 127, 128)]:
+            puzzle = get_pair_inner_puzzle(launcher_id, tail_hash, liquidity, xch_reserve, token_reserve)
+            puzzle_hash = get_pair_inner_puzzle_hash(launcher_id, tail_hash, liquidity, xch_reserve, token_reserve)
+            assert puzzle.get_tree_hash() == puzzle_hash
+
+            puzzle = get_pair_puzzle(launcher_id, tail_hash, liquidity, xch_reserve, token_reserve)
+            puzzle_hash = get_pair_puzzle_hash(launcher_id, tail_hash, liquidity, xch_reserve, token_reserve)
+            assert puzzle.get_tree_hash() == puzzle_hash
+
+
+    def test_puzzle_hashes(self):
+        launcher_id = b"\x03" * 32
+        tail_hash = b"\x04" * 32
+
+        assert get_router_puzzle().get_tree_hash() == ROUTER_PUZZLE_HASH
+        assert pair_liquidity_tail_puzzle(launcher_id).get_tree_hash() == pair_liquidity_tail_puzzle_hash(launcher_id)
+        assert pay_to_singleton_flashloan_puzzle(launcher_id).get_tree_hash() == pay_to_singleton_flashloan_puzzle_hash(launcher_id)
+        assert pay_to_singleton_flashloan_cat_puzzle(launcher_id, tail_hash).get_tree_hash() == pay_to_singleton_flashloan_cat_puzzle_hash(launcher_id, tail_hash)
+        assert construct_cat_puzzle(CAT_MOD, tail_hash, OFFER_MOD).get_tree_hash() == cat_puzzle_hash(tail_hash, OFFER_MOD_HASH)
+
+
+    def test_amm_math(self):
+        dummy_singleton_struct = (b"\x00" * 32, (b"\x00" * 32, b"\x00" * 32))
+        liquidity, xch_reserve, token_reserve = 1000000, 3 * 10 ** 12, 7777777
+
+        # the puzzle rejects swaps that would output nothing, so amounts are big enough for both directions
+        for amount in [123456789, 10 ** 9, 10 ** 12, 5 * 10 ** 12]:
+            # XCH -> token
+            new_state = SWAP_PUZZLE.run(Program.to([
+                (liquidity, (xch_reserve, token_reserve)), [amount, 1], dummy_singleton_struct, b"\x00" * 32
+            ])).at("f")
+            assert new_state.at("rr").as_int() == token_reserve - get_input_price(amount, xch_reserve, token_reserve)
+
+            # token -> XCH
+            new_state = SWAP_PUZZLE.run(Program.to([
+                (liquidity, (xch_reserve, token_reserve)), [amount, 0], dummy_singleton_struct, b"\x00" * 32
+            ])).at("f")
+            assert new_state.at("rf").as_int() == xch_reserve - get_input_price(amount, token_reserve, xch_reserve)
+
+        # asking for at least amount out
+        for amount in [1, 999, 10 ** 6, 7777776]:
+            input_amount = get_output_price(amount, xch_reserve, token_reserve)
+            assert get_input_price(input_amount, xch_reserve, token_reserve) >= amount
+
+        assert get_input_prices([1, 10 ** 6], xch_reserve, token_reserve) == [
+            get_input_price(1, xch_reserve, token_reserve),
+            get_input_price(10 ** 6, xch_reserve, token_reserve)
+        ]
+        assert get_liquidity_to_mint(1000, 0, 0) == 1000
+        assert get_removed_amounts(liquidity, liquidity, xch_reserve, token_reserve) == (xch_reserve, token_reserve)
+
+    def test_fee_estimator(self):
+        estimator = FeeEstimator(targets=[60, 600], min_samples=10)
+        t = 1000
+        estimator.sample({}, t)
+        assert estimator.get_fee_per_cost(60) == 0
+
+        # 1 mojo / cost txs take 5 minutes, 100 mojo / cost txs 30 seconds
+        for i in range(20):
+            estimator.sample({f"cheap{i}": (10 ** 7, 10 ** 7), f"expensive{i}": (10 ** 7, 10 ** 9)}, t)
+            estimator.sample({f"cheap{i}": (10 ** 7, 10 ** 7)}, t + 30)
+            estimator.sample({}, t + 300)
+            t += 300
+
+        assert 1 < estimator.get_fee_per_cost(60) <= 100
+        assert estimator.get_fee_per_cost(600) == 0
+        assert estimator.get_fee(10 ** 6, 60) == estimator.get_fee_per_cost(60) * 10 ** 6
+
+        # more than a block's worth of cost waiting at 20 mojo / cost
+        estimator.sample({f"spam{i}": (10 ** 9, 20 * 10 ** 9) for i in range(12)}, t)
+        assert estimator.get_fee_per_cost(60) > 20
+        assert estimator.get_fee_per_cost(600) == 0
+
+
     def get_created_coins_from_coin_spend(self, cs):
         coins = []
 
@@ -355,6 +436,20 @@ class TestTibetSwap:
         return int(wallet_id)
             
 
+    # the same offer, but asking for amount_delta more of asset_id (None = XCH)
+    # the offered spends are untouched, so the result is only good for validate_offer
+    def change_requested_amount(self, offer_str, asset_id, amount_delta):
+        offer = Offer.from_bech32(offer_str)
+        requested_payments = dict(offer.requested_payments)
+        payments = list(requested_payments[asset_id])
+        payments[0] = dataclasses.replace(payments[0], amount=uint64(payments[0].amount + amount_delta))
+        requested_payments[asset_id] = payments
+
+        sb = offer.to_spend_bundle()
+        offered_spends = [cs for cs in sb.coin_spends if cs.coin.parent_coin_info != b"\x00" * 32] # drop old 'hints'
+        return Offer(requested_payments, SpendBundle(offered_spends, sb.aggregated_signature), offer.driver_dict).to_bech32()
+
+
     async def get_balance(self, wallet_client, tail_hash_or_none = None):
         await self.wait_for_wallet_sync(wallet_client)
 
@@ -439,9 +534,25 @@ class TestTibetSwap:
         return balance
 
 
+    # cold sync_pair, checked against a sync through the lineage store (which resumes from what the
+    # previous syncs recorded, then fast-forwards) and the mempool index
+    async def sync_pair_and_compare(self, full_node_client, pair_coin_id, pair_launcher_id, lineage_store, mempool_index):
+        cold = await sync_pair(full_node_client, pair_coin_id)
+
+        await mempool_index.refresh(full_node_client)
+        warm = await sync_pair(full_node_client, pair_coin_id, lineage_store, mempool_index, pair_launcher_id)
+        assert warm == cold
+        assert (await lineage_store.get_latest(pair_launcher_id))["coin_id"] == cold[4]
+
+        return cold
+
+
     @pytest.mark.asyncio
-    async def test_pair_operations(self, setup):
+    async def test_pair_operations(self, setup, tmp_path):
         full_node_client, wallet_client, bob_wallet_client = setup
+        # every sync is also done through a lineage store, which resumes from the previous ones
+        lineage_store = LineageStore(str(tmp_path / "lineage.db"))
+        mempool_index = MempoolIndex()
         router_launcher_id, current_router_coin, router_creation_spend = await self.launch_router(
             wallet_client, full_node_client
         )
@@ -460,6 +571,7 @@ class TestTibetSwap:
             current_router_coin,
             router_creation_spend
         )
+        first_pair_coin_id = current_pair_coin.name()
             
         pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(pair_launcher_id).get_tree_hash()
         
@@ -487,8 +599,8 @@ class TestTibetSwap:
         offer_str = offer.to_bech32()
 
         # get pair state, even though it's 0 - we need to test teh func-tion!
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 0
         assert pair_state["xch_reserve"] == 0
@@ -547,13 +659,21 @@ class TestTibetSwap:
         offer = offer_resp[0]
         offer_str = offer.to_bech32()
 
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 1000
         assert pair_state["xch_reserve"] == 100000000
         assert pair_state["token_reserve"] == 1000
 
+        pair_args = (pair_launcher_id, token_tail_hash, pair_state["liquidity"], pair_state["xch_reserve"], pair_state["token_reserve"])
+        assert validate_offer("add_liquidity", offer_str, *pair_args) is None
+        assert validate_offer("add_liquidity", offer_str, pair_launcher_id, b"\x01" * 32, *pair_args[2:])["error"] == "wrong_asset"
+        assert validate_offer("remove_liquidity", offer_str, *pair_args)["error"] == "wrong_asset"
+        for delta in [1, -1]:
+            bad_offer_str = self.change_requested_amount(offer_str, pair_liquidity_tail_hash, delta)
+            assert validate_offer("add_liquidity", bad_offer_str, *pair_args)["error"] == "wrong_amount"
+
         xch_reserve_coin, token_reserve_coin, token_reserve_lineage_proof = await get_pair_reserve_info(
             full_node_client,
             pair_launcher_id,
@@ -606,13 +726,21 @@ class TestTibetSwap:
         offer = offer_resp[0]
         offer_str = offer.to_bech32()
 
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 5000
         assert pair_state["xch_reserve"] == 500000000
         assert pair_state["token_reserve"] == 5000
 
+        pair_args = (pair_launcher_id, token_tail_hash, pair_state["liquidity"], pair_state["xch_reserve"], pair_state["token_reserve"])
+        assert validate_offer("remove_liquidity", offer_str, *pair_args) is None
+        assert validate_offer("remove_liquidity", offer_str, pair_launcher_id, b"\x01" * 32, *pair_args[2:])["error"] == "wrong_asset"
+        for asset_id in [None, token_tail_hash]:
+            for delta in [1, -1]:
+                bad_offer_str = self.change_requested_amount(offer_str, asset_id, delta)
+                assert validate_offer("remove_liquidity", bad_offer_str, *pair_args)["error"] == "wrong_amount"
+
         xch_reserve_coin, token_reserve_coin, token_reserve_lineage_proof = await get_pair_reserve_info(
             full_node_client,
             pair_launcher_id,
@@ -653,8 +781,8 @@ class TestTibetSwap:
         token_balance_before = token_balance_now
         liquidity_balance_before = liquidity_balance_now
 
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 4200
         assert pair_state["xch_reserve"] == 420000000
@@ -679,6 +807,13 @@ class TestTibetSwap:
         offer = offer_resp[0]
         offer_str = offer.to_bech32()
 
+        pair_args = (pair_launcher_id, token_tail_hash, pair_state["liquidity"], pair_state["xch_reserve"], pair_state["token_reserve"])
+        assert validate_offer("swap", offer_str, *pair_args) is None
+        assert validate_offer("swap", offer_str, pair_launcher_id, b"\x01" * 32, *pair_args[2:])["error"] == "wrong_asset"
+        for delta in [1, -1]:
+            bad_offer_str = self.change_requested_amount(offer_str, token_tail_hash, delta)
+            assert validate_offer("swap", bad_offer_str, *pair_args)["error"] == "wrong_amount"
+
         sb = await respond_to_swap_offer(
            pair_launcher_id,
            current_pair_coin,
@@ -706,14 +841,27 @@ class TestTibetSwap:
         liquidity_balance_now = await self.get_balance(wallet_client, pair_liquidity_tail_hash)
         assert liquidity_balance_before == liquidity_balance_now
 
+        # anyone can send dust to the reserve puzzle hash - fast-forwarding must skip its block
+        reserve_puzzle_hash = pay_to_singleton_flashloan_puzzle_hash(pair_launcher_id)
+        reserve_records_before = await full_node_client.get_coin_records_by_puzzle_hash(reserve_puzzle_hash, include_spent_coins=False)
+        await bob_wallet_client.send_transaction("1", 1, encode_puzzle_hash(reserve_puzzle_hash, "xch"))
+        reserve_records = reserve_records_before
+        while len(reserve_records) == len(reserve_records_before):
+            await asyncio.sleep(0.5)
+            reserve_records = await full_node_client.get_coin_records_by_puzzle_hash(reserve_puzzle_hash, include_spent_coins=False)
+        await self.wait_for_wallet_sync(bob_wallet_client)
+
+        latest_pair_coin_record, _ = await fast_forward_pair(full_node_client, pair_launcher_id)
+        assert latest_pair_coin_record.coin.name() == (await sync_pair(full_node_client, current_pair_coin.name()))[4]
+
         # 5. Change 1000 tokens to XCH
         # python3 tibet.py token-to-xch --token-amount 1000 --asset-id [asset_id] --push-tx
         xch_balance_before = xch_balance_now
         token_balance_before = token_balance_now
         liquidity_balance_before = liquidity_balance_now
 
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 4200
         assert pair_state["xch_reserve"] == 420000000 + xch_amount
@@ -738,6 +886,13 @@ class TestTibetSwap:
         offer = offer_resp[0]
         offer_str = offer.to_bech32()
 
+        pair_args = (pair_launcher_id, token_tail_hash, pair_state["liquidity"], pair_state["xch_reserve"], pair_state["token_reserve"])
+        assert validate_offer("swap", offer_str, *pair_args) is None
+        assert validate_offer("swap", offer_str, pair_launcher_id, b"\x01" * 32, *pair_args[2:])["error"] == "wrong_asset"
+        # asking for less XCH than the swap gives is allowed, one mojo more is not
+        assert validate_offer("swap", self.change_requested_amount(offer_str, None, -1), *pair_args) is None
+        assert validate_offer("swap", self.change_requested_amount(offer_str, None, 1), *pair_args)["error"] == "wrong_amount"
+
         sb = await respond_to_swap_offer(
             pair_launcher_id,
             current_pair_coin,
@@ -768,8 +923,8 @@ class TestTibetSwap:
         token_balance_before = token_balance_now
         liquidity_balance_before = liquidity_balance_now
         
-        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await sync_pair(
-            full_node_client, current_pair_coin.name()
+        current_pair_coin, pair_creation_spend, pair_state, sb_to_aggregate, _ = await self.sync_pair_and_compare(
+            full_node_client, current_pair_coin.name(), pair_launcher_id, lineage_store, mempool_index
         )
         assert pair_state["liquidity"] == 4200
 
@@ -819,6 +974,10 @@ class TestTibetSwap:
         await self.expect_change_in_token(wallet_client, token_tail_hash, token_balance_before, token_total_supply - token_balance_before)
         await self.expect_change_in_token(wallet_client, pair_liquidity_tail_hash, liquidity_balance_before, -liquidity_balance_before)
 
+        # from the pair's first coin: the cold sync walks every hop, the store resumes from the latest coin
+        await self.sync_pair_and_compare(full_node_client, first_pair_coin_id, pair_launcher_id, lineage_store, mempool_index)
+        lineage_store.close()
+
     @pytest.mark.asyncio
     async def test_donations(self, setup):
         full_node_client, wallet_client, bob_wallet_client = setup
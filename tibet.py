@@ -41,6 +41,16 @@ def get_config():
     return cached_config
 
 
+cached_lineage_store = None
+
+def get_lineage_store():
+    global cached_lineage_store
+    if cached_lineage_store is None:
+        cached_lineage_store = LineageStore(get_config_item("lineage_db_path") or LINEAGE_DB_PATH)
+
+    return cached_lineage_store
+
+
 def save_config(config):
     cached_config = config
     open("config.json", "w").write(json.dumps(config, sort_keys=True, indent=4))
@@ -284,7 +294,7 @@ async def _create_pair(tail_hash, push_tx, fee):
     )
     click.echo(f"Pair launcher id: {pair_launcher_id}")
 
-    pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex()
+    pair_liquidity_tail_hash = pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex()
     click.echo(f"Liquidity asset id: {pair_liquidity_tail_hash}")
 
     signed_sb = await sign_spend_bundle(wallet_client, sb, additional_data=bytes.fromhex(get_config_item("agg_sig_me_additional_data")))
@@ -370,7 +380,7 @@ async def _get_pair_info(token_tail_hash):
         last_synced_pair_id_not_none = pair_launcher_id
 
     current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        full_node_client, bytes.fromhex(last_synced_pair_id_not_none)
+        full_node_client, bytes.fromhex(last_synced_pair_id_not_none), get_lineage_store(), launcher_id=bytes.fromhex(pair_launcher_id)
     )
     current_pair_coin_id = current_pair_coin.name().hex()
     click.echo(f"Current pair coin id: {current_pair_coin_id}")
@@ -415,7 +425,7 @@ async def _deposit_liquidity(token_tail_hash, offer, xch_amount, token_amount, p
         last_synced_pair_id_not_none = pair_launcher_id
 
     current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        full_node_client, bytes.fromhex(last_synced_pair_id_not_none)
+        full_node_client, bytes.fromhex(last_synced_pair_id_not_none), get_lineage_store(), launcher_id=bytes.fromhex(pair_launcher_id)
     )
     current_pair_coin_id = current_pair_coin.name().hex()
     click.echo(f"Current pair coin id: {current_pair_coin_id}")
@@ -435,7 +445,7 @@ async def _deposit_liquidity(token_tail_hash, offer, xch_amount, token_amount, p
             await full_node_client.await_closed()
             sys.exit(1)
 
-        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex()
+        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex()
         click.echo(f"Liquidity asset id: {pair_liquidity_tail_hash}")
 
         wallet_client = await get_wallet_client(get_config_item("chia_root"))
@@ -452,13 +462,12 @@ async def _deposit_liquidity(token_tail_hash, offer, xch_amount, token_amount, p
             await full_node_client.await_closed()
             sys.exit(1)
 
-        liquidity_token_amount = token_amount
+        liquidity_token_amount = get_liquidity_to_mint(token_amount, pair_state['liquidity'], pair_state['token_reserve'])
         if pair_state['liquidity'] != 0:
-            liquidity_token_amount = pair_state['liquidity'] * token_amount // pair_state['token_reserve']
-            xch_amount = pair_state['xch_reserve'] * token_amount // pair_state['token_reserve']
+            xch_amount = get_deposit_xch_amount(token_amount, pair_state['xch_reserve'], pair_state['token_reserve'])
 
         if use_fee_estimate:
-            fee = await get_fee_estimate(sb_to_aggregate, full_node_client)
+            fee = await get_fee_estimate(sb_to_aggregate, full_node_client, "add_liquidity")
             print(f"[!] Using estimated fee: {fee / 10 ** 12} XCH")
         offer_dict = {}
         offer_dict[1] = - xch_amount - liquidity_token_amount # also for liqiudity TAIL creation
@@ -557,7 +566,7 @@ async def _remove_liquidity(token_tail_hash, offer, liquidity_token_amount, push
         last_synced_pair_id_not_none = pair_launcher_id
 
     current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        full_node_client, bytes.fromhex(last_synced_pair_id_not_none)
+        full_node_client, bytes.fromhex(last_synced_pair_id_not_none), get_lineage_store(), launcher_id=bytes.fromhex(pair_launcher_id)
     )
     current_pair_coin_id = current_pair_coin.name().hex()
     click.echo(f"Current pair coin id: {current_pair_coin_id}")
@@ -577,7 +586,7 @@ async def _remove_liquidity(token_tail_hash, offer, liquidity_token_amount, push
             await full_node_client.await_closed()
             sys.exit(1)
 
-        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex()
+        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex()
         click.echo(f"Liquidity asset id: {pair_liquidity_tail_hash}")
 
         wallet_client = await get_wallet_client(get_config_item("chia_root"))
@@ -595,11 +604,12 @@ async def _remove_liquidity(token_tail_hash, offer, liquidity_token_amount, push
             sys.exit(1)
 
         
-        token_amount = pair_state['token_reserve'] * liquidity_token_amount // pair_state['liquidity']
-        xch_amount = pair_state['xch_reserve'] * liquidity_token_amount // pair_state['liquidity']
+        xch_amount, token_amount = get_removed_amounts(
+            liquidity_token_amount, pair_state['liquidity'], pair_state['xch_reserve'], pair_state['token_reserve']
+        )
 
         if use_fee_estimate:
-            fee = await get_fee_estimate(sb_to_aggregate, full_node_client)
+            fee = await get_fee_estimate(sb_to_aggregate, full_node_client, "remove_liquidity")
             print(f"[!] Using estimated fee: {fee / 10 ** 12} XCH")
 
         offer_dict = {}
@@ -699,7 +709,7 @@ async def _xch_to_token(token_tail_hash, offer, xch_amount, push_tx, fee, use_fe
         last_synced_pair_id_not_none = pair_launcher_id
 
     current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        full_node_client, bytes.fromhex(last_synced_pair_id_not_none)
+        full_node_client, bytes.fromhex(last_synced_pair_id_not_none), get_lineage_store(), launcher_id=bytes.fromhex(pair_launcher_id)
     )
     current_pair_coin_id = current_pair_coin.name().hex()
     click.echo(f"Current pair coin id: {current_pair_coin_id}")
@@ -719,7 +729,7 @@ async def _xch_to_token(token_tail_hash, offer, xch_amount, push_tx, fee, use_fe
             await full_node_client.await_closed()
             sys.exit(1)
 
-        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex()
+        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex()
         click.echo(f"Liquidity asset id: {pair_liquidity_tail_hash}")
 
         wallet_client = await get_wallet_client(get_config_item("chia_root"))
@@ -735,7 +745,7 @@ async def _xch_to_token(token_tail_hash, offer, xch_amount, push_tx, fee, use_fe
             await full_node_client.await_closed()
             sys.exit(1)
         
-        token_amount = 993 * xch_amount * pair_state['token_reserve'] // (1000 * pair_state['xch_reserve'] + 993 * xch_amount)
+        token_amount = get_input_price(xch_amount, pair_state['xch_reserve'], pair_state['token_reserve'])
 
         click.echo(f"You'll receive {token_amount / 1000} tokens from this trade.")
         if token_amount == 0:
@@ -745,7 +755,7 @@ async def _xch_to_token(token_tail_hash, offer, xch_amount, push_tx, fee, use_fe
             await full_node_client.await_closed()
 
         if use_fee_estimate:
-            fee = await get_fee_estimate(sb_to_aggregate, full_node_client)
+            fee = await get_fee_estimate(sb_to_aggregate, full_node_client, "xch_to_token")
             print(f"[!] Using estimated fee: {fee / 10 ** 12} XCH")
 
         offer_dict = {}
@@ -844,7 +854,7 @@ async def _token_to_xch(token_tail_hash, offer, token_amount, push_tx, fee, use_
         last_synced_pair_id_not_none = pair_launcher_id
 
     current_pair_coin, creation_spend, pair_state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(
-        full_node_client, bytes.fromhex(last_synced_pair_id_not_none)
+        full_node_client, bytes.fromhex(last_synced_pair_id_not_none), get_lineage_store(), launcher_id=bytes.fromhex(pair_launcher_id)
     )
     current_pair_coin_id = current_pair_coin.name().hex()
     click.echo(f"Current pair coin id: {current_pair_coin_id}")
@@ -864,7 +874,7 @@ async def _token_to_xch(token_tail_hash, offer, token_amount, push_tx, fee, use_
             await full_node_client.await_closed()
             sys.exit(1)
 
-        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle(bytes.fromhex(pair_launcher_id)).get_tree_hash().hex()
+        pair_liquidity_tail_hash = pair_liquidity_tail_puzzle_hash(bytes.fromhex(pair_launcher_id)).hex()
         click.echo(f"Liquidity asset id: {pair_liquidity_tail_hash}")
 
         wallet_client = await get_wallet_client(get_config_item("chia_root"))
@@ -880,7 +890,7 @@ async def _token_to_xch(token_tail_hash, offer, token_amount, push_tx, fee, use_
             await full_node_client.await_closed()
             sys.exit(1)
 
-        xch_amount = 993 * token_amount * pair_state['xch_reserve'] // (1000 * pair_state['token_reserve'] + 993 * token_amount)
+        xch_amount = get_input_price(token_amount, pair_state['token_reserve'], pair_state['xch_reserve'])
 
         click.echo(f"You'll receive {xch_amount / 1000000000000} XCH from this trade.")
         if token_amount == 0:
@@ -890,7 +900,7 @@ async def _token_to_xch(token_tail_hash, offer, token_amount, push_tx, fee, use_
             await full_node_client.await_closed()
 
         if use_fee_estimate:
-            fee = await get_fee_estimate(sb_to_aggregate, full_node_client)
+            fee = await get_fee_estimate(sb_to_aggregate, full_node_client, "token_to_xch")
             print(f"[!] Using estimated fee: {fee / 10 ** 12} XCH")
 
         offer_dict = {}
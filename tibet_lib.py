@@ -3,6 +3,7 @@ import os
 import sys
 import time
 import requests
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
@@ -33,6 +34,7 @@ from chia.util.bech32m import encode_puzzle_hash
 from chia.util.condition_tools import conditions_dict_for_solution
 from chia.util.condition_tools import conditions_for_solution
 from chia.util.config import load_config
+from chia.util.errors import Err
 from chia.util.hash import std_hash
 from chia.util.ints import uint16
 from chia.util.ints import uint32
@@ -83,12 +85,43 @@ from clvm.casts import int_to_bytes
 from clvm import SExp
 
 from leaflet_client import LeafletFullNodeRpcClient
+from amm import INVERSE_FEE
+from amm import get_deposit_xch_amount
+from amm import get_input_price
+from amm import get_liquidity_to_mint
+from amm import get_removed_amounts
+from batch_rpc import get_puzzles_and_solutions, walk_singleton_lineage
+from lineage_store import LINEAGE_DB_PATH
+from lineage_store import LineageStore
+from spend_cache import CoinSpendCache
+from fee_costs import OperationCostTable
+from fee_costs import SpendBundleCostCache
+from mempool_index import MempoolIndex
+from offer_analysis import OfferAnalysisCache
+from curry_hash import curry_and_treehash
+from curry_hash import shatree_atom
+from curry_hash import shatree_int
+from curry_hash import shatree_pair
 from cic import build_merkle_tree
 from chia.full_node.bundle_tools import simple_solution_generator
 from chia.full_node.mempool_check_conditions import get_name_puzzle_conditions
 
 MEMPOOL_MIN_FEE_INCREASE = uint64(10000000)
 ROUTER_MIN_FEE = 42000000000
+FAST_FORWARD_MAX_HEIGHTS = 10 # blocks fast_forward_pair looks at before falling back to a walk
+
+# parsed creation spends, decoded pair states & reserve coins - keyed by coin id
+COIN_SPEND_CACHE = CoinSpendCache()
+
+# (cost, fee) of mempool spend bundles & cost of the pair operations, used for fee estimates
+SPEND_BUNDLE_COST_CACHE = SpendBundleCostCache()
+OPERATION_COSTS = OperationCostTable()
+
+# decoded offers, keyed by offer hash
+OFFER_ANALYSIS_CACHE = OfferAnalysisCache()
+
+def analyze_offer(offer_str):
+    return OFFER_ANALYSIS_CACHE.get(offer_str)
 
 def program_from_hex(h: str) -> Program:
     return SerializedProgram.from_bytes(bytes.fromhex(h)).to_program()
@@ -130,7 +163,7 @@ REMOVE_LIQUIDITY_PUZZLE = REMOVE_LIQUIDITY_MOD.curry(
 )
 REMOVE_LIQUIDITY_PUZZLE_HASH = REMOVE_LIQUIDITY_PUZZLE.get_tree_hash()
 
-SWAP_PUZZLE = SWAP_MOD.curry(993)
+SWAP_PUZZLE = SWAP_MOD.curry(INVERSE_FEE)
 SWAP_PUZZLE_HASH = SWAP_PUZZLE.get_tree_hash()
 
 # DEFAULT_HIDDEN_PUZZLE is (=) instead of (x)
@@ -147,6 +180,10 @@ MERKLE_ROOT, MERKLE_PROOFS = build_merkle_tree([
     SWAP_PUZZLE_HASH,
     SECRET_PUZZLE_HASH
 ])
+MERKLE_ROOT_TREEHASH = shatree_atom(MERKLE_ROOT)
+
+# number of pairs for which state-independent puzzles are kept in memory
+PUZZLE_CACHE_SIZE = 1024
 
 def get_router_puzzle():
     return ROUTER_MOD.curry(
@@ -161,6 +198,50 @@ def get_router_puzzle():
         ROUTER_MOD_HASH
     )
 
+# hash-only versions of the puzzle constructors (see curry_hash.py)
+# use these whenever the puzzle itself is not revealed
+ROUTER_PUZZLE_HASH = bytes32(curry_and_treehash(
+    ROUTER_MOD_HASH,
+    shatree_atom(PAIR_INNER_PUZZLE_MOD_HASH),
+    shatree_atom(SINGLETON_MOD_HASH),
+    shatree_atom(P2_MERKLE_TREE_MODIFIED_MOD_HASH),
+    shatree_atom(P2_SINGLETON_FLASHLOAN_MOD_HASH),
+    shatree_atom(CAT_MOD_HASH),
+    shatree_atom(OFFER_MOD_HASH),
+    MERKLE_ROOT_TREEHASH,
+    shatree_atom(SINGLETON_LAUNCHER_HASH),
+    shatree_atom(ROUTER_MOD_HASH)
+))
+CAT_MOD_HASH_TREEHASH = shatree_atom(CAT_MOD_HASH)
+SINGLETON_MOD_HASH_TREEHASH = shatree_atom(SINGLETON_MOD_HASH)
+SINGLETON_LAUNCHER_HASH_TREEHASH = shatree_atom(SINGLETON_LAUNCHER_HASH)
+
+
+def cat_puzzle_hash(tail_hash, inner_puzzle_hash):
+    return bytes32(curry_and_treehash(
+        CAT_MOD_HASH,
+        CAT_MOD_HASH_TREEHASH,
+        shatree_atom(tail_hash),
+        inner_puzzle_hash
+    ))
+
+
+def singleton_struct_hash(launcher_id):
+    return shatree_pair(
+        SINGLETON_MOD_HASH_TREEHASH,
+        shatree_pair(shatree_atom(launcher_id), SINGLETON_LAUNCHER_HASH_TREEHASH)
+    )
+
+
+def singleton_puzzle_hash(launcher_id, inner_puzzle_hash):
+    return bytes32(curry_and_treehash(
+        SINGLETON_MOD_HASH,
+        singleton_struct_hash(launcher_id),
+        inner_puzzle_hash
+    ))
+
+
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
 def get_pair_inner_inner_puzzle(singleton_launcher_id, tail_hash):
     return PAIR_INNER_PUZZLE_MOD.curry(
         P2_MERKLE_TREE_MODIFIED_MOD_HASH,
@@ -172,6 +253,19 @@ def get_pair_inner_inner_puzzle(singleton_launcher_id, tail_hash):
     )
 
 
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
+def get_pair_inner_inner_puzzle_hash(singleton_launcher_id, tail_hash):
+    return curry_and_treehash(
+        PAIR_INNER_PUZZLE_MOD_HASH,
+        shatree_atom(P2_MERKLE_TREE_MODIFIED_MOD_HASH),
+        singleton_struct_hash(singleton_launcher_id),
+        shatree_atom(P2_SINGLETON_FLASHLOAN_MOD_HASH),
+        CAT_MOD_HASH_TREEHASH,
+        shatree_atom(OFFER_MOD_HASH),
+        shatree_atom(tail_hash)
+    )
+
+
 def get_pair_inner_puzzle(singleton_launcher_id, tail_hash, liquidity, xch_reserve, token_reserve):
     return P2_MERKLE_TREE_MODIFIED_MOD.curry(
         get_pair_inner_inner_puzzle(singleton_launcher_id, tail_hash),
@@ -180,6 +274,16 @@ def get_pair_inner_puzzle(singleton_launcher_id, tail_hash, liquidity, xch_reser
     )
 
 
+# same as get_pair_inner_puzzle(...).get_tree_hash(), but only hashes the state
+def get_pair_inner_puzzle_hash(singleton_launcher_id, tail_hash, liquidity, xch_reserve, token_reserve):
+    return bytes32(curry_and_treehash(
+        P2_MERKLE_TREE_MODIFIED_MOD_HASH,
+        get_pair_inner_inner_puzzle_hash(singleton_launcher_id, tail_hash),
+        MERKLE_ROOT_TREEHASH,
+        shatree_pair(shatree_int(liquidity), shatree_pair(shatree_int(xch_reserve), shatree_int(token_reserve)))
+    ))
+
+
 def get_pair_puzzle(singleton_launcher_id, tail_hash, liquidity, xch_reserve, token_reserve):
     return puzzle_for_singleton(
         singleton_launcher_id,
@@ -187,15 +291,50 @@ def get_pair_puzzle(singleton_launcher_id, tail_hash, liquidity, xch_reserve, to
     )
 
 
+def get_pair_puzzle_hash(singleton_launcher_id, tail_hash, liquidity, xch_reserve, token_reserve):
+    return singleton_puzzle_hash(
+        singleton_launcher_id,
+        get_pair_inner_puzzle_hash(singleton_launcher_id, tail_hash, liquidity, xch_reserve, token_reserve)
+    )
+
+
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
 def pair_liquidity_tail_puzzle(pair_launcher_id):
     return LIQUIDITY_TAIL_MOD.curry(
         (SINGLETON_MOD_HASH, (pair_launcher_id, SINGLETON_LAUNCHER_HASH))
     )
 
+
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
+def pair_liquidity_tail_puzzle_hash(pair_launcher_id):
+    return bytes32(curry_and_treehash(LIQUIDITY_TAIL_MOD_HASH, singleton_struct_hash(pair_launcher_id)))
+
 # https://github.com/Chia-Network/chia-blockchain/blob/main/chia/wallet/puzzles/singleton_top_layer_v1_1.py
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
 def pay_to_singleton_flashloan_puzzle(launcher_id: bytes32) -> Program:
     return P2_SINGLETON_FLASHLOAN_MOD.curry(SINGLETON_MOD_HASH, launcher_id, SINGLETON_LAUNCHER_HASH)
 
+
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
+def pay_to_singleton_flashloan_puzzle_hash(launcher_id: bytes32) -> bytes32:
+    return bytes32(curry_and_treehash(
+        P2_SINGLETON_FLASHLOAN_MOD_HASH,
+        SINGLETON_MOD_HASH_TREEHASH,
+        shatree_atom(launcher_id),
+        SINGLETON_LAUNCHER_HASH_TREEHASH
+    ))
+
+
+# reserve CAT puzzle
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
+def pay_to_singleton_flashloan_cat_puzzle(launcher_id: bytes32, tail_hash: bytes32) -> Program:
+    return construct_cat_puzzle(CAT_MOD, tail_hash, pay_to_singleton_flashloan_puzzle(launcher_id))
+
+
+@lru_cache(maxsize=PUZZLE_CACHE_SIZE)
+def pay_to_singleton_flashloan_cat_puzzle_hash(launcher_id: bytes32, tail_hash: bytes32) -> bytes32:
+    return cat_puzzle_hash(tail_hash, pay_to_singleton_flashloan_puzzle_hash(launcher_id))
+
 # https://github.com/Chia-Network/chia-blockchain/blob/main/chia/wallet/puzzles/singleton_top_layer_v1_1.py
 def solution_for_p2_singleton_flashloan(
     p2_singleton_coin: Coin,
@@ -364,6 +503,63 @@ def get_spend_bundle_cost(sb: SpendBundle):
     )
     return int(npc_result.cost)
 
+# returns (cost, fee); each spend bundle is only simulated once
+def get_spend_bundle_cost_and_fee(sb: SpendBundle):
+    name = sb.name()
+    cost_and_fee = SPEND_BUNDLE_COST_CACHE.get(name)
+    if cost_and_fee is None:
+        cost_and_fee = (get_spend_bundle_cost(sb), sb.fees())
+        SPEND_BUNDLE_COST_CACHE.put(name, *cost_and_fee)
+    return cost_and_fee
+
+# the node only accepts spend bundles up to half a block's cost
+MAX_SPEND_BUNDLE_COST = DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM // 2
+
+# local version of the node's checks, to reject doomed spend bundles without pushing them
+#   - runs the bundle with the real cost limit in mempool mode, which also fails if an asserted
+#     announcement isn't created in the bundle or more mojos are created than spent
+#   - no coin may be spent by a mempool transaction the bundle doesn't include (stale state)
+#   - synced_coins (the pair & reserve coins the bundle was built on, from sync_pair and
+#     get_pair_reserve_info) must all be spent; any other coin with one of their puzzle hashes
+#     spent by own_sb (sb without the aggregated mempool bundle) must be created within sb
+# the aggregated signature and the existence of the offer's coins are not checked
+# returns (error or None, cost)
+def dry_run_spend_bundle(sb: SpendBundle, mempool_index=None, max_cost=MAX_SPEND_BUNDLE_COST, synced_coins=[], own_sb=None):
+    npc_result: NPCResult = get_name_puzzle_conditions(
+            simple_solution_generator(sb),
+            max_cost,
+            cost_per_byte=DEFAULT_CONSTANTS.COST_PER_BYTE,
+            mempool_mode=True,
+    )
+    if npc_result.error is not None:
+        return f"spend bundle failed to run: {Err(npc_result.error).name}", 0
+
+    cost = int(npc_result.cost)
+
+    spent_coin_ids = set(cs.coin.name() for cs in sb.coin_spends)
+    synced_coin_ids = set(coin.name() for coin in synced_coins if coin is not None)
+    synced_puzzle_hashes = set(coin.puzzle_hash for coin in synced_coins if coin is not None)
+    for coin_id in synced_coin_ids:
+        if coin_id not in spent_coin_ids:
+            return f"synced coin {coin_id.hex()} is not spent by the spend bundle", cost
+
+    created_coin_ids = set()
+    for spend in npc_result.conds.spends:
+        for puzzle_hash, amount, _ in spend.create_coin:
+            created_coin_ids.add(Coin(spend.coin_id, puzzle_hash, amount).name())
+    for cs in (own_sb or sb).coin_spends:
+        coin_id = cs.coin.name()
+        if cs.coin.puzzle_hash in synced_puzzle_hashes and coin_id not in synced_coin_ids and coin_id not in created_coin_ids:
+            return f"coin {coin_id.hex()} does not match the synced pair state", cost
+
+    if mempool_index is not None and mempool_index.is_fresh():
+        for coin_id in spent_coin_ids:
+            mempool_sb = mempool_index.get_spend_bundle_by_coin_id(coin_id)
+            if mempool_sb is not None and any(cs.coin.name() not in spent_coin_ids for cs in mempool_sb.coin_spends):
+                return f"coin {coin_id.hex()} is already spent by another mempool transaction", cost
+
+    return None, cost
+
 # my_solution = program_from_hex("80") # ()
 # # run '(mod () (include condition_codes.clvm) (list (list CREATE_COIN 0x0000000000000000000000000000000000000000000000000000000000000001 1)))' -i include/ -d
 # my_puzzle = program_from_hex("ff02ffff01ff04ffff04ff02ffff01ffa00000000000000000000000000000000000000000000000000000000000000001ff018080ff8080ffff04ffff0133ff018080")
@@ -401,7 +597,7 @@ async def create_pair_from_coin(
     router_singleton_spend = CoinSpend(current_router_coin, router_singleton_puzzle, router_singleton_solution)
 
     pair_launcher_coin = Coin(current_router_coin.name(), SINGLETON_LAUNCHER_HASH, 2)
-    pair_puzzle = get_pair_puzzle(
+    pair_puzzle_hash = get_pair_puzzle_hash(
         pair_launcher_coin.name(),
         tail_hash,
         0, 0, 0
@@ -413,7 +609,7 @@ async def create_pair_from_coin(
     # and the solution says the amount is 1 *-*
     pair_launcher_solution = Program.to(
         [
-            pair_puzzle.get_tree_hash(),
+            pair_puzzle_hash,
             1,
             comment,
         ]
@@ -456,11 +652,17 @@ async def sync_router(full_node_client, last_router_id):
         # hack
         current_router_coin, creation_spend, _ = await sync_router(full_node_client, coin_record.coin.parent_coin_info)
         return current_router_coin, creation_spend, []
-    
-    router_puzzle_hash = get_router_puzzle().get_tree_hash()
 
-    while coin_record.spent:
-        creation_spend = await full_node_client.get_puzzle_and_solution(last_router_id, coin_record.spent_block_index)
+    # every router coin has the same puzzle hash, so one request returns the whole lineage
+    lineage_puzzle_hash = coin_record.coin.puzzle_hash
+    if lineage_puzzle_hash == SINGLETON_LAUNCHER_HASH:
+        lineage_puzzle_hash = singleton_puzzle_hash(coin_record.coin.name(), ROUTER_PUZZLE_HASH)
+
+    lineage = await walk_singleton_lineage(full_node_client, coin_record, puzzle_hash=lineage_puzzle_hash)
+    creation_spends = await get_puzzles_and_solutions(full_node_client, lineage[:-1])
+
+    for coin_record in lineage[:-1]:
+        creation_spend = creation_spends[coin_record.coin.name()]
         conditions_dict = conditions_dict_for_solution(
             creation_spend.puzzle_reveal,
             creation_spend.solution,
@@ -475,10 +677,8 @@ async def sync_router(full_node_client, last_router_id):
             new_puzzle_hash = cwa.vars[0]
             new_amount = cwa.vars[1]
 
-            if new_amount == b"\x01": # CREATE_COIN with amount=1 -> router recreated
-                new_router_coin = Coin(last_router_id, new_puzzle_hash, 1)
-
-                last_router_id = new_router_coin.name()
+            if new_amount == b"\x01": # CREATE_COIN with amount=1 -> router recreated (already followed)
+                continue
             elif new_amount == b"\x02": # CREATE_COIN with amount=2 -> pair launcher deployed
                 assert new_puzzle_hash == SINGLETON_LAUNCHER_HASH
                 
@@ -489,13 +689,14 @@ async def sync_router(full_node_client, last_router_id):
             else:
                 print("Someone did something extremely weird with the router - time to call the cops.")
                 sys.exit(1)
-
-        coin_record = await full_node_client.get_coin_record_by_name(last_router_id)
     
-    return coin_record.coin, creation_spend, new_pairs
+    return lineage[-1].coin, creation_spend, new_pairs
 
 
-async def get_spend_bundle_in_mempool(full_node_client, coin):
+async def get_spend_bundle_in_mempool(full_node_client, coin, mempool_index=None):
+    if mempool_index is not None and mempool_index.is_fresh():
+        return mempool_index.get_spend_bundle_by_coin_id(coin.name())
+
     try:
         parent_id_hex = "0x" + coin.parent_coin_info.hex()
         r = requests.post("http://localhost:1337/get_mempool_item_by_parent_coin_info", json={
@@ -535,64 +736,124 @@ def get_coin_spend_from_sb(sb, coin_name):
     return None
 
 
-async def sync_pair(full_node_client, last_synced_coin_id):
+async def sync_pair(full_node_client, last_synced_coin_id, lineage_store=None, mempool_index=None, launcher_id=None):
     state = {
         "liquidity": 0,
         "xch_reserve": 0,
         "token_reserve": 0
     }
-    coin_record = await full_node_client.get_coin_record_by_name(last_synced_coin_id)
+
+    latest = None
+    coin_record = None
+    if lineage_store is not None:
+        # resume from the latest recorded coin instead of walking the whole history
+        latest = await lineage_store.get_latest(last_synced_coin_id)
+        while latest is not None:
+            coin_record = await full_node_client.get_coin_record_by_name(latest["coin_id"])
+            if coin_record is not None:
+                last_synced_coin_id = latest["coin_id"]
+                launcher_id = latest["launcher_id"]
+                break
+
+            # reorg - forget the coin (and everything after it), then try the one before
+            await lineage_store.truncate(latest["launcher_id"], latest["confirmed_height"])
+            latest = await lineage_store.get_latest(latest["launcher_id"])
+
+    if coin_record is None:
+        coin_record = await full_node_client.get_coin_record_by_name(last_synced_coin_id)
     last_synced_coin = coin_record.coin
     creation_spend = None
 
     if coin_record.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
         creation_spend = await full_node_client.get_puzzle_and_solution(last_synced_coin_id, coin_record.spent_block_index)
-        conditions_dict = conditions_dict_for_solution(
-            creation_spend.puzzle_reveal,
-            creation_spend.solution,
-            INFINITE_COST
-        )
+        conditions_dict = COIN_SPEND_CACHE.conditions_dict(creation_spend)
         last_synced_coin = Coin(coin_record.coin.name(), conditions_dict[ConditionOpcode.CREATE_COIN][0].vars[0], 1)
 
     if not coin_record.spent:
-        # hack
-        current_pair_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(full_node_client, coin_record.coin.parent_coin_info)
-        return current_pair_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain
+        if latest is not None and latest["creation_spend"] is not None:
+            # the lineage store already knows how this coin was created
+            creation_spend = latest["creation_spend"]
+        elif latest is not None:
+            # recorded without its creation spend (catch-up hop) - syncing from the parent would
+            # resume from this same row again, so fetch the spend and record it
+            creation_spend = await full_node_client.get_puzzle_and_solution(
+                coin_record.coin.parent_coin_info, coin_record.confirmed_block_index
+            )
+            await lineage_store.add_coins([(
+                launcher_id,
+                coin_record.coin,
+                creation_spend,
+                get_pair_state_from_creation_spend(creation_spend),
+                coin_record.confirmed_block_index
+            )])
+        else:
+            # hack
+            current_pair_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain = await sync_pair(full_node_client, coin_record.coin.parent_coin_info, lineage_store, mempool_index, launcher_id)
+            return current_pair_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain
 
-    creation_spend = None
-    while coin_record.spent:
-        creation_spend = await full_node_client.get_puzzle_and_solution(last_synced_coin_id, coin_record.spent_block_index)
-        conditions_dict = conditions_dict_for_solution(
-            creation_spend.puzzle_reveal,
-            creation_spend.solution,
-            INFINITE_COST
+    if coin_record.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
+        launcher_id = coin_record.coin.name()
+
+    lineage_coins = [] # new coins for the lineage store
+    if coin_record.spent and launcher_id is not None:
+        fast_forward = await fast_forward_pair(full_node_client, launcher_id)
+        if fast_forward is not None:
+            # intermediate hops are skipped - the lineage store only learns about the latest coin
+            coin_record, creation_spend = fast_forward
+            last_synced_coin = coin_record.coin
+            last_synced_coin_id = last_synced_coin.name()
+
+            lineage_coins.append((
+                launcher_id,
+                last_synced_coin,
+                creation_spend,
+                get_pair_state_from_creation_spend(creation_spend),
+                coin_record.confirmed_block_index
+            ))
+
+    if coin_record.spent:
+        # walk the lineage using coin records only, then download just the spend that created the
+        # current coin (state); the lineage store records the other hops without their spends
+        lineage = await walk_singleton_lineage(
+            full_node_client,
+            coin_record,
+            marker_puzzle_hash=pay_to_singleton_flashloan_puzzle_hash(launcher_id) if launcher_id is not None else None
         )
-        
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
-            new_puzzle_hash = cwa.vars[0]
-            new_amount = cwa.vars[1]
+        creation_spends = await get_puzzles_and_solutions(full_node_client, lineage[-2:-1])
+
+        if lineage_store is not None:
+            cs = creation_spends[lineage[-2].coin.name()]
+            lineage_launcher_id = launcher_id or get_launcher_id_from_creation_spend(cs)
+            for child_record in lineage[1:-1]:
+                lineage_coins.append((lineage_launcher_id, child_record.coin, None, None, child_record.confirmed_block_index))
+            lineage_coins.append((
+                lineage_launcher_id,
+                lineage[-1].coin,
+                cs,
+                get_pair_state_from_creation_spend(cs),
+                lineage[-1].confirmed_block_index
+            ))
+
+        creation_spend = creation_spends[lineage[-2].coin.name()]
+        coin_record = lineage[-1]
+        last_synced_coin = coin_record.coin
+        last_synced_coin_id = last_synced_coin.name()
+
+    if lineage_store is not None:
+        # a single transaction for the whole catch-up
+        await lineage_store.add_coins(lineage_coins)
 
-            if new_amount == b"\x01": # CREATE_COIN with amount=1 -> pair recreation
-                last_synced_coin = Coin(last_synced_coin_id, new_puzzle_hash, 1)
-                last_synced_coin_id = last_synced_coin.name()
-
-        coin_record = await full_node_client.get_coin_record_by_name(last_synced_coin_id)
-    
     last_synced_pair_id_on_blockchain = last_synced_coin_id
     # mempool - watch this aggregation!
     last_coin_on_chain = coin_record.coin 
     last_coin_on_chain_id = last_coin_on_chain.name()
-    sb = await get_spend_bundle_in_mempool(full_node_client, last_coin_on_chain)
+    sb = await get_spend_bundle_in_mempool(full_node_client, last_coin_on_chain, mempool_index)
     sb_to_aggregate = sb
 
     coin_spend = get_coin_spend_from_sb(sb, last_coin_on_chain_id)
     while coin_spend != None:
         creation_spend = coin_spend
-        conditions_dict = conditions_dict_for_solution(
-            creation_spend.puzzle_reveal,
-            creation_spend.solution,
-            INFINITE_COST
-        )
+        conditions_dict = COIN_SPEND_CACHE.conditions_dict(creation_spend)
         
         for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
             new_puzzle_hash = cwa.vars[0]
@@ -607,6 +868,67 @@ async def sync_pair(full_node_client, last_synced_coin_id):
     if creation_spend.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
         return last_synced_coin, creation_spend, state, None, last_synced_coin.name()
 
+    state = get_pair_state_from_creation_spend(creation_spend)
+
+    return last_synced_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain
+
+
+# jumps straight to the latest confirmed pair coin without walking its lineage
+# every pair spend recreates the XCH reserve (a p2 singleton flashloan coin), so the block that
+# confirmed the current reserve coin also contains the spend that created the current pair coin
+# anyone can send coins to the reserve puzzle hash, so the newest blocks with an unspent coin there
+# are tried (up to FAST_FORWARD_MAX_HEIGHTS) until one contains a pair spend
+# returns (coin record, creation spend) or None if the pair can't be fast-forwarded (e.g., empty reserve)
+async def fast_forward_pair(full_node_client, launcher_id, max_heights=FAST_FORWARD_MAX_HEIGHTS):
+    reserve_records = await full_node_client.get_coin_records_by_puzzle_hash(
+        pay_to_singleton_flashloan_puzzle_hash(launcher_id), include_spent_coins=False
+    )
+    heights = sorted(set(coin_record.confirmed_block_index for coin_record in reserve_records), reverse=True)
+
+    for height in heights[:max_heights]:
+        block_record = await full_node_client.get_block_record_by_height(height)
+        spends = await full_node_client.get_block_spends(block_record.header_hash)
+        spent_coin_ids = set(spend.coin.name() for spend in spends)
+
+        for spend in spends:
+            if spend.coin.amount != 1 or not is_pair_spend(spend, launcher_id):
+                continue
+
+            new_coin = get_singleton_child(spend)
+            if new_coin is None or new_coin.name() in spent_coin_ids: # melted or spent again in the same block
+                continue
+
+            coin_record = await full_node_client.get_coin_record_by_name(new_coin.name())
+            if coin_record is None:
+                return None
+            return coin_record, spend
+
+    return None
+
+
+def is_pair_spend(coin_spend, launcher_id):
+    if coin_spend.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
+        return False
+
+    mod, _ = coin_spend.puzzle_reveal.uncurry()
+    if mod.get_tree_hash() != SINGLETON_MOD_HASH:
+        return False
+    return get_launcher_id_from_creation_spend(coin_spend) == launcher_id
+
+
+def get_pair_state_from_creation_spend(creation_spend):
+    state = COIN_SPEND_CACHE.get(creation_spend, "state", lambda: decode_pair_state(creation_spend))
+    return dict(state)
+
+
+def decode_pair_state(creation_spend):
+    if creation_spend.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
+        return {
+            "liquidity": 0,
+            "xch_reserve": 0,
+            "token_reserve": 0
+        }
+
     old_state = creation_spend.puzzle_reveal.uncurry()[1].at("rf").uncurry()[1].at("rrf")
     p2_merkle_solution = creation_spend.solution.to_program().at("rrf")
     new_state_puzzle = p2_merkle_solution.at("f") # p2_merkle_tree_modified -> parameters (which is a puzzle)
@@ -627,13 +949,70 @@ async def sync_pair(full_node_client, last_synced_coin_id):
     new_state_puzzle_output = new_state_puzzle.run(new_state_puzzle_sol)
     new_state = new_state_puzzle_output.at("f")
 
-    state = {
+    return {
         "liquidity": new_state.at("f").as_int(),
         "xch_reserve": new_state.at("rf").as_int(),
         "token_reserve": new_state.at("rr").as_int()
     }
 
-    return last_synced_coin, creation_spend, state, sb_to_aggregate, last_synced_pair_id_on_blockchain
+
+def get_launcher_id_from_creation_spend(creation_spend):
+    if creation_spend.coin.puzzle_hash == SINGLETON_LAUNCHER_HASH:
+        return creation_spend.coin.name()
+
+    # SINGLETON_STRUCT is (MOD_HASH . (LAUNCHER_ID . LAUNCHER_PUZZLE_HASH))
+    return bytes32(creation_spend.puzzle_reveal.uncurry()[1].at("f").at("rf").as_atom())
+
+
+def get_singleton_child(coin_spend):
+    conditions_dict = COIN_SPEND_CACHE.conditions_dict(coin_spend)
+
+    for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
+        if cwa.vars[1] == b"\x01": # CREATE_COIN with amount=1 -> singleton recreation
+            return Coin(coin_spend.coin.name(), cwa.vars[0], 1)
+
+    return None
+
+
+# advances every tracked singleton spent in the block at the given height
+#   coin_index: current (unspent) singleton coin id -> key (e.g., pair launcher id)
+#   returns: key -> (new singleton coin, spend that created it)
+#   every pair hop is also recorded in lineage_store (if given); keys that are None (the router) are not
+async def follow_block(full_node_client, height, coin_index, lineage_store=None):
+    block_record = await full_node_client.get_block_record_by_height(height)
+    if block_record is None or not block_record.is_transaction_block:
+        return {}
+
+    spends = await full_node_client.get_block_spends(block_record.header_hash)
+    spends_by_coin_id = {}
+    for spend in spends:
+        spends_by_coin_id[spend.coin.name()] = spend
+
+    updates = {}
+    lineage_coins = [] # new coins for the lineage store, written in one transaction
+    for coin_id, key in coin_index.items():
+        # a singleton can be spent multiple times in the same block
+        while coin_id in spends_by_coin_id:
+            creation_spend = spends_by_coin_id[coin_id]
+            new_coin = get_singleton_child(creation_spend)
+            if new_coin is None: # singleton melted
+                break
+
+            updates[key] = (new_coin, creation_spend)
+            coin_id = new_coin.name()
+
+            if lineage_store is not None and key is not None:
+                lineage_coins.append((
+                    get_launcher_id_from_creation_spend(creation_spend),
+                    new_coin,
+                    creation_spend,
+                    get_pair_state_from_creation_spend(creation_spend),
+                    height
+                ))
+
+    if lineage_store is not None:
+        await lineage_store.add_coins(lineage_coins)
+    return updates
 
 
 async def get_pair_reserve_info(
@@ -644,22 +1023,20 @@ async def get_pair_reserve_info(
     creation_spend,
     cached_sb
 ):
+    cached_reserve_info = COIN_SPEND_CACHE.lookup(creation_spend, "reserve_info")
+    if cached_reserve_info is not None:
+        return cached_reserve_info
+
     puzzle_announcements_asserts = []
-    conditions_dict = conditions_dict_for_solution(
-        creation_spend.puzzle_reveal,
-        creation_spend.solution,
-        INFINITE_COST
-    )
+    conditions_dict = COIN_SPEND_CACHE.conditions_dict(creation_spend)
     for cwa in conditions_dict.get(ConditionOpcode.ASSERT_PUZZLE_ANNOUNCEMENT, []):
         puzzle_announcements_asserts.append(cwa.vars[0])
 
     if len(puzzle_announcements_asserts) == 0:
         return None, None, None # new pair
 
-    p2_singleton_puzzle = pay_to_singleton_flashloan_puzzle(pair_launcher_id)
-    p2_singleton_puzzle_hash = p2_singleton_puzzle.get_tree_hash()
-    p2_singleton_cat_puzzle = construct_cat_puzzle(CAT_MOD, token_tail_hash, p2_singleton_puzzle)
-    p2_singleton_cat_puzzle_hash = p2_singleton_cat_puzzle.get_tree_hash()
+    p2_singleton_puzzle_hash = pay_to_singleton_flashloan_puzzle_hash(pair_launcher_id)
+    p2_singleton_cat_puzzle_hash = pay_to_singleton_flashloan_cat_puzzle_hash(pair_launcher_id, token_tail_hash)
 
     spends = []
 
@@ -674,11 +1051,7 @@ async def get_pair_reserve_info(
     token_reserve_coin = None
     token_reserve_lineage_proof = []
     for spend in spends:
-        conditions_dict = conditions_dict_for_solution(
-            spend.puzzle_reveal,
-            spend.solution,
-            INFINITE_COST
-        )
+        conditions_dict = COIN_SPEND_CACHE.conditions_dict(spend)
 
         for cwa in conditions_dict.get(ConditionOpcode.CREATE_PUZZLE_ANNOUNCEMENT, []):
             ann_hash = std_hash(spend.coin.puzzle_hash + cwa.vars[0])
@@ -697,8 +1070,10 @@ async def get_pair_reserve_info(
                         spend.coin.amount
                     ]
                 break
-    
-    return xch_reserve_coin, token_reserve_coin, token_reserve_lineage_proof
+
+    reserve_info = (xch_reserve_coin, token_reserve_coin, token_reserve_lineage_proof)
+    COIN_SPEND_CACHE.store(creation_spend, "reserve_info", reserve_info)
+    return reserve_info
 
 
 def get_announcements_asserts_for_notarized_payments(not_payments, puzzle_hash=OFFER_MOD_HASH):
@@ -718,6 +1093,97 @@ def get_announcements_asserts_for_notarized_payments(not_payments, puzzle_hash=O
     return announcement_asserts
 
 
+# cheap checks of an offer against the pair state & AMM math, run before any spend bundle is built
+# operation: "swap", "add_liquidity" or "remove_liquidity"
+# returns None if the offer looks fine, else {"error": <code>, "message": <explanation>}
+def validate_offer(
+    operation,
+    offer_str,
+    pair_launcher_id,
+    token_tail_hash,
+    pair_liquidity,
+    pair_xch_reserve,
+    pair_token_reserve,
+    total_donation_amount=0,
+    donation_addresses=[]
+):
+    try:
+        offer_analysis = analyze_offer(offer_str)
+    except Exception as e:
+        return {"error": "invalid_offer", "message": f"Could not decode offer: {e}"}
+
+    requested_amounts = offer_analysis.requested_amounts
+    eph_xch_coin, _ = offer_analysis.get_created_coin(OFFER_MOD_HASH)
+    eph_token_coin, _ = offer_analysis.get_created_coin(cat_puzzle_hash(token_tail_hash, OFFER_MOD_HASH))
+    liquidity_cat_tail_hash = pair_liquidity_tail_puzzle_hash(pair_launcher_id)
+
+    if operation == "swap":
+        if eph_token_coin is not None: # token -> XCH
+            if list(requested_amounts.keys()) != [None]:
+                return {"error": "wrong_asset", "message": "Offer should only ask for XCH."}
+            output_amount = get_input_price(eph_token_coin.amount, pair_token_reserve, pair_xch_reserve)
+            if requested_amounts[None] + total_donation_amount > output_amount:
+                return {"error": "wrong_amount", "message": f"Offer asks for too much XCH ({requested_amounts[None]}; at most {output_amount - total_donation_amount} mojos)."}
+        elif eph_xch_coin is not None: # XCH -> token
+            if list(requested_amounts.keys()) != [token_tail_hash]:
+                return {"error": "wrong_asset", "message": "Offer should only ask for the pair's token."}
+            if eph_xch_coin.amount <= total_donation_amount:
+                return {"error": "wrong_amount", "message": "Offered XCH amount does not cover the donation."}
+            output_amount = get_input_price(eph_xch_coin.amount - total_donation_amount, pair_xch_reserve, pair_token_reserve)
+            if requested_amounts[token_tail_hash] != output_amount:
+                return {"error": "wrong_amount", "message": f"Offer should ask for exactly {output_amount} token mojos, not {requested_amounts[token_tail_hash]}."}
+        else:
+            return {"error": "wrong_asset", "message": "Offer should offer XCH or the pair's token."}
+
+        if output_amount == 0:
+            return {"error": "wrong_amount", "message": "Swap amount too small."}
+        if total_donation_amount > 0 and len(donation_addresses) == 0:
+            return {"error": "invalid_donation", "message": "Donation amount given without donation addresses."}
+        return None
+
+    if operation == "add_liquidity":
+        if eph_xch_coin is None or eph_token_coin is None:
+            return {"error": "wrong_asset", "message": "Offer should offer both XCH and the pair's token."}
+        if list(requested_amounts.keys()) != [liquidity_cat_tail_hash]:
+            return {"error": "wrong_asset", "message": "Offer should only ask for the pair's liquidity token."}
+
+        new_liquidity_token_amount = requested_amounts[liquidity_cat_tail_hash]
+        deposited_token_amount = eph_token_coin.amount
+        target_liquidity_tokens = get_liquidity_to_mint(deposited_token_amount, pair_liquidity, pair_token_reserve)
+        deposited_xch_amount = get_deposit_xch_amount(deposited_token_amount, pair_xch_reserve, pair_token_reserve)
+        if deposited_xch_amount is None:
+            deposited_xch_amount = eph_xch_coin.amount - new_liquidity_token_amount
+
+        if target_liquidity_tokens > new_liquidity_token_amount:
+            return {"error": "wrong_amount", "message": f"Your offer is asking for too much liquidity ({new_liquidity_token_amount}; should be {target_liquidity_tokens})."}
+        if eph_xch_coin.amount - new_liquidity_token_amount != deposited_xch_amount:
+            return {"error": "wrong_amount", "message": f"For {new_liquidity_token_amount} liquidity, you should be offering {deposited_xch_amount + new_liquidity_token_amount} mojos, not {eph_xch_coin.amount}."}
+        return None
+
+    if operation == "remove_liquidity":
+        eph_liquidity_coin, _ = offer_analysis.get_created_coin(cat_puzzle_hash(liquidity_cat_tail_hash, OFFER_MOD_HASH))
+        if eph_liquidity_coin is None:
+            return {"error": "wrong_asset", "message": "Offer should offer the pair's liquidity token."}
+        if sorted(requested_amounts.keys(), key=lambda k: b"" if k is None else k) != [None, token_tail_hash]:
+            return {"error": "wrong_asset", "message": "Offer should ask for XCH and the pair's token."}
+
+        burned_liquidity_amount = eph_liquidity_coin.amount
+        if burned_liquidity_amount > pair_liquidity:
+            return {"error": "wrong_amount", "message": f"Offer burns more liquidity ({burned_liquidity_amount}) than the pair has ({pair_liquidity})."}
+
+        removed_xch_amount, removed_token_amount = get_removed_amounts(
+            burned_liquidity_amount, pair_liquidity, pair_xch_reserve, pair_token_reserve
+        )
+        # the burned liquidity tokens' mojos are returned with the XCH
+        if requested_amounts[None] != removed_xch_amount + burned_liquidity_amount:
+            return {"error": "wrong_amount", "message": f"Offer should ask for exactly {removed_xch_amount + burned_liquidity_amount} mojos, not {requested_amounts[None]}."}
+        if requested_amounts[token_tail_hash] != removed_token_amount:
+            return {"error": "wrong_amount", "message": f"Offer should ask for exactly {removed_token_amount} token mojos, not {requested_amounts[token_tail_hash]}."}
+        return None
+
+    return {"error": "invalid_operation", "message": f"Unknown operation {operation}."}
+
+
 async def respond_to_deposit_liquidity_offer(
     pair_launcher_id,
     current_pair_coin,
@@ -732,65 +1198,28 @@ async def respond_to_deposit_liquidity_offer(
     last_token_reserve_lineage_proof # coin_parent_coin_info, inner_puzzle_hash, amount
 ):
     # 1. Detect ephemeral coins (those created by the offer that we're allowed to use)
-    offer = Offer.from_bech32(offer_str)
-    offer_spend_bundle = offer.to_spend_bundle()
-    offer_coin_spends = offer_spend_bundle.coin_spends
+    offer_analysis = analyze_offer(offer_str)
+    offer_spend_bundle = offer_analysis.spend_bundle
 
-    eph_xch_coin = None
-    eph_token_coin = None
+    ephemeral_token_coin_puzzle_hash = cat_puzzle_hash(token_tail_hash, OFFER_MOD_HASH)
 
-    eph_token_coin_creation_spend = None # needed when spending eph_token_coin since it's a CAT
-    announcement_asserts = [] # assert everything when the liquidity cat is minted
+    eph_xch_coin, _ = offer_analysis.get_created_coin(OFFER_MOD_HASH)
+    # creation spend needed when spending eph_token_coin since it's a CAT
+    eph_token_coin, eph_token_coin_creation_spend = offer_analysis.get_created_coin(ephemeral_token_coin_puzzle_hash)
 
-    ephemeral_token_coin_puzzle = construct_cat_puzzle(CAT_MOD, token_tail_hash, OFFER_MOD)
-    ephemeral_token_coin_puzzle_hash = ephemeral_token_coin_puzzle.get_tree_hash()
-
-    cs_from_initial_offer = [] # all valid coin spends (i.e., not 'hints' for offered assets or coins)
-    
-    for coin_spend in offer_coin_spends:
-        if coin_spend.coin.parent_coin_info == b"\x00" * 32: # 'hint' for offer requested coin (liquidity CAT)
-            continue
-        
-        cs_from_initial_offer.append(coin_spend)
-        conditions_dict = conditions_dict_for_solution(
-            coin_spend.puzzle_reveal,
-            coin_spend.solution,
-            INFINITE_COST
-        )
-
-        # is this spend creating an ephemeral coin?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
-            puzzle_hash = cwa.vars[0]
-            amount = SExp.to(cwa.vars[1]).as_int()
-
-            if puzzle_hash == OFFER_MOD_HASH:
-                eph_xch_coin = Coin(coin_spend.coin.name(), puzzle_hash, amount)
-            
-            if puzzle_hash == ephemeral_token_coin_puzzle_hash:
-                eph_token_coin = Coin(coin_spend.coin.name(), puzzle_hash, amount)
-                eph_token_coin_creation_spend = coin_spend
-
-        # is there any announcement that we'll need to assert?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN_ANNOUNCEMENT, []): #cwa = condition with args
-            announcement_asserts.append([
-                ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT,
-                std_hash(coin_spend.coin.name() + cwa.vars[0])
-            ])
+    announcement_asserts = list(offer_analysis.announcement_asserts) # assert everything when the liquidity cat is minted
+    cs_from_initial_offer = list(offer_analysis.coin_spends) # all valid coin spends (i.e., not 'hints' for offered assets or coins)
 
     # 2. Math stuff
     deposited_token_amount = eph_token_coin.amount
 
-    new_liquidity_token_amount = 0
-    for k, v in offer.get_requested_amounts().items():
-        new_liquidity_token_amount = v
+    new_liquidity_token_amount = offer_analysis.get_requested_amount()
 
-    target_liquidity_tokens = deposited_token_amount
-    if pair_liquidity > 0:
-        target_liquidity_tokens = deposited_token_amount * pair_liquidity // pair_token_reserve
+    target_liquidity_tokens = get_liquidity_to_mint(deposited_token_amount, pair_liquidity, pair_token_reserve)
 
-    deposited_xch_amount = eph_xch_coin.amount - new_liquidity_token_amount
-    if pair_token_reserve != 0:
-        deposited_xch_amount = pair_xch_reserve * deposited_token_amount // pair_token_reserve
+    deposited_xch_amount = get_deposit_xch_amount(deposited_token_amount, pair_xch_reserve, pair_token_reserve)
+    if deposited_xch_amount is None:
+        deposited_xch_amount = eph_xch_coin.amount - new_liquidity_token_amount
 
     if target_liquidity_tokens > new_liquidity_token_amount:
         raise Exception(f"Your offer is asking for too much liquidity ({new_liquidity_token_amount}; should be {target_liquidity_tokens}) - you need to offer at least {deposited_xch_amount} mojos and {deposited_token_amount} token mojos (/1000 to find out the number of tokens).")
@@ -800,13 +1229,13 @@ async def respond_to_deposit_liquidity_offer(
 
     # 3. spend the token ephemeral coin to create the token reserve coin
     p2_singleton_puzzle = pay_to_singleton_flashloan_puzzle(pair_launcher_id)
-    p2_singleton_puzzle_cat =  construct_cat_puzzle(CAT_MOD, token_tail_hash, p2_singleton_puzzle)
+    p2_singleton_puzzle_hash = pay_to_singleton_flashloan_puzzle_hash(pair_launcher_id)
     
     eph_token_coin_notarized_payments = []
     eph_token_coin_notarized_payments.append(
         Program.to([
             current_pair_coin.name(),
-            [p2_singleton_puzzle.get_tree_hash(), deposited_token_amount + pair_token_reserve]
+            [p2_singleton_puzzle_hash, deposited_token_amount + pair_token_reserve]
         ])
     )
 
@@ -845,6 +1274,13 @@ async def respond_to_deposit_liquidity_offer(
         pair_xch_reserve,
         pair_token_reserve
     )
+    pair_singleton_inner_puzzle_hash = get_pair_inner_puzzle_hash(
+        pair_launcher_id,
+        token_tail_hash,
+        pair_liquidity,
+        pair_xch_reserve,
+        pair_token_reserve
+    )
     if last_token_reserve_coin is not None:
         spendable_cats_for_token_reserve.append(
             SpendableCAT(
@@ -852,7 +1288,7 @@ async def respond_to_deposit_liquidity_offer(
                 token_tail_hash,
                 p2_singleton_puzzle,
                 solution_for_p2_singleton_flashloan(
-                    last_token_reserve_coin, pair_singleton_inner_puzzle.get_tree_hash()
+                    last_token_reserve_coin, pair_singleton_inner_puzzle_hash
                 ),
                 lineage_proof=LineageProof(
                     last_token_reserve_lineage_proof[0],
@@ -868,10 +1304,9 @@ async def respond_to_deposit_liquidity_offer(
     token_reserve_creation_spends = token_reserve_creation_spend_bundle.coin_spends
     
     # 4. spend the xch ephemeral coin
-    liquidity_cat_tail = pair_liquidity_tail_puzzle(pair_launcher_id)
-    liquidity_cat_tail_hash = liquidity_cat_tail.get_tree_hash()
+    liquidity_cat_tail_hash = pair_liquidity_tail_puzzle_hash(pair_launcher_id)
 
-    liquidity_cat_mint_coin_tail_solution = Program.to([pair_singleton_inner_puzzle.get_tree_hash(), current_pair_coin.parent_coin_info])
+    liquidity_cat_mint_coin_tail_solution = Program.to([pair_singleton_inner_puzzle_hash, current_pair_coin.parent_coin_info])
     # output everything from solution
     # this is usually not safe to use, but in this case we don't really care since we are accepting an offer
     # that is asking for liquidity tokens - it's kind of circular; if we don't get out tokens, 
@@ -881,12 +1316,12 @@ async def respond_to_deposit_liquidity_offer(
     liquidity_cat_mint_coin_puzzle = construct_cat_puzzle(
         CAT_MOD, liquidity_cat_tail_hash, liquidity_cat_mint_coin_inner_puzzle
     )
-    liquidity_cat_mint_coin_puzzle_hash = liquidity_cat_mint_coin_puzzle.get_tree_hash()
+    liquidity_cat_mint_coin_puzzle_hash = cat_puzzle_hash(liquidity_cat_tail_hash, liquidity_cat_mint_coin_inner_puzzle_hash)
 
     eph_xch_coin_settlement_things = [
         Program.to([
             current_pair_coin.name(),
-            [p2_singleton_puzzle.get_tree_hash(), pair_xch_reserve + deposited_xch_amount]
+            [p2_singleton_puzzle_hash, pair_xch_reserve + deposited_xch_amount]
         ]),
         Program.to([
             current_pair_coin.name(),
@@ -909,13 +1344,7 @@ async def respond_to_deposit_liquidity_offer(
     eph_xch_coin_spend = CoinSpend(eph_xch_coin, OFFER_MOD, eph_xch_coin_solution)
 
     # 5. Re-create the pair singleton (spend it)
-    pair_singleton_puzzle = get_pair_puzzle(
-        pair_launcher_id,
-        token_tail_hash,
-        pair_liquidity,
-        pair_xch_reserve,
-        pair_token_reserve
-    )
+    pair_singleton_puzzle = puzzle_for_singleton(pair_launcher_id, pair_singleton_inner_puzzle)
     inner_inner_sol = Program.to((
         (
             current_pair_coin.name(),
@@ -986,8 +1415,7 @@ async def respond_to_deposit_liquidity_offer(
     )
 
     # 7. Ephemeral liquidity cat
-    ephemeral_liquidity_cat_coin_puzzle = construct_cat_puzzle(CAT_MOD, liquidity_cat_tail_hash, OFFER_MOD)
-    ephemeral_liquidity_cat_coin_puzzle_hash = ephemeral_liquidity_cat_coin_puzzle.get_tree_hash()
+    ephemeral_liquidity_cat_coin_puzzle_hash = cat_puzzle_hash(liquidity_cat_tail_hash, OFFER_MOD_HASH)
 
     ephemeral_liquidity_cat = Coin(
         liquidity_cat_mint_coin.name(),
@@ -995,7 +1423,7 @@ async def respond_to_deposit_liquidity_offer(
         new_liquidity_token_amount
     )
 
-    notarized_payment = offer.get_requested_payments()[liquidity_cat_tail_hash][0]
+    notarized_payment = offer_analysis.requested_payments[liquidity_cat_tail_hash][0]
     nonce = notarized_payment.nonce
     memos = notarized_payment.memos
     ephemeral_liquidity_cat_inner_solution = Program.to([
@@ -1028,7 +1456,7 @@ async def respond_to_deposit_liquidity_offer(
     if last_xch_reserve_coin != None:
         last_xch_reserve_coin_puzzle = p2_singleton_puzzle
         last_xch_reserve_coin_solution = solution_for_p2_singleton_flashloan(
-            last_xch_reserve_coin, pair_singleton_inner_puzzle.get_tree_hash()
+            last_xch_reserve_coin, pair_singleton_inner_puzzle_hash
         )
         last_xch_reserve_spend_maybe.append(
             CoinSpend(last_xch_reserve_coin, last_xch_reserve_coin_puzzle, last_xch_reserve_coin_solution)
@@ -1060,78 +1488,45 @@ async def respond_to_remove_liquidity_offer(
     last_token_reserve_lineage_proof, # coin_parent_coin_info, inner_puzzle_hash, amount
 ):
     # 1. detect offered ephemeral coin (ephemeral liquidity coin, created the offer so we can use it)
-    offer = Offer.from_bech32(offer_str)
-    offer_spend_bundle = offer.to_spend_bundle()
-    offer_coin_spends = offer_spend_bundle.coin_spends
-
-    eph_liquidity_coin = None
-
-    eph_liquidity_coin_creation_spend = None # needed when spending eph_liquidity_coin since it's a CAT
-    announcement_asserts = [] # assert everything when the old  XCH reserve is spent
+    offer_analysis = analyze_offer(offer_str)
+    offer_spend_bundle = offer_analysis.spend_bundle
 
-    liquidity_cat_tail = pair_liquidity_tail_puzzle(pair_launcher_id)
-    liquidity_cat_tail_hash = liquidity_cat_tail.get_tree_hash()
-    eph_liquidity_coin_puzzle = construct_cat_puzzle(CAT_MOD, liquidity_cat_tail_hash, OFFER_MOD)
-    eph_liquidity_coin_puzzle_hash = eph_liquidity_coin_puzzle.get_tree_hash()
+    liquidity_cat_tail_hash = pair_liquidity_tail_puzzle_hash(pair_launcher_id)
+    eph_liquidity_coin_puzzle_hash = cat_puzzle_hash(liquidity_cat_tail_hash, OFFER_MOD_HASH)
 
-    cs_from_initial_offer = [] # all valid coin spends (i.e., not 'hints' for offered assets or coins)
-
-    for coin_spend in offer_coin_spends:
-        if coin_spend.coin.parent_coin_info == b"\x00" * 32: # 'hint' for offer requested coin
-            continue
-        
-        cs_from_initial_offer.append(coin_spend)
-        conditions_dict = conditions_dict_for_solution(
-            coin_spend.puzzle_reveal,
-            coin_spend.solution,
-            INFINITE_COST
-        )
+    # creation spend needed when spending eph_liquidity_coin since it's a CAT
+    eph_liquidity_coin, eph_liquidity_coin_creation_spend = offer_analysis.get_created_coin(eph_liquidity_coin_puzzle_hash)
 
-        # is this spend creating an ephemeral coin?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
-            puzzle_hash = cwa.vars[0]
-            amount = SExp.to(cwa.vars[1]).as_int()
-
-            if puzzle_hash == eph_liquidity_coin_puzzle_hash:
-                eph_liquidity_coin = Coin(coin_spend.coin.name(), puzzle_hash, amount)
-                eph_liquidity_coin_creation_spend = coin_spend
-
-        # is there any announcement that we'll need to assert?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN_ANNOUNCEMENT, []): #cwa = condition with args
-            announcement_asserts.append([
-                ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT,
-                std_hash(coin_spend.coin.name() + cwa.vars[0])
-            ])
+    announcement_asserts = list(offer_analysis.announcement_asserts) # assert everything when the old  XCH reserve is spent
+    cs_from_initial_offer = list(offer_analysis.coin_spends) # all valid coin spends (i.e., not 'hints' for offered assets or coins)
 
     # 2. math stuff
     burned_liquidity_amount = eph_liquidity_coin.amount
 
-    removed_token_amount = pair_token_reserve * burned_liquidity_amount // pair_liquidity
-    removed_xch_amount = pair_xch_reserve * burned_liquidity_amount // pair_liquidity
+    removed_xch_amount, removed_token_amount = get_removed_amounts(
+        burned_liquidity_amount, pair_liquidity, pair_xch_reserve, pair_token_reserve
+    )
 
     new_token_reserve_amount = last_token_reserve_coin.amount - removed_token_amount
     new_xch_reserve_amount = last_xch_reserve_coin.amount - removed_xch_amount
 
     # 3. spend ephemeral liquidity coin
-    pair_singleton_puzzle = get_pair_puzzle(
+    pair_singleton_inner_puzzle = get_pair_inner_puzzle(
         pair_launcher_id,
         token_tail_hash,
         pair_liquidity,
         pair_xch_reserve,
         pair_token_reserve
     )
-    pair_singleton_puzzle_hash = pair_singleton_puzzle.get_tree_hash()
-    pair_singleton_inner_puzzle = get_pair_inner_puzzle(
+    pair_singleton_inner_puzzle_hash = get_pair_inner_puzzle_hash(
         pair_launcher_id,
         token_tail_hash,
         pair_liquidity,
         pair_xch_reserve,
         pair_token_reserve
     )
-    pair_singleton_inner_puzzle_hash = pair_singleton_inner_puzzle.get_tree_hash()
 
     liquidity_cat_tail_puzzle = pair_liquidity_tail_puzzle(pair_launcher_id)
-    liquidity_cat_tail_hash = liquidity_cat_tail_puzzle.get_tree_hash()
     liquidity_cat_burn_coin_tail_solution = Program.to([pair_singleton_inner_puzzle_hash, current_pair_coin.parent_coin_info])
     liquidity_burn_coin_inner_puzzle = Program.to((
         1,
@@ -1143,10 +1538,9 @@ async def respond_to_remove_liquidity_offer(
         current_pair_coin.name(),
         [liquidity_burn_coin_inner_puzzle_hash, burned_liquidity_amount]
     ])
-    offer_liquidity_cat_puzzle = construct_cat_puzzle(CAT_MOD, liquidity_cat_tail_hash, OFFER_MOD)
     announcement_asserts.append([
         ConditionOpcode.ASSERT_PUZZLE_ANNOUNCEMENT,
-        std_hash(offer_liquidity_cat_puzzle.get_tree_hash() + create_burn_coin_notarized_payment.get_tree_hash())
+        std_hash(eph_liquidity_coin_puzzle_hash + create_burn_coin_notarized_payment.get_tree_hash())
     ])
 
     eph_liquidity_coin_inner_solution = Program.to([
@@ -1171,10 +1565,9 @@ async def respond_to_remove_liquidity_offer(
     eph_liquidity_coin_spend = eph_liquidity_coin_spend_bundle.coin_spends[0]
 
     # 4. spend liquidity burn coin
-    liquidity_burn_coin_puzzle = construct_cat_puzzle(CAT_MOD, liquidity_cat_tail_hash, liquidity_burn_coin_inner_puzzle)
     liquidity_burn_coin = Coin(
         eph_liquidity_coin.name(),
-        liquidity_burn_coin_puzzle.get_tree_hash(),
+        cat_puzzle_hash(liquidity_cat_tail_hash, liquidity_burn_coin_inner_puzzle_hash),
         burned_liquidity_amount
     )
 
@@ -1201,13 +1594,7 @@ async def respond_to_remove_liquidity_offer(
     liquidity_burn_coin_spend = liquidity_burn_coin_spend_bundle.coin_spends[0]
 
     # 5. re-create the pair singleton (spend it)
-    pair_singleton_puzzle = get_pair_puzzle(
-        pair_launcher_id,
-        token_tail_hash,
-        pair_liquidity,
-        pair_xch_reserve,
-        pair_token_reserve
-    )
+    pair_singleton_puzzle = puzzle_for_singleton(pair_launcher_id, pair_singleton_inner_puzzle)
     inner_inner_sol = Program.to((
         (
             current_pair_coin.name(),
@@ -1236,7 +1623,7 @@ async def respond_to_remove_liquidity_offer(
 
     # 6. spend token reserve
     p2_singleton_puzzle = pay_to_singleton_flashloan_puzzle(pair_launcher_id)
-    p2_singleton_puzzle_hash = p2_singleton_puzzle.get_tree_hash()
+    p2_singleton_puzzle_hash = pay_to_singleton_flashloan_puzzle_hash(pair_launcher_id)
 
     last_token_reserve_coin_extra_conditions = [
         [
@@ -1248,7 +1635,7 @@ async def respond_to_remove_liquidity_offer(
 
     last_token_reserve_coin_inner_solution = solution_for_p2_singleton_flashloan(
         last_token_reserve_coin,
-        pair_singleton_inner_puzzle.get_tree_hash(),
+        pair_singleton_inner_puzzle_hash,
         extra_conditions=last_token_reserve_coin_extra_conditions
     )
     last_token_reserve_coin_spend_bundle = unsigned_spend_bundle_for_spendable_cats(
@@ -1272,10 +1659,10 @@ async def respond_to_remove_liquidity_offer(
     # 7. spend ephemeral token coin to create new token reserve, resp. to offer
     eph_token_coin = Coin(
         last_token_reserve_coin.name(),
-        construct_cat_puzzle(CAT_MOD, token_tail_hash, OFFER_MOD).get_tree_hash(),
+        cat_puzzle_hash(token_tail_hash, OFFER_MOD_HASH),
         last_token_reserve_coin.amount
     )
-    notarized_payments = offer.get_requested_payments()
+    notarized_payments = offer_analysis.requested_payments
     token_notarized_payment = notarized_payments[token_tail_hash][0]
 
     eph_token_coin_notarized_payments = []
@@ -1340,7 +1727,7 @@ async def respond_to_remove_liquidity_offer(
 
     last_xch_reserve_coin_solution = solution_for_p2_singleton_flashloan(
         last_xch_reserve_coin,
-        pair_singleton_inner_puzzle.get_tree_hash(),
+        pair_singleton_inner_puzzle_hash,
         extra_conditions=last_xch_reserve_coin_extra_conditions
     )
     last_xch_reserve_coin_spend = CoinSpend(
@@ -1413,50 +1800,19 @@ async def respond_to_swap_offer(
     coin_spends = [] # all spends that will get included in the returned spend bundle
 
     # 1. detect offered ephemeral coin (XCH or token)
-    offer = Offer.from_bech32(offer_str)
-    offer_spend_bundle = offer.to_spend_bundle()
-    offer_coin_spends = offer_spend_bundle.coin_spends
-
-    eph_coin = None
-    eph_coin_is_cat = False # true if token is offered, false if XCH is offered
-    eph_coin_creation_spend = None # needed when spending eph_liquidity_coin since it's a CAT
+    offer_analysis = analyze_offer(offer_str)
+    offer_spend_bundle = offer_analysis.spend_bundle
 
-    announcement_asserts = [] # assert everything when the old  XCH reserve is spent
-    
-    eph_token_coin_puzzle = construct_cat_puzzle(CAT_MOD, token_tail_hash, OFFER_MOD)
-    eph_token_coin_puzzle_hash = eph_token_coin_puzzle.get_tree_hash()
+    eph_token_coin_puzzle_hash = cat_puzzle_hash(token_tail_hash, OFFER_MOD_HASH)
 
-    asked_for_amount = 0
-    for k, v in offer.get_requested_amounts().items():
-        asked_for_amount = v
+    # creation spend needed when spending eph_coin if it's a CAT
+    eph_coin, eph_coin_creation_spend = offer_analysis.get_created_coin(OFFER_MOD_HASH, eph_token_coin_puzzle_hash)
+    eph_coin_is_cat = eph_coin is not None and eph_coin.puzzle_hash == eph_token_coin_puzzle_hash # true if token is offered, false if XCH is offered
 
-    for coin_spend in offer_coin_spends:
-        if coin_spend.coin.parent_coin_info == b"\x00" * 32: # 'hint' for offer requested coin
-            continue
-        
-        coin_spends.append(coin_spend)
-        conditions_dict = conditions_dict_for_solution(
-            coin_spend.puzzle_reveal,
-            coin_spend.solution,
-            INFINITE_COST
-        )
+    asked_for_amount = offer_analysis.get_requested_amount()
 
-        # is this spend creating an ephemeral coin?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN, []):
-            puzzle_hash = cwa.vars[0]
-            amount = SExp.to(cwa.vars[1]).as_int()
-
-            if puzzle_hash in [OFFER_MOD_HASH, eph_token_coin_puzzle_hash]:
-                eph_coin = Coin(coin_spend.coin.name(), puzzle_hash, amount)
-                eph_coin_creation_spend = coin_spend
-                eph_coin_is_cat = puzzle_hash == eph_token_coin_puzzle_hash
-
-        # is there any announcement that we'll need to assert?
-        for cwa in conditions_dict.get(ConditionOpcode.CREATE_COIN_ANNOUNCEMENT, []): #cwa = condition with args
-            announcement_asserts.append([
-                ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT,
-                std_hash(coin_spend.coin.name() + cwa.vars[0])
-            ])
+    coin_spends += offer_analysis.coin_spends
+    announcement_asserts = list(offer_analysis.announcement_asserts) # assert everything when the old  XCH reserve is spent
 
     # 2. math stuff
     
@@ -1465,28 +1821,29 @@ async def respond_to_swap_offer(
 
     if eph_coin_is_cat: # token offered, so swap is token -> XCH
         token_amount = eph_coin.amount
-        new_xch_reserve_amount -= 993 * token_amount * pair_xch_reserve // (1000 * pair_token_reserve + 993 * token_amount)
+        new_xch_reserve_amount -= get_input_price(token_amount, pair_token_reserve, pair_xch_reserve)
         new_token_reserve_amount += token_amount
     else:
         xch_amount = eph_coin.amount - total_donation_amount
-        new_token_reserve_amount -= 993 * xch_amount * pair_token_reserve // (1000 * pair_xch_reserve + 993 * xch_amount)
+        new_token_reserve_amount -= get_input_price(xch_amount, pair_xch_reserve, pair_token_reserve)
         new_xch_reserve_amount += xch_amount
 
     # 3. spend singleton
-    pair_singleton_puzzle = get_pair_puzzle(
+    pair_singleton_inner_puzzle = get_pair_inner_puzzle(
         pair_launcher_id,
         token_tail_hash,
         pair_liquidity,
         pair_xch_reserve,
         pair_token_reserve
     )
-    pair_singleton_inner_puzzle = get_pair_inner_puzzle(
+    pair_singleton_inner_puzzle_hash = get_pair_inner_puzzle_hash(
         pair_launcher_id,
         token_tail_hash,
         pair_liquidity,
         pair_xch_reserve,
         pair_token_reserve
     )
+    pair_singleton_puzzle = puzzle_for_singleton(pair_launcher_id, pair_singleton_inner_puzzle)
 
     inner_inner_sol = Program.to((
         (
@@ -1517,7 +1874,7 @@ async def respond_to_swap_offer(
 
     # 4. spend token reserve
     p2_singleton_puzzle = pay_to_singleton_flashloan_puzzle(pair_launcher_id)
-    p2_singleton_puzzle_hash = p2_singleton_puzzle.get_tree_hash()
+    p2_singleton_puzzle_hash = pay_to_singleton_flashloan_puzzle_hash(pair_launcher_id)
 
     last_token_reserve_coin_extra_conditions = [
         [
@@ -1542,7 +1899,7 @@ async def respond_to_swap_offer(
 
     last_token_reserve_coin_inner_solution = solution_for_p2_singleton_flashloan(
         last_token_reserve_coin,
-        pair_singleton_inner_puzzle.get_tree_hash(),
+        pair_singleton_inner_puzzle_hash,
         extra_conditions=last_token_reserve_coin_extra_conditions
     )
     reserve_spendable_cats = [
@@ -1581,15 +1938,10 @@ async def respond_to_swap_offer(
     intermediary_token_reserve_coin_amount = new_token_reserve_amount if eph_coin_is_cat else pair_token_reserve
     intermediary_token_reserve_coin = Coin(
         last_token_reserve_coin.name(),
-        construct_cat_puzzle(CAT_MOD, token_tail_hash, OFFER_MOD).get_tree_hash(),
+        cat_puzzle_hash(token_tail_hash, OFFER_MOD_HASH),
         intermediary_token_reserve_coin_amount
     )
 
-    p2_singleton_puzzle = pay_to_singleton_flashloan_puzzle(pair_launcher_id)
-    p2_singleton_puzzle_hash = p2_singleton_puzzle.get_tree_hash()
-    p2_singleton_cat_puzzle = construct_cat_puzzle(CAT_MOD, token_tail_hash, p2_singleton_puzzle)
-    p2_singleton_cat_puzzle_hash = p2_singleton_cat_puzzle.get_tree_hash()
-
     intermediary_token_reserve_notarized_payments = [
         [
             current_pair_coin.name(),
@@ -1597,7 +1949,7 @@ async def respond_to_swap_offer(
         ]
     ]
     if not eph_coin_is_cat:
-        notarized_payment = offer.get_requested_payments()[token_tail_hash][0]
+        notarized_payment = offer_analysis.requested_payments[token_tail_hash][0]
         intermediary_token_reserve_notarized_payments.append(
             [
                 notarized_payment.nonce,
@@ -1701,7 +2053,7 @@ async def respond_to_swap_offer(
         
     last_xch_reserve_coin_solution = solution_for_p2_singleton_flashloan(
         last_xch_reserve_coin,
-        pair_singleton_inner_puzzle.get_tree_hash(),
+        pair_singleton_inner_puzzle_hash,
         extra_conditions=last_xch_reserve_coin_extra_conditions
     )
 
@@ -1726,7 +2078,7 @@ async def respond_to_swap_offer(
         ]
     ]
     if eph_coin_is_cat:
-        notarized_payment = offer.get_requested_payments().get(None)[0]
+        notarized_payment = offer_analysis.requested_payments.get(None)[0]
         intermediary_xch_reserve_coin_notarized_payments.append(
             [
                 notarized_payment.nonce,
@@ -1746,24 +2098,32 @@ async def respond_to_swap_offer(
         coin_spends, offer_spend_bundle.aggregated_signature
     )
 
-async def get_fee_estimate(mempool_sb, full_node_client):
-    cost_of_operation = 700000000 # upper bound (exaggerated so the tx doesn't fail)
-    # from benchmarks:
-    #   - add/remove liquidity -> ~250,000,000
-    #   - add/remove liquidity -> ~250,000,000
-    #   - xch to token -> ~150,000,000
-    #   - token to xch -> ~200,000,000
+# operation: one of fee_costs.DEFAULT_OPERATION_COSTS' keys (None = most expensive one)
+# mempool_sb_cost_and_fee: (cost, fee) of mempool_sb, if already known (e.g., reported by the node)
+# fee_estimator: fee_estimator.FeeEstimator answering from memory; the node is asked if it's missing or stale
+# target_time: seconds (0 = as soon as possible)
+async def get_fee_estimate(mempool_sb, full_node_client, operation=None, mempool_sb_cost_and_fee=None, fee_estimator=None, target_time=0):
+    cost_of_operation = OPERATION_COSTS.get(operation)
+    if mempool_sb is None and fee_estimator is not None and fee_estimator.is_fresh():
+        return fee_estimator.get_fee(cost_of_operation, target_time)
+
     if mempool_sb is None:
-        fee_per_cost_resp = await full_node_client.get_fee_estimate(target_times=[0], cost=cost_of_operation)
+        fee_per_cost_resp = await full_node_client.get_fee_estimate(target_times=[target_time], cost=cost_of_operation)
         fee = int(fee_per_cost_resp['estimates'][0]) + 1
         # logic for the thing below: if there is no fee, as is currently the case on mainnet,
         # this branch would still return 1 mojo as suggested fee
         # we don't want to teach users to ignore the minimum fee, do we?
         return fee if fee != 1 else 0
 
-    cost_of_mempool_sb = get_spend_bundle_cost(mempool_sb)
-    fee_of_mempool_sb = max(mempool_sb.fees(), 1)
+    if mempool_sb_cost_and_fee is None:
+        mempool_sb_cost_and_fee = get_spend_bundle_cost_and_fee(mempool_sb)
+    cost_of_mempool_sb, fee_of_mempool_sb = mempool_sb_cost_and_fee
+    fee_of_mempool_sb = max(fee_of_mempool_sb, 1)
     mempool_fee_per_cost: float = fee_of_mempool_sb / cost_of_mempool_sb
     
-    fee = int(max(5, mempool_fee_per_cost) * (cost_of_operation + cost_of_mempool_sb)) - fee_of_mempool_sb + MEMPOOL_MIN_FEE_INCREASE
+    min_fee_per_cost = 5
+    if fee_estimator is not None and fee_estimator.is_fresh(): # congestion
+        min_fee_per_cost = max(min_fee_per_cost, fee_estimator.get_fee_per_cost(target_time))
+
+    fee = int(max(min_fee_per_cost, mempool_fee_per_cost) * (cost_of_operation + cost_of_mempool_sb)) - fee_of_mempool_sb + MEMPOOL_MIN_FEE_INCREASE
     return fee